@@ -0,0 +1,100 @@
+import os
+import threading
+
+import pygame
+
+# 効果音とBGMの管理
+# BGM は pygame.mixer.music でファイルから少しずつ再生し、全体をメモリに展開しない
+# 効果音はバックグラウンドのスレッドで読み込み、まだ読み込まれていなければ鳴らすときに読み込む
+# 読み込めなかったファイルはその音だけを鳴らさず、ほかの音は鳴らし続ける
+
+SOUND_DIR = "sounds"
+
+# 効果音: 名前 -> (ファイル名, 音量)
+SOUND_EFFECTS = {
+    "bomb_place": ("bomb_place.mp3", 0.5),
+    "explosion": ("explosion.mp3", 0.5),
+    "item_pickup": ("item_pickup.mp3", 0.5),  # アイテム取得音
+    "game_over": ("game_over.mp3", 0.5),  # ゲームオーバー音
+    "stage_clear": ("stage_clear.mp3", 0.5),  # ステージクリア音
+}
+
+# BGM: 名前 -> (ファイル名, 音量)（BGMの音量は小さめに設定）
+BGM_TRACKS = {
+    "menu": ("menu_bgm.mp3", 0.5),  # メニュー画面のBGM
+    "game": ("game_bgm.mp3", 0.2),  # ゲームプレイ中のBGM
+}
+
+class AudioManager:
+    def __init__(self):
+        self.enabled = False
+        self.sounds = {}  # 名前 -> Sound（読み込めなかったものは None）
+        self.missing_bgm = set()  # 読み込めなかったBGM
+        self.lock = threading.Lock()
+        self.loader = None
+
+    def start(self):
+        # ミキサーを初期化し、効果音の読み込みを始める（読み込みの完了は待たない）
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            print("音声デバイスを初期化できませんでした。ゲームは音なしで続行します。")
+            return
+        self.enabled = True
+        self.loader = threading.Thread(target=self.load_all, daemon=True)
+        self.loader.start()
+
+    def load_all(self):
+        for name in SOUND_EFFECTS:
+            self.load(name)
+
+    def load(self, name):
+        # 効果音を1つ読み込む（一度失敗したものは None のまま読み込み直さない）
+        # ロックは辞書を見るときと入れるときだけ取り、ファイルの展開中は取らない（読み込み済みの音を待たせない）
+        with self.lock:
+            if name in self.sounds:
+                return self.sounds[name]
+        filename, volume = SOUND_EFFECTS[name]
+        try:
+            sound = pygame.mixer.Sound(os.path.join(SOUND_DIR, filename))
+            sound.set_volume(volume)
+        except (pygame.error, OSError):
+            sound = None
+        with self.lock:
+            # 同じ音を別のスレッドが先に読み込んでいたら、先に入ったものを使う
+            if name in self.sounds:
+                return self.sounds[name]
+            self.sounds[name] = sound
+        if sound is None:
+            print(f"{filename} を読み込めませんでした。この音は鳴らさずに続行します。")
+        return sound
+
+    def play(self, name):
+        if not self.enabled:
+            return
+        sound = self.load(name)
+        if sound is not None:
+            sound.play()
+
+    def play_bgm(self, name):
+        # BGMを切り替えてループ再生する（読み込めないBGMなら止めるだけ）
+        if not self.enabled:
+            return
+        pygame.mixer.music.stop()
+        if name in self.missing_bgm:
+            return
+        filename, volume = BGM_TRACKS[name]
+        try:
+            pygame.mixer.music.load(os.path.join(SOUND_DIR, filename))
+            pygame.mixer.music.set_volume(volume)
+            pygame.mixer.music.play(-1)  # -1は無限ループを意味する
+        except pygame.error:
+            print(f"{filename} を読み込めませんでした。このBGMは流さずに続行します。")
+            self.missing_bgm.add(name)
+
+    def play_jingle(self, name):
+        # BGMを止めてジングルを再生する
+        if not self.enabled:
+            return
+        pygame.mixer.music.stop()
+        self.play(name)
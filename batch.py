@@ -0,0 +1,400 @@
+import numpy as np
+
+from engine import (
+    GRID_WIDTH, GRID_HEIGHT, EMPTY, WALL, BLOCK, BOMB, POWER_UP, SPEED_UP, BOMB_UP, ITEMS,
+    ENEMY_SLIME, ENEMY_SMART, DIRECTIONS, RUNNING, DEAD, CLEARED, ACTION_BOMB, MOVE_ACTIONS,
+    BOMB_FUSE, EXPLOSION_DURATION, GameState,
+)
+
+# 複数のゲームをまとめて進めるバッチ環境（ボットの学習やバランス調整用）
+# N ゲーム分のマップを (N, 高さ*幅) の配列に積み、移動・爆弾の設置と爆発・ブロックの破壊・敵の移動と死亡を
+# engine.py と同じルールで全ゲームまとめて配列の演算で進める
+# マップと敵の配置だけは GameState で作るので、リセット直後の状態は同じシードの GameState と同じになる
+# 敵の移動の乱数はバッチ全体で1つの列を使うので、展開は同じシードの GameState とは一致しない
+
+# 観測のチャンネル
+OBS_TILES = 0  # マップのタイル（EMPTY / WALL / BLOCK / BOMB / アイテム）
+OBS_UNITS = 1  # プレイヤーは1、敵は2
+OBS_DANGER = 2  # 爆風が届くまでの残りティック（0は安全、255で打ち切り）
+OBS_CHANNELS = 3
+
+UNIT_PLAYER = 1
+UNIT_ENEMY = 2
+
+# 行動の番号（ACTION_* のビットフラグに変換して step() に渡す）
+BATCH_ACTIONS = np.array([0] + [flag for flag, _ in MOVE_ACTIONS] + [ACTION_BOMB], dtype=np.uint8)
+NUM_ACTIONS = len(BATCH_ACTIONS)
+
+# マップは1次元に並べるので、隣のマスへは番号の差で動く（外周は壁なので行をまたぐことはない）
+MAP_SIZE = GRID_WIDTH * GRID_HEIGHT
+ACTION_OFFSETS = np.array([0] + [dy * GRID_WIDTH + dx for _, (dx, dy) in MOVE_ACTIONS] + [0])
+DIRECTION_OFFSETS = np.array([dy * GRID_WIDTH + dx for dx, dy in DIRECTIONS])  # 敵の向きの番号 -> 差
+
+# 移動先として通れるタイル（Player.move と同じ判定）
+WALKABLE = np.zeros(256, dtype=bool)
+WALKABLE[[EMPTY, *ITEMS]] = True
+# 爆風が通り抜けるタイル（壁とブロックで止まる）
+BLAST_OPEN = np.ones(256, dtype=bool)
+BLAST_OPEN[[WALL, BLOCK]] = False
+
+# 爆風が届かないマスの値
+NEVER = np.iinfo(np.int32).max
+
+# ステージクリア時に加える報酬
+CLEAR_BONUS = 1000
+
+def shifted(values, offset, fill):
+    # 各マスに offset だけ手前のマスの値を並べた配列（範囲外は fill）
+    result = np.full_like(values, fill)
+    if offset > 0:
+        result[:, offset:] = values[:, :-offset]
+    else:
+        result[:, :offset] = values[:, -offset:]
+    return result
+
+def blast_field(tiles, fuse, bomb_range):
+    # 各マスに爆風が最初に届くティック（誘爆を含む。届かないマスは NEVER）
+    # DangerMap.rebuild と同じものを、距離ごとに爆弾の値をずらして重ねることで求める
+    live = fuse > 0
+    passable = BLAST_OPEN[tiles]
+    reachable = tiles != WALL
+    detonation = np.where(live, fuse, NEVER)
+    while True:
+        field = detonation.copy()
+        # 距離 r まで届く爆弾だけを残した値（向きによらないので先に作る）
+        sources = [np.where(bomb_range >= r, detonation, NEVER) for r in range(1, int(bomb_range.max()) + 1)]
+        for offset in DIRECTION_OFFSETS:
+            # clear: 爆弾からこのマスまでの間のマスがすべて爆風を通す
+            clear = reachable
+            for r, source in enumerate(sources, 1):
+                np.minimum(field, np.where(clear, shifted(source, r * offset, NEVER), NEVER), out=field)
+                clear = clear & shifted(passable, r * offset, False)
+        # 他の爆弾の爆風が先に届く爆弾はそのティックに誘爆する（変わらなくなるまで繰り返す）
+        chained = np.where(live, field, NEVER)
+        if np.array_equal(chained, detonation):
+            return field
+        detonation = chained
+
+class BatchEnv:
+    def __init__(self, num_envs, stage=1, seed=0):
+        n = num_envs
+        self.num_envs = num_envs
+        self.stage = stage
+        self.next_seed = seed  # ゲームごとに1ずつ増やしたシードでマップを作る
+        self.rng = np.random.default_rng(seed)  # 敵の移動に使う乱数
+        self.games = np.arange(n)
+
+        # マップと爆弾（マスごと）
+        self.tiles = np.zeros((n, MAP_SIZE), dtype=np.uint8)
+        self.fuse = np.zeros((n, MAP_SIZE), dtype=np.int32)  # 爆弾が爆発するティック（0は爆弾なし）
+        self.bomb_range = np.zeros((n, MAP_SIZE), dtype=np.int16)
+        self.blast = np.full((n, MAP_SIZE), NEVER, dtype=np.int32)  # 爆風が最初に届くティック
+        self.next_blast = np.full(n, NEVER, dtype=np.int32)  # 次に爆発が起きるティック
+        self.danger = np.zeros((n, MAP_SIZE), dtype=np.uint8)  # 爆風が届くまでの残りティック（観測用に毎ティック減らす）
+        # 爆発エフェクトが終わるまで爆弾は置いた数に含まれるので、終わるティックごとの数を環状に持つ
+        self.explosion_ends = np.zeros((n, EXPLOSION_DURATION + 1), dtype=np.int16)
+        self.ticks = np.zeros(n, dtype=np.int64)
+
+        # プレイヤー（位置はマスの番号）
+        self.position = np.zeros(n, dtype=np.int64)
+        self.next_move = np.zeros(n, dtype=np.int64)
+        self.move_delay = np.zeros(n, dtype=np.int64)
+        self.fire = np.zeros(n, dtype=np.int16)  # 爆風の長さ
+        self.max_bombs = np.zeros(n, dtype=np.int64)
+        self.speed_level = np.zeros(n, dtype=np.int64)
+        self.bombs = np.zeros(n, dtype=np.int64)  # 置いている爆弾の数
+        self.alive = np.zeros(n, dtype=bool)
+        self.scores = np.zeros(n, dtype=np.int64)
+
+        # 敵（ゲームごとに同じ数の枠を持ち、倒された敵は enemy_alive を落とす）
+        slots = stage + 2
+        self.enemy_position = np.zeros((n, slots), dtype=np.int64)
+        self.enemy_type = np.zeros((n, slots), dtype=np.int64)
+        self.enemy_direction = np.zeros((n, slots), dtype=np.int64)  # DIRECTIONS の番号
+        self.enemy_delay = np.zeros((n, slots), dtype=np.int64)
+        self.enemy_next = np.zeros((n, slots), dtype=np.int64)  # 次に動くティック
+        self.enemy_alive = np.zeros((n, slots), dtype=bool)
+
+        self.obs = np.zeros((n, OBS_CHANNELS, GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+        self.steps = np.zeros(n, dtype=np.int64)
+        # 終わったゲームの結果（step() のたびに上書き）
+        self.final_status = np.zeros(n, dtype=np.uint8)
+        self.final_score = np.zeros(n, dtype=np.int64)
+        self.final_ticks = np.zeros(n, dtype=np.int64)
+
+    def reset_env(self, i):
+        # マップと敵の配置は GameState に作らせて配列に写す
+        state = GameState(self.stage, self.next_seed)
+        self.next_seed += 1
+        width = GRID_WIDTH
+        self.tiles[i] = np.frombuffer(state.game_map.cells, dtype=np.uint8)
+        self.fuse[i] = 0
+        self.bomb_range[i] = 0
+        self.blast[i] = NEVER
+        self.next_blast[i] = NEVER
+        self.danger[i] = 0
+        self.explosion_ends[i] = 0
+        self.ticks[i] = 0
+
+        player = state.player
+        self.position[i] = player.grid_y * width + player.grid_x
+        self.next_move[i] = player.next_move_tick
+        self.move_delay[i] = player.move_delay
+        self.fire[i] = player.bomb_range
+        self.max_bombs[i] = player.max_bombs
+        self.speed_level[i] = player.speed_level
+        self.bombs[i] = 0
+        self.alive[i] = True
+        self.scores[i] = 0
+
+        self.enemy_alive[i] = False
+        for j, enemy in enumerate(state.enemies):
+            self.enemy_position[i, j] = enemy.grid_y * width + enemy.grid_x
+            self.enemy_type[i, j] = enemy.enemy_type
+            self.enemy_direction[i, j] = DIRECTIONS.index(enemy.direction)
+            self.enemy_delay[i, j] = enemy.move_delay
+            self.enemy_next[i, j] = 1  # GameState も最初のティックに全員の移動を予定する
+            self.enemy_alive[i, j] = True
+        self.steps[i] = 0
+
+    def reset(self):
+        for i in range(self.num_envs):
+            self.reset_env(i)
+        return self.observe()
+
+    def step(self, actions):
+        # actions は行動番号（0〜NUM_ACTIONS-1）の配列
+        # 終わったゲームは自動でリセットし、観測はリセット後のものを返す
+        # 1ティックの処理の順番は GameState.step() と同じ
+        actions = np.asarray(actions, dtype=np.intp)
+        games = self.games
+        self.ticks += 1
+        ticks = self.ticks
+        old_scores = self.scores.copy()
+        danger = self.danger
+        np.subtract(danger, 1, out=danger, where=danger > 0)
+
+        # 爆弾の設置（Player.place_bomb と同じ条件）
+        place = ((BATCH_ACTIONS[actions] & ACTION_BOMB) != 0) & self.alive & (self.bombs < self.max_bombs)
+        place &= self.tiles[games, self.position] != BOMB
+        if place.any():
+            g = np.flatnonzero(place)
+            cells = self.position[g]
+            self.tiles[g, cells] = BOMB
+            self.fuse[g, cells] = ticks[g] + BOMB_FUSE - 1
+            self.bomb_range[g, cells] = self.fire[g]
+            self.bombs[g] += 1
+            self.update_blast(g)
+
+        # プレイヤーの移動（Player.move と同じ条件。アイテムを取ってから次に動けるティックを決める）
+        offsets = ACTION_OFFSETS[actions]
+        move = (offsets != 0) & self.alive & (ticks >= self.next_move)
+        if move.any():
+            g = np.flatnonzero(move)
+            target = self.position[g] + offsets[g]
+            tile = self.tiles[g, target]
+            ok = WALKABLE[tile]
+            g, target, tile = g[ok], target[ok], tile[ok]
+            self.position[g] = target
+            self.fire[g] += tile == POWER_UP
+            self.speed_level[g] += tile == SPEED_UP
+            self.max_bombs[g] += tile == BOMB_UP
+            item = tile != EMPTY
+            self.scores[g[item]] += 100
+            self.tiles[g[item], target[item]] = EMPTY
+            self.next_move[g] = ticks[g] + np.maximum(5, self.move_delay[g] - (self.speed_level[g] - 1) * 2)
+
+        # 敵の移動
+        due = self.enemy_alive & (self.enemy_next == ticks[:, None])
+        if due.any():
+            self.move_enemies(*np.nonzero(due))
+
+        # 爆発エフェクトが終わった爆弾を置いた数から外す
+        slot = ticks % (EXPLOSION_DURATION + 1)
+        self.bombs -= self.explosion_ends[games, slot]
+        self.explosion_ends[games, slot] = 0
+
+        # 爆発（誘爆を含めて爆風の届くティックは分かっているので、今のティックのマスをまとめて処理する）
+        exploding = np.flatnonzero(self.next_blast == ticks)
+        if exploding.size:
+            self.explode(exploding)
+
+        # 敵との衝突判定
+        self.alive &= ~(self.enemy_alive & (self.enemy_position == self.position[:, None])).any(axis=1)
+
+        statuses = np.where(~self.alive, DEAD, np.where(self.enemy_alive.any(axis=1), RUNNING, CLEARED))
+        self.steps += 1
+        rewards = (self.scores - old_scores) + np.where(statuses == CLEARED, CLEAR_BONUS, 0)
+        dones = statuses != RUNNING
+
+        self.final_status[dones] = statuses[dones]
+        self.final_score[dones] = self.scores[dones]
+        self.final_ticks[dones] = self.steps[dones]
+        for i in np.flatnonzero(dones):
+            self.reset_env(i)
+        return self.observe(), rewards, dones
+
+    def update_blast(self, g):
+        # 爆弾やブロックが変わったゲームだけ、爆風が届くティックを計算し直す
+        fuse = self.fuse[g]
+        if fuse.any():
+            field = blast_field(self.tiles[g], fuse, self.bomb_range[g])
+        else:
+            field = np.full(fuse.shape, NEVER, dtype=np.int32)
+        self.blast[g] = field
+        self.next_blast[g] = field.min(axis=1)
+        left = np.minimum(field - self.ticks[g, None].astype(np.int32), 255)
+        left[field == NEVER] = 0
+        self.danger[g] = left
+
+    def explode(self, g):
+        # resolve_explosions と同じく、爆風のマスのブロックを壊し、それ以外のマスにいるプレイヤーと敵を倒す
+        rows = np.arange(len(g))
+        ticks = self.ticks[g]
+        tiles = self.tiles[g]
+        fuse = self.fuse[g]
+        covered = self.blast[g] == ticks[:, None]
+        exploded = covered & (fuse > 0)
+        blocks = covered & (tiles == BLOCK)
+        fire = covered & ~blocks
+
+        self.scores[g] += 50 * blocks.sum(axis=1)
+        self.alive[g] &= ~fire[rows, self.position[g]]
+        enemy_alive = self.enemy_alive[g]
+        killed = enemy_alive & fire[rows[:, None], self.enemy_position[g]]
+        self.enemy_alive[g] = enemy_alive & ~killed
+        self.scores[g] += 200 * killed.sum(axis=1)
+
+        tiles[blocks | exploded] = EMPTY
+        fuse[exploded] = 0
+        self.tiles[g] = tiles
+        self.fuse[g] = fuse
+        self.explosion_ends[g, (ticks + EXPLOSION_DURATION) % (EXPLOSION_DURATION + 1)] += exploded.sum(axis=1)
+        self.update_blast(g)
+
+    def move_enemies(self, g, j):
+        # このティックに動く敵（g: ゲーム, j: 敵の枠）をまとめて動かす
+        # 敵どうしは重なれるので、同じゲームの敵を同時に動かしても順番に動かすのと同じになる
+        rng = self.rng
+        tiles = self.tiles
+        position = self.enemy_position[g, j]
+        direction = self.enemy_direction[g, j]
+        enemy_type = self.enemy_type[g, j]
+        roll = rng.random(len(g))
+        target = np.full(len(g), -1)  # 移動先（EMPTY のときだけ動く）。-1は動かない
+        forced = np.full(len(g), -1)  # 空きマスかどうかによらず動く先（スマートの退避）
+
+        # スライム: 20%で向きを変え、向いている方へ進む（ぶつかったら向きを変える）
+        slime = enemy_type == ENEMY_SLIME
+        turn = slime & (roll < 0.2)
+        direction[turn] = rng.integers(4, size=int(turn.sum()))
+        target[slime] = position[slime] + DIRECTION_OFFSETS[direction[slime]]
+        blocked = slime & (tiles[g, np.maximum(target, 0)] != EMPTY)
+        direction[blocked] = rng.integers(4, size=int(blocked.sum()))
+
+        # スマート: 爆風が届くマスにいたら、届かない（なければ届くのが遅い）空きマスへ逃げる
+        chase = ~slime
+        smart = np.flatnonzero((enemy_type == ENEMY_SMART) & (self.next_blast[g] < NEVER)
+                               & (self.blast[g, position] < NEVER))
+        if smart.size:
+            sg = g[smart]
+            here = self.blast[sg, position[smart]]
+            neighbors = position[smart, None] + DIRECTION_OFFSETS
+            arrival = self.blast[sg[:, None], neighbors]
+            empty = tiles[sg[:, None], neighbors] == EMPTY
+            safe = empty & (arrival == NEVER)
+            later = empty & (arrival > here[:, None])
+            candidates = np.where(safe.any(axis=1)[:, None], safe, later)
+            escape = candidates.any(axis=1)
+            choice = self.pick(candidates[escape])
+            forced[smart[escape]] = neighbors[escape, choice]
+            chase[smart[escape]] = False
+
+        # チェイサー（と逃げなかったスマート）: 70%でプレイヤーに近づき、それ以外はランダムな方向へ
+        follow = chase & (roll < 0.7)
+        wander = np.flatnonzero(chase & ~follow)
+        target[wander] = position[wander] + DIRECTION_OFFSETS[rng.integers(4, size=wander.size)]
+        follow = np.flatnonzero(follow)
+        if follow.size:
+            target[follow] = self.chase_targets(g[follow], position[follow])
+
+        move = target >= 0
+        move[move] = tiles[g[move], target[move]] == EMPTY
+        position[move] = target[move]
+        position[forced >= 0] = forced[forced >= 0]
+        self.enemy_position[g, j] = position
+        self.enemy_direction[g, j] = direction
+        self.enemy_next[g, j] = self.ticks[g] + self.enemy_delay[g, j] + 1
+
+    def chase_targets(self, g, position):
+        # 最短経路で1歩近づくマス（経路がなければ水平か垂直にプレイヤーの方へ。動けなければ -1）
+        games, index = np.unique(g, return_inverse=True)
+        dist = self.distances(games, index, position)
+        rows = index[:, None]
+        here = dist[index, position]
+        neighbors = position[:, None] + DIRECTION_OFFSETS
+        steps = (dist[rows, neighbors] == (here - 1)[:, None]) & (here > 0)[:, None]
+        has_step = steps.any(axis=1)
+        target = np.full(len(g), -1)
+        target[has_step] = neighbors[has_step, self.pick(steps[has_step])]
+
+        # DistanceField が届かないときの動き（Enemy.move_chaser と同じ）
+        lost = np.flatnonzero(~has_step)
+        if lost.size:
+            width = GRID_WIDTH
+            player = self.position[g[lost]]
+            dx = np.sign(player % width - position[lost] % width)
+            dy = np.sign(player // width - position[lost] // width)
+            horizontal = (self.rng.random(lost.size) < 0.5) & (dx != 0)
+            target[lost] = np.where(horizontal, position[lost] + dx,
+                                    np.where(dy != 0, position[lost] + dy * width, -1))
+        return target
+
+    def distances(self, games, index, position):
+        # games のプレイヤーのマスから空きマスだけをたどった歩数（届かないマスは NEVER）
+        # 幅優先探索を全ゲーム同時に1歩ずつ広げ、動く敵のマスに全部届いたら打ち切る
+        passable = self.tiles[games] == EMPTY
+        rows = np.arange(len(games))
+        dist = np.full(passable.shape, NEVER, dtype=np.int32)
+        start = self.position[games]
+        dist[rows, start] = 0
+        frontier = np.zeros(passable.shape, dtype=bool)
+        frontier[rows, start] = True
+        d = 0
+        while (dist[index, position] == NEVER).any():
+            spread = np.zeros_like(frontier)
+            for offset in DIRECTION_OFFSETS:
+                spread |= shifted(frontier, offset, False)
+            frontier = spread & passable & (dist == NEVER)
+            if not frontier.any():
+                break
+            d += 1
+            dist[frontier] = d
+        return dist
+
+    def pick(self, candidates):
+        # 各行の True の中から1つを等確率で選んだ列の番号
+        keys = self.rng.random(candidates.shape) * candidates
+        return keys.argmax(axis=1)
+
+    def observe(self):
+        # 観測は (N, OBS_CHANNELS, GRID_HEIGHT, GRID_WIDTH) の uint8 配列
+        # 毎回同じ配列を書き換えるので、取っておく場合はコピーすること
+        obs = self.obs.reshape(self.num_envs, OBS_CHANNELS, MAP_SIZE)
+        obs[:, OBS_TILES] = self.tiles
+        units = obs[:, OBS_UNITS]
+        units[:] = 0
+        units[self.games, self.position] = UNIT_PLAYER
+        g, j = np.nonzero(self.enemy_alive)
+        units[g, self.enemy_position[g, j]] = UNIT_ENEMY
+        obs[:, OBS_DANGER] = self.danger
+        return self.obs
+
+    def action_mask(self):
+        # 各ゲームで意味のある行動（動けるマスへの移動と、置ける爆弾）を (N, NUM_ACTIONS) の真偽値で返す
+        games = self.games
+        mask = np.ones((self.num_envs, NUM_ACTIONS), dtype=bool)
+        neighbors = self.position[:, None] + ACTION_OFFSETS[1:NUM_ACTIONS - 1]
+        mask[:, 1:NUM_ACTIONS - 1] = WALKABLE[self.tiles[games[:, None], neighbors]]
+        mask[:, NUM_ACTIONS - 1] = (self.bombs < self.max_bombs) & (self.tiles[games, self.position] != BOMB)
+        return mask
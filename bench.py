@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+
+# pygame の起動メッセージが標準出力の JSON に混ざらないように、読み込む前に止めておく
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+import pygame
+
+import main as game
+from engine import (
+    EMPTY, BOMB, ENEMY_SLIME, ENEMY_CHASER, ENEMY_SMART, TIMER_BOMB_FUSE, Bomb, GameState,
+    resolve_explosions,
+)
+
+# 決まったシナリオでマップ描画・エンティティ描画・爆発処理・敵AI・1フレーム全体の時間を測るベンチマーク
+# 結果は JSON で出力するので、コミット間で比べられる
+# 例: python bench.py --output bench.json        （ダミーのビデオドライバーで描画なし）
+#     python bench.py --render                    （実際のウィンドウに描画）
+
+SCENARIOS = ("stage1", "dense", "explosions", "crowd", "arena")
+
+# 高いステージほどブロックが増えるので、ブロックで埋まる高さのステージを使う
+DENSE_STAGE = 8
+
+# 群衆シナリオの敵の数
+CROWD_SIZE = 200
+
+# 広いマップのシナリオの大きさ（画面に映る範囲だけを描くので、描画の時間は stage1 と変わらないはず）
+ARENA_SIZE = (200, 200)
+
+# 爆発シナリオで爆弾を置く間隔（空きマスの何個おきか）と火力
+EXPLOSION_SPACING = 2
+EXPLOSION_RANGE = 4
+
+def build_scenario(name, seed):
+    # シナリオの初期状態を作る（同じシードなら毎回同じ状態）
+    if name == "stage1":
+        return GameState(1, seed)
+    if name == "dense":
+        return GameState(DENSE_STAGE, seed)
+    if name == "arena":
+        return GameState(1, seed, None, *ARENA_SIZE)
+    if name == "crowd":
+        types = (ENEMY_SLIME, ENEMY_CHASER, ENEMY_SMART)
+        return GameState(3, seed, [types[i % len(types)] for i in range(CROWD_SIZE)])
+    if name == "explosions":
+        # 空きマスに爆弾を敷き詰め、次のティックで一斉に爆発させる
+        state = GameState(1, seed)
+        player = state.player
+        for x, y in state.game_map.find_all(EMPTY)[::EXPLOSION_SPACING]:
+            bomb = Bomb(x, y, EXPLOSION_RANGE, 0)
+            bomb.owner = player
+            bomb.detonate_tick = state.tick + 1
+            player.bombs.append(bomb)
+            state.game_map[y][x] = BOMB
+            state.danger.bombs[bomb] = bomb.detonate_tick
+            state.timers.schedule(bomb.detonate_tick, TIMER_BOMB_FUSE, bomb)
+        player.max_bombs = len(player.bombs)
+        state.danger.rebuild()
+        return state
+    raise ValueError(f"不明なシナリオ: {name}")
+
+def measure(func, runs, setup=None):
+    # func を runs 回実行した時間の統計（ミリ秒）。setup の時間は含めない
+    samples = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": runs,
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max_ms": samples[-1],
+    }
+
+def bench_scenario(name, seed, runs):
+    state = build_scenario(name, seed)
+    # 数は測る前の状態で数える（爆発シナリオでは1ティック進めると敵も爆弾も残らない）
+    counts = {"enemies": len(state.enemies), "bombs": len(state.player.bombs)}
+    start = state.snapshot()
+    map_layer = game.MapLayer(state)
+    surface = pygame.Surface(map_layer.surface.get_size())
+
+    def reset():
+        state.restore(start)
+
+    camera = map_layer.camera
+
+    def draw_entities():
+        for bomb in state.player.bombs:
+            game.draw_bomb(bomb, state.tick, camera)
+        for enemy in state.occupancy.in_rect(camera.x, camera.y, camera.width, camera.height):
+            game.draw_enemy(enemy, camera)
+        game.draw_player(state.player, camera)
+
+    def explode():
+        detonating = [bomb for bomb in state.player.bombs if not bomb.exploded]
+        resolve_explosions(detonating, state.player.bombs, state.game_map, state.players,
+                           state.enemies, state.occupancy, state.tick + 1)
+
+    def enemy_ai():
+        player = state.player
+        state.field.update(player.grid_x, player.grid_y, state.map_version)
+        for enemy in state.enemies:
+            state.move_enemy(enemy)
+
+    def full_frame():
+        state.step()
+        game.draw_game(state, map_layer)
+        game.renderer.present()
+
+    # 描画だけのものは状態を変えないので、描いたスプライトの記録を捨てるだけでよい
+    results = {
+        "draw_map": measure(lambda: game.draw_map(state.game_map, surface, camera), runs),
+        "draw_entities": measure(draw_entities, runs, game.renderer.invalidate),
+        "resolve_explosions": measure(explode, runs, reset),
+        "enemy_ai": measure(enemy_ai, runs, reset),
+    }
+    # 1フレーム全体は画面全体の描き直しが済んだ状態（変化した部分だけを送る通常の状態）から測る
+    game.renderer.invalidate()
+    game.draw_game(state, map_layer)
+    game.renderer.present()
+    results["full_frame"] = measure(full_frame, runs, reset)
+    # 爆発直後のエフェクト（閃光と半透明の爆風）を描く時間も測る
+    state.restore(start)
+    state.step()
+    results["draw_entities_exploded"] = measure(draw_entities, runs, game.renderer.invalidate)
+    results["counts"] = counts
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="ボンバーマンのベンチマーク")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="測るシナリオ（複数指定可、省略時はすべて）")
+    parser.add_argument("--render", action="store_true", help="ダミーではなく実際のウィンドウに描画する")
+    parser.add_argument("--output", help="結果の JSON を書き出すファイル（省略時は標準出力）")
+    args = parser.parse_args()
+
+    if not args.render:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    game.init()
+
+    report = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "video_driver": pygame.display.get_driver(),
+        "runs": args.runs,
+        "seed": args.seed,
+        "scenarios": {name: bench_scenario(name, args.seed, args.runs) for name in args.scenario or SCENARIOS},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1097 @@
+import random
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+from itertools import count
+from operator import attrgetter
+
+# ヘッドレスで動くゲームロジック（pygameに依存しない）
+# main.py はこのモジュールの GameState を描画するだけの薄いレイヤー
+
+# 標準のマップサイズ（マス数）。GameState に大きさを渡せばもっと広いマップも作れる
+GRID_WIDTH = 20
+GRID_HEIGHT = 15
+
+# 広いマップでチェイサーが最短経路をたどる範囲（プレイヤーからの歩数）
+# 探索がマップ全体に広がらないようにする。標準の大きさのマップでは制限しない
+FIELD_RADIUS = 32
+
+# ゲームオブジェクトの種類
+EMPTY = 0
+WALL = 1
+BLOCK = 2
+BOMB = 3
+POWER_UP = 4
+SPEED_UP = 5
+BOMB_UP = 6
+ITEMS = (POWER_UP, SPEED_UP, BOMB_UP)
+
+# 敵の種類を定義
+ENEMY_SLIME = 0
+ENEMY_CHASER = 1
+ENEMY_SMART = 2
+
+# 敵の移動間隔（ティック数）
+ENEMY_MOVE_DELAYS = {
+    ENEMY_SLIME: 60,  # ゆっくり移動（40から60に変更）
+    ENEMY_CHASER: 45,  # 中程度の速さ（25から45に変更）
+    ENEMY_SMART: 35,  # やや速い（20から35に変更）
+}
+
+# ブロックの配置密度（ステージが上がるごとにブロックが増える）
+BLOCK_DENSITY_BASE = 0.2
+BLOCK_DENSITY_STEP = 0.1
+
+# 移動方向
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+# プレイヤーの行動（ビットフラグ）
+ACTION_NONE = 0
+ACTION_UP = 1
+ACTION_DOWN = 2
+ACTION_LEFT = 4
+ACTION_RIGHT = 8
+ACTION_BOMB = 16
+# 移動は上・下・左・右の優先順で1つだけ適用する
+MOVE_ACTIONS = [
+    (ACTION_UP, (0, -1)),
+    (ACTION_DOWN, (0, 1)),
+    (ACTION_LEFT, (-1, 0)),
+    (ACTION_RIGHT, (1, 0)),
+]
+
+# 1秒あたりのティック数（タイマーやクールダウンはすべてティック単位）
+TICK_RATE = 60
+
+# 爆弾が爆発するまでのティック数（設置したティックも1ティックとして数える）
+BOMB_FUSE = 3 * TICK_RATE  # 3秒
+
+# 爆発エフェクトの持続時間（ティック数）
+EXPLOSION_DURATION = 60
+
+# ゲームの進行状態
+RUNNING = 0
+DEAD = 1
+CLEARED = 2
+
+# 1ティック中に発生したイベント（描画側で効果音などに使う）
+EVENT_BOMB_PLACE = "bomb_place"
+EVENT_EXPLOSION = "explosion"
+EVENT_ITEM_PICKUP = "item_pickup"
+EVENT_GAME_OVER = "game_over"
+EVENT_STAGE_CLEAR = "stage_clear"
+
+# リプレイファイルの形式（ヘッダーのあとに1ティック1バイトの操作列を zlib で圧縮して続ける）
+REPLAY_MAGIC = b"BMRP"
+# 複数人のときは1ティックにプレイヤーの人数分のバイトが並ぶ
+REPLAY_VERSION = 4  # マップの生成方法や形式を変えたら上げる（古いリプレイは再現できない）
+REPLAY_HEADER = struct.Struct("<4sBHQHHB")  # マジック, バージョン, ステージ, シード, マップの幅, 高さ, 人数
+
+# シードはリプレイとスナップショットに符号なし64ビットで入れるので、0 以上これ未満にする
+SEED_LIMIT = 2 ** 64
+
+# タイマーホイールに入れる予定の種類
+TIMER_ENEMY_MOVE = "enemy_move"
+TIMER_BOMB_FUSE = "bomb_fuse"
+TIMER_EXPLOSION_END = "explosion_end"
+TIMER_KINDS = (TIMER_ENEMY_MOVE, TIMER_BOMB_FUSE, TIMER_EXPLOSION_END)
+
+# スナップショットの形式（ヘッダー・件数・プレイヤーのあとに、マップのバイト列と敵・爆弾・予定の表を続ける）
+SNAPSHOT_HEADER = struct.Struct("<HQIBI")  # ステージ, シード, ティック, 進行状態, マップの版
+SNAPSHOT_COUNTS = struct.Struct("<BIHII")  # プレイヤー, マップ, 敵, 予定, 操作記録の長さ
+SNAPSHOT_PLAYER = struct.Struct("<HHIBBBBBIH")  # 位置, 次に動けるティック, 移動間隔, 火力, 爆弾数, 速さ, 生存, スコア, 置いている爆弾の数
+SNAPSHOT_ENEMY = struct.Struct("<HHBbb")  # 位置, 種類, 向き
+SNAPSHOT_BOMB = struct.Struct("<HHBIiH")  # 位置, 火力, 爆発するティック, 爆発したティック（未爆発は-1）, 爆風のマス数
+SNAPSHOT_CELL = struct.Struct("<HH")
+SNAPSHOT_TIMER = struct.Struct("<IBH")  # ティック, 予定の種類, 対象の番号
+SNAPSHOT_RNG = struct.Struct("<625I")  # Mersenne Twister の内部状態
+
+# 同じマップで遊べる最大の人数（2人目は右下の角から始まる）
+MAX_PLAYERS = 2
+
+def make_rng(seed, name):
+    # シードとサブシステム名から独立した乱数列を作る（同じシードなら毎回同じ列になる）
+    return random.Random(f"{seed}:{name}")
+
+class Grid(list):
+    # マップを1次元の bytearray に格納したもの
+    # 要素は各行の memoryview なので、従来どおり game_map[y][x] でも読み書きできる
+    def __init__(self, width, height, cells=None):
+        self.width = width
+        self.height = height
+        self.cells = bytearray(cells) if cells is not None else bytearray(width * height)
+        view = memoryview(self.cells)
+        super().__init__(view[y * width:(y + 1) * width] for y in range(height))
+
+    def __reduce__(self):
+        # memoryview は pickle できないので中身のバイト列から作り直す
+        return (Grid, (self.width, self.height, bytes(self.cells)))
+
+    # list の copy() / index() とは意味が違うので、別の名前にしている
+    def clone(self):
+        return Grid(self.width, self.height, self.cells)
+
+    def offset(self, x, y):
+        # (x, y) のマスの cells 上の位置
+        return y * self.width + x
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def tile(self, x, y, outside=WALL):
+        # 範囲外は壁として扱う
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.cells[y * self.width + x]
+        return outside
+
+    def neighbors(self, x, y):
+        # 上下左右の隣接マス（範囲内のみ）
+        return [(x + dx, y + dy) for dx, dy in DIRECTIONS
+                if 0 <= x + dx < self.width and 0 <= y + dy < self.height]
+
+    def passable_mask(self, passable=(EMPTY,)):
+        # 通行可能なマスを1、それ以外を0にしたバイト列（translate で一括変換）
+        table = bytes(1 if value in passable else 0 for value in range(256))
+        return self.cells.translate(table)
+
+    def flood_fill(self, x, y, passable=(EMPTY,)):
+        # (x, y) から通行可能なマスだけをたどって届くマスを1にしたバイト列
+        width = self.width
+        size = width * self.height
+        mask = self.passable_mask(passable)
+        reached = bytearray(size)
+        start = self.offset(x, y)
+        reached[start] = 1
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            column = i % width
+            for n in (i - width, i + width,
+                      i - 1 if column > 0 else -1,
+                      i + 1 if column < width - 1 else -1):
+                if 0 <= n < size and mask[n] and not reached[n]:
+                    reached[n] = 1
+                    queue.append(n)
+        return reached
+
+    def find_all(self, value):
+        # 指定した種類のマスをすべて (x, y) で返す（左上から順）
+        cells = self.cells
+        needle = bytes([value])
+        result = []
+        i = cells.find(needle)
+        while i != -1:
+            result.append((i % self.width, i // self.width))
+            i = cells.find(needle, i + 1)
+        return result
+
+class TimerWheel:
+    # ティック単位のタイマーホイール
+    # 予定は「ティック番号 % スロット数」の枠に入れ、そのティックの枠だけを取り出すので
+    # 1ティックの処理量は期限が来た予定の数だけで決まる（スロット数より先の予定は周回待ち）
+    def __init__(self, size=256):
+        self.slots = [[] for _ in range(size)]
+
+    def schedule(self, tick, kind, target):
+        self.slots[tick % len(self.slots)].append((tick, kind, target))
+
+    def pop_due(self, now):
+        # now に期限が来た予定を登録順に返す
+        slot = self.slots[now % len(self.slots)]
+        if not slot:
+            return []
+        due = [entry for entry in slot if entry[0] <= now]
+        slot[:] = [entry for entry in slot if entry[0] > now]
+        return due
+
+class Bomb:
+    def __init__(self, x, y, explosion_range=2, placed_tick=0):
+        self.x = x
+        self.y = y
+        # 毎ティック減らすタイマーの代わりに、爆発するティックを持つ
+        self.detonate_tick = placed_tick + BOMB_FUSE - 1
+        self.explosion_range = explosion_range
+        self.exploded = False
+        self.exploded_tick = None
+        self.explosions = []
+        self.explosion_duration = EXPLOSION_DURATION
+        self.owner = None  # 置いたプレイヤー（壊したブロックや倒した敵の点数が入る）
+
+    def time_left(self, now):
+        # 爆発までの残りティック数
+        return self.detonate_tick - now
+
+    def explosion_frame(self, now):
+        # 爆発してからのティック数（爆発アニメーション用）
+        return now - self.exploded_tick
+
+# 敵を作った順番の通し番号（enemies の並び順と同じ順になる）
+enemy_serial = count()
+enemy_order = attrgetter("order")
+
+class Enemy:
+    def __init__(self, x, y, enemy_type=ENEMY_SLIME, rng=random):
+        self.grid_x = x
+        self.grid_y = y
+        self.enemy_type = enemy_type
+        self.rng = rng  # 移動に使う乱数列
+        self.order = next(enemy_serial)  # 作られた順番
+
+        # 敵の種類に応じたパラメータ設定
+        self.move_delay = ENEMY_MOVE_DELAYS[enemy_type]
+
+        self.direction = self.rng.choice(DIRECTIONS)
+        self.occupancy = None  # 登録されているマス索引
+
+    def set_position(self, x, y):
+        # 位置を変更（マス索引に登録されていれば索引も更新）
+        if self.occupancy is not None:
+            self.occupancy.move(self, x, y)
+        else:
+            self.grid_x = x
+            self.grid_y = y
+
+    def move_slime(self, game_map):
+        # ランダムに方向を変更する可能性
+        if self.rng.random() < 0.2:  # 20%の確率で方向転換
+            self.direction = self.rng.choice(DIRECTIONS)
+
+        dx, dy = self.direction
+        if not self.try_move(dx, dy, game_map):
+            # 壁にぶつかったら方向転換
+            self.direction = self.rng.choice(DIRECTIONS)
+
+    def move_chaser(self, game_map, player, field=None):
+        if player is None:
+            self.move_slime(game_map)
+            return
+
+        # プレイヤーの方向を計算
+        dx = 1 if player.grid_x > self.grid_x else -1 if player.grid_x < self.grid_x else 0
+        dy = 1 if player.grid_y > self.grid_y else -1 if player.grid_y < self.grid_y else 0
+
+        # 70%の確率でプレイヤーの方向に移動
+        if self.rng.random() < 0.7:
+            # 距離マップがあれば最短経路に沿って1マス進む
+            steps = field.next_steps(self.grid_x, self.grid_y) if field is not None else None
+            if steps:
+                dx, dy = self.rng.choice(steps)
+                self.try_move(dx, dy, game_map)
+            # 経路がない場合は水平か垂直のどちらかをランダムに選択
+            elif self.rng.choice([True, False]) and dx != 0:
+                self.try_move(dx, 0, game_map)
+            elif dy != 0:
+                self.try_move(0, dy, game_map)
+        else:
+            # ランダムな方向に移動
+            direction = self.rng.choice(DIRECTIONS)
+            self.try_move(direction[0], direction[1], game_map)
+
+    def move_smart(self, game_map, player, danger, field=None):
+        # プレイヤーがいない場合や爆弾がない場合は通常の追跡
+        if player is None or danger is None or not danger.bombs:
+            self.move_chaser(game_map, player, field)
+            return
+
+        # 爆弾の爆発範囲内にいるかチェック（危険マップを引くだけ）
+        if danger.is_dangerous(self.grid_x, self.grid_y):
+            # 安全な方向に逃げる
+            safe_directions = []
+            later_directions = []
+            current = danger.detonation_tick(self.grid_x, self.grid_y)
+            for dx, dy in DIRECTIONS:
+                new_x = self.grid_x + dx
+                new_y = self.grid_y + dy
+
+                # 新しい位置が有効かチェック
+                if game_map.tile(new_x, new_y) == EMPTY:
+                    # 新しい位置が爆発範囲内かチェック
+                    if not danger.is_dangerous(new_x, new_y):
+                        safe_directions.append((dx, dy))
+                    elif danger.detonation_tick(new_x, new_y) > current:
+                        # 今いるマスより爆発が遅いマス
+                        later_directions.append((dx, dy))
+
+            # 安全な方向があれば、ランダムに選択して移動
+            # なければ少しでも爆発が遅いマスへ移動
+            candidates = safe_directions or later_directions
+            if candidates:
+                dx, dy = self.rng.choice(candidates)
+                self.set_position(self.grid_x + dx, self.grid_y + dy)
+                return
+
+        # 危険がなければプレイヤーを追跡
+        self.move_chaser(game_map, player, field)
+
+    def try_move(self, dx, dy, game_map):
+        new_grid_x = self.grid_x + dx
+        new_grid_y = self.grid_y + dy
+
+        if game_map.tile(new_grid_x, new_grid_y) == EMPTY:
+            self.set_position(new_grid_x, new_grid_y)
+            return True
+        return False
+
+class Occupancy:
+    # マスごとにそこにいる敵を引ける索引
+    # 爆発や衝突の判定を敵の数によらず1マスあたり O(1) で行う
+    def __init__(self, entities=()):
+        self.cells = {}  # (x, y) -> そのマスにいるエンティティのリスト
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity):
+        self.cells.setdefault((entity.grid_x, entity.grid_y), []).append(entity)
+        entity.occupancy = self
+
+    def remove(self, entity):
+        key = (entity.grid_x, entity.grid_y)
+        bucket = self.cells[key]
+        bucket.remove(entity)
+        if not bucket:
+            del self.cells[key]
+        entity.occupancy = None
+
+    def move(self, entity, x, y):
+        key = (entity.grid_x, entity.grid_y)
+        bucket = self.cells[key]
+        bucket.remove(entity)
+        if not bucket:
+            del self.cells[key]
+        entity.grid_x = x
+        entity.grid_y = y
+        self.cells.setdefault((x, y), []).append(entity)
+
+    def at(self, x, y):
+        return self.cells.get((x, y), ())
+
+    def in_rect(self, x, y, width, height):
+        # 矩形（画面に映る範囲など）の中にいるエンティティ
+        # 敵の数と矩形の広さのうち少ない方だけを調べる
+        if len(self.cells) <= width * height:
+            for (cx, cy), bucket in self.cells.items():
+                if x <= cx < x + width and y <= cy < y + height:
+                    yield from bucket
+        else:
+            for cy in range(y, y + height):
+                for cx in range(x, x + width):
+                    yield from self.cells.get((cx, cy), ())
+
+class Player:
+    def __init__(self, x, y):
+        self.grid_x = x
+        self.grid_y = y
+        self.bombs = []
+        self.next_move_tick = 0  # このティック以降に移動できる
+        self.move_delay = 10
+        self.bomb_range = 2
+        self.max_bombs = 1
+        self.speed_level = 1
+        self.alive = True
+        self.score = 0
+
+    def can_move(self, now):
+        return self.alive and now >= self.next_move_tick
+
+    def move(self, dx, dy, game_map, now):
+        if not self.can_move(now):
+            return False
+
+        new_grid_x = self.grid_x + dx
+        new_grid_y = self.grid_y + dy
+
+        tile = game_map.tile(new_grid_x, new_grid_y)
+        if tile != WALL and tile != BLOCK and tile != BOMB:  # 爆弾もすり抜けられないように追加
+            self.grid_x = new_grid_x
+            self.grid_y = new_grid_y
+
+            # アイテム取得
+            if tile in ITEMS:
+                self.collect_item(tile)
+                game_map[new_grid_y][new_grid_x] = EMPTY
+
+            self.next_move_tick = now + max(5, self.move_delay - (self.speed_level - 1) * 2)
+            return True
+        return False
+
+    def can_place_bomb(self, game_map):
+        return self.alive and len(self.bombs) < self.max_bombs and game_map[self.grid_y][self.grid_x] != BOMB
+
+    def place_bomb(self, game_map, now):
+        if self.can_place_bomb(game_map):
+            bomb = Bomb(self.grid_x, self.grid_y, self.bomb_range, now)
+            bomb.owner = self
+            self.bombs.append(bomb)
+            game_map[self.grid_y][self.grid_x] = BOMB
+            return bomb
+        return None
+
+    def collect_item(self, item_type):
+        if item_type == POWER_UP:
+            self.bomb_range += 1
+            self.score += 100
+        elif item_type == SPEED_UP:
+            self.speed_level += 1
+            self.score += 100
+        elif item_type == BOMB_UP:
+            self.max_bombs += 1
+            self.score += 100
+
+def arena_scale(width, height):
+    # 標準のマップの何枚分の広さか（敵やアイテムの数を広さに合わせて増やす）
+    return max(1, (width * height) // (GRID_WIDTH * GRID_HEIGHT))
+
+def player_starts(width=GRID_WIDTH, height=GRID_HEIGHT, num_players=1):
+    # プレイヤーの初期位置（1人目は左上、2人目は右下の角）
+    return [(1, 1), (width - 2, height - 2)][:num_players]
+
+def create_map(stage_num=1, rng=random, width=GRID_WIDTH, height=GRID_HEIGHT, starts=((1, 1),)):
+    game_map = Grid(width, height)
+
+    # 外壁の配置
+    for y in range(height):
+        for x in range(width):
+            if x == 0 or x == width-1 or y == 0 or y == height-1:
+                game_map[y][x] = WALL
+
+    # ステージに応じてブロックの配置密度を変更
+    block_density = BLOCK_DENSITY_BASE + (stage_num * BLOCK_DENSITY_STEP)  # ステージが上がるごとにブロックが増える
+
+    # ブロックを置ける候補のマスから、密度に応じた数だけ直接選ぶ
+    candidates = [(x, y) for y in range(2, height-2) for x in range(2, width-2)]
+    num_blocks = min(len(candidates), round(len(candidates) * block_density))
+    for x, y in rng.sample(candidates, num_blocks):
+        game_map[y][x] = BLOCK
+
+    # プレイヤーの初期位置を確保（隣の2マスは角から出る方向）
+    def clear_start(x, y):
+        step_x = 1 if x < width // 2 else -1
+        step_y = 1 if y < height // 2 else -1
+        game_map[y][x] = EMPTY
+        game_map[y][x + step_x] = EMPTY
+        game_map[y + step_y][x] = EMPTY
+
+    for x, y in starts:
+        clear_start(x, y)
+
+    # 1人目の初期位置から空きマスだけでたどれない閉じた空間はブロックで埋める
+    # （敵が閉じ込められず、どの敵もプレイヤーのいる空間に置かれるようにする）
+    reached = game_map.flood_fill(*starts[0])
+    cells = game_map.cells
+    for i, tile in enumerate(cells):
+        if tile == EMPTY and not reached[i]:
+            cells[i] = BLOCK
+    # 2人目以降の初期位置は埋まっていても空け直す（ブロックを壊せば合流できる）
+    for x, y in starts[1:]:
+        clear_start(x, y)
+
+    # アイテムはブロックの中から選ぶ（ブロックが足りなければある分だけ）
+    max_items = (3 + stage_num) * arena_scale(width, height)  # ステージごとにアイテム数が増える
+    blocks = game_map.find_all(BLOCK)
+    for x, y in rng.sample(blocks, min(max_items, len(blocks))):
+        game_map[y][x] = rng.choice(ITEMS)
+
+    return game_map
+
+def blast_cells(game_map, bomb_x, bomb_y, explosion_range):
+    # 爆風が届くマスの一覧（中心から上下左右へ。壁で止まり、壊れるブロックはそのマスまで）
+    cells = [(bomb_x, bomb_y)]
+    for dx, dy in DIRECTIONS:
+        for r in range(1, explosion_range + 1):
+            x = bomb_x + (dx * r)
+            y = bomb_y + (dy * r)
+
+            tile = game_map.tile(x, y)
+            if tile == WALL:  # 範囲外も壁として扱う
+                break
+            cells.append((x, y))
+            if tile == BLOCK:  # 壊れるブロックも爆発範囲に含める
+                break
+    return cells
+
+def resolve_explosions(detonating, live_bombs, game_map, players, enemies, occupancy, now):
+    # このティックに爆発する爆弾をまとめて処理する
+    # 爆風に巻き込まれた爆弾はキューに積んで誘爆させ、爆風のマスは重複を除いて一度だけ適用する
+    # 爆風の形は処理前のマップで決まる（同じティックに壊れたブロックも爆風を止める）
+    # 点数は、そのマスに最初に届いた爆風の爆弾を置いたプレイヤーに入る
+    bomb_at = {(bomb.x, bomb.y): bomb for bomb in live_bombs if not bomb.exploded}
+    queue = deque(detonating)
+    exploded = []
+    cells = []
+    owners = []  # 各マスに点数が入るプレイヤー
+    seen = set()
+    for bomb in detonating:
+        bomb_at.pop((bomb.x, bomb.y), None)
+
+    while queue:
+        bomb = queue.popleft()
+        bomb.exploded = True
+        bomb.exploded_tick = now
+        bomb.explosions = blast_cells(game_map, bomb.x, bomb.y, bomb.explosion_range)
+        exploded.append(bomb)
+        for cell in bomb.explosions:
+            if cell in seen:
+                continue
+            seen.add(cell)
+            cells.append(cell)
+            owners.append(bomb.owner)
+            # 誘爆
+            other = bomb_at.pop(cell, None)
+            if other is not None:
+                queue.append(other)
+
+    # 爆風のマスを一度ずつ適用
+    killed = False
+    for (x, y), owner in zip(cells, owners):
+        if game_map[y][x] == BLOCK:
+            game_map[y][x] = EMPTY
+            if owner is not None:
+                owner.score += 50
+            continue
+
+        # プレイヤーの死亡判定
+        for player in players:
+            if player.alive and player.grid_x == x and player.grid_y == y:
+                player.alive = False
+
+        # 敵の死亡判定（マス索引から直接引く）
+        for enemy in list(occupancy.at(x, y)):
+            occupancy.remove(enemy)
+            if owner is not None:
+                owner.score += 200
+            killed = True
+
+    # 倒した敵をまとめて取り除く
+    if killed:
+        enemies[:] = [enemy for enemy in enemies if enemy.occupancy is not None]
+
+    # 爆発した爆弾のマスを空ける
+    for bomb in exploded:
+        game_map[bomb.y][bomb.x] = EMPTY
+    return exploded, cells
+
+class DangerMap:
+    # 設置中の全爆弾について、爆風が届くマスと爆発するティック（誘爆を含む）をまとめた危険マップ
+    # 爆弾の設置・爆発のときだけ更新し、敵は1マス O(1) で引く
+    def __init__(self, game_map):
+        self.game_map = game_map
+        self.bombs = {}  # 爆弾 -> 爆発するティック
+        self.cells = {}  # (x, y) -> そのマスが最初に爆風に巻き込まれるティック
+
+    def add_bomb(self, bomb):
+        self.bombs[bomb] = bomb.detonate_tick
+        self.rebuild()
+
+    def remove_bombs(self, bombs):
+        # 爆発でブロックが壊れると他の爆弾の爆風が伸びるので作り直す
+        for bomb in bombs:
+            self.bombs.pop(bomb, None)
+        self.rebuild()
+
+    def rebuild(self):
+        game_map = self.game_map
+        blasts = {bomb: blast_cells(game_map, bomb.x, bomb.y, bomb.explosion_range) for bomb in self.bombs}
+        bomb_at = {(bomb.x, bomb.y): bomb for bomb in self.bombs}
+
+        # 誘爆：他の爆弾の爆風に入っている爆弾は、そちらの爆発に合わせて早まる
+        effective = dict(self.bombs)
+        changed = True
+        while changed:
+            changed = False
+            for bomb, cells in blasts.items():
+                detonation = effective[bomb]
+                for cell in cells:
+                    other = bomb_at.get(cell)
+                    if other is not None and effective[other] > detonation:
+                        effective[other] = detonation
+                        changed = True
+
+        self.cells = {}
+        for bomb, cells in blasts.items():
+            detonation = effective[bomb]
+            for cell in cells:
+                if detonation < self.cells.get(cell, detonation + 1):
+                    self.cells[cell] = detonation
+
+    def is_dangerous(self, x, y):
+        return (x, y) in self.cells
+
+    def detonation_tick(self, x, y):
+        # 安全なマスは None
+        return self.cells.get((x, y))
+
+    def time_left(self, x, y, now):
+        # そのマスが爆発に巻き込まれるまでのティック数（安全なマスは None）
+        detonation = self.cells.get((x, y))
+        return None if detonation is None else detonation - now
+
+class DistanceField:
+    # プレイヤーのマスからの最短距離（敵が通れる空きマスのみ）を幅優先探索で求めたもの
+    # 全チェイサーで共有し、プレイヤーのマスかマップが変わった後に引かれたときだけ計算し直す
+    # radius を渡すとその歩数で探索を打ち切るので、計算量はマップの広さによらなくなる
+    UNREACHABLE = -1
+
+    def __init__(self, game_map, radius=None):
+        self.game_map = game_map
+        self.radius = radius
+        self.dist = None
+        self.source = None
+        self.version = None
+
+    def update(self, x, y, version):
+        # 探索の起点を更新する（実際の計算は距離を引いたときまで遅らせる）
+        if (x, y) != self.source or version != self.version:
+            self.source = (x, y)
+            self.version = version
+            self.dist = None
+
+    def compute(self):
+        game_map = self.game_map
+        width = game_map.width
+        size = width * game_map.height
+        cells = game_map.cells  # マップ全体を変換せず、たどったマスだけを見る
+        radius = self.radius
+        start = game_map.offset(*self.source)
+        dist = {start: 0}  # マスの番号 -> 歩数（届いたマスだけ）
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            d = dist[i] + 1
+            if radius is not None and d > radius:
+                continue
+            column = i % width
+            for n in (i - width, i + width,
+                      i - 1 if column > 0 else -1,
+                      i + 1 if column < width - 1 else -1):
+                if 0 <= n < size and cells[n] == EMPTY and n not in dist:
+                    dist[n] = d
+                    queue.append(n)
+        self.dist = dist
+
+    def distance(self, x, y):
+        # プレイヤーまでの歩数（届かない場合は UNREACHABLE）
+        if not self.game_map.in_bounds(x, y):
+            return self.UNREACHABLE
+        if self.dist is None:
+            self.compute()
+        return self.dist.get(self.game_map.offset(x, y), self.UNREACHABLE)
+
+    def next_steps(self, x, y):
+        # プレイヤーに1歩近づく方向の一覧（届かない場合は空）
+        here = self.distance(x, y)
+        if here <= 0:
+            return []
+        return [(dx, dy) for dx, dy in DIRECTIONS if self.distance(x + dx, y + dy) == here - 1]
+
+def spawn_enemy(enemies, game_map, player, enemy_type, rng=random, ai_rng=random):
+    # プレイヤーから離れた位置に敵を配置
+    min_distance = 5  # プレイヤーからの最小距離
+
+    for _ in range(20):  # 最大20回試行
+        x = rng.randint(1, game_map.width-2)
+        y = rng.randint(1, game_map.height-2)
+
+        # プレイヤーからの距離を計算
+        distance = abs(x - player.grid_x) + abs(y - player.grid_y)
+
+        if distance >= min_distance and game_map[y][x] == EMPTY:
+            enemies.append(Enemy(x, y, enemy_type, ai_rng))
+            return True
+
+    # 適切な位置が見つからなかった場合、ランダムな空きマスに配置
+    empty_cells = game_map.find_all(EMPTY)
+
+    if empty_cells:
+        x, y = rng.choice(empty_cells)
+        enemies.append(Enemy(x, y, enemy_type, ai_rng))
+        return True
+
+    return False
+
+class GameState:
+    # 1ステージ分のゲーム状態。step() を呼ぶたびに1ティック（1/TICK_RATE 秒）進む
+    # 乱数はシードから作ったサブシステムごとの列だけを使うので、シードと操作列で完全に再現できる
+    # num_players を2にすると、2人目が右下の角から同じマップで遊ぶ（操作は step() に人数分渡す）
+    def __init__(self, stage=1, seed=None, enemy_types=None, width=GRID_WIDTH, height=GRID_HEIGHT,
+                 num_players=1):
+        if not 1 <= num_players <= MAX_PLAYERS:
+            raise ValueError(f"プレイヤーは1〜{MAX_PLAYERS}人です")
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        elif not 0 <= seed < SEED_LIMIT:
+            raise ValueError("シードは0以上2の64乗未満にしてください")
+        self.stage = stage
+        self.seed = seed
+        self.tick = 0
+        self.status = RUNNING
+        self.map_rng = make_rng(seed, "map")
+        self.spawn_rng = make_rng(seed, "spawn")
+        self.ai_rng = make_rng(seed, "ai")
+        # このステージの操作の記録
+        self.replay = Replay(stage, seed, None, width, height, num_players)
+        starts = player_starts(width, height, num_players)
+        self.game_map = create_map(stage, self.map_rng, width, height, starts)
+        # マップが書き換わったマス（描画側が再描画後にクリアする）
+        self.dirty_cells = set()
+        # マップを書き換えるたびに増える番号
+        self.map_version = 0
+        self.players = [Player(x, y) for x, y in starts]
+        self.player = self.players[0]  # 1人目（1人で遊ぶときはこれだけを見ればよい）
+        self.enemies = []
+
+        # ステージとマップの広さに応じた敵の生成（enemy_types を渡すとその種類の敵だけを並べる）
+        if enemy_types is None:
+            num_enemies = (stage + 2) * arena_scale(width, height)
+        else:
+            num_enemies = len(enemy_types)
+        for i in range(num_enemies):
+            if enemy_types is None:
+                enemy_type = self.spawn_rng.randint(0, min(2, (stage - 1)))
+            else:
+                enemy_type = enemy_types[i]
+            spawn_enemy(self.enemies, self.game_map, self.player, enemy_type, self.spawn_rng, self.ai_rng)
+        # 敵の位置のマス索引
+        self.occupancy = Occupancy(self.enemies)
+        # 爆弾の危険マップ
+        self.danger = DangerMap(self.game_map)
+        # チェイサーが共有するプレイヤーまでの距離マップ
+        radius = FIELD_RADIUS if arena_scale(width, height) > 1 else None
+        self.field = DistanceField(self.game_map, radius)
+        # 敵の移動・爆弾の爆発・爆発エフェクトの終了の予定（期限が来たものだけ処理する）
+        self.timers = TimerWheel()
+        for enemy in self.enemies:
+            self.timers.schedule(1, TIMER_ENEMY_MOVE, enemy)
+        # フェーズごとの時間を測るときは mark(フェーズ名) を持つオブジェクトを入れる
+        self.profiler = None
+
+    def snapshot(self):
+        # 状態をバイト列にまとめる（copy.deepcopy よりずっと速く、巻き戻しや探索に使える）
+        # マップ生成と敵の配置の乱数列は初期化でしか使わないので、敵の移動の乱数列だけを保存する
+        players = self.players
+        enemies = self.enemies
+        bombs = [bomb for player in players for bomb in player.bombs]
+        enemy_index = {id(enemy): i for i, enemy in enumerate(enemies)}
+        bomb_index = {id(bomb): i for i, bomb in enumerate(bombs)}
+
+        # 予定は枠ごとに登録順のまま保存する（同じティックの敵の移動順が変わらないように）
+        timers = []
+        for slot in self.timers.slots:
+            for tick, kind, target in slot:
+                if kind == TIMER_ENEMY_MOVE:
+                    index = enemy_index.get(id(target))  # 倒された敵の予定は捨てる
+                elif kind == TIMER_BOMB_FUSE and target.exploded:
+                    index = None  # 誘爆で爆発済み
+                else:
+                    index = bomb_index.get(id(target))
+                if index is not None:
+                    timers.append(SNAPSHOT_TIMER.pack(tick, TIMER_KINDS.index(kind), index))
+
+        parts = [
+            SNAPSHOT_HEADER.pack(self.stage, self.seed, self.tick, self.status, self.map_version),
+            SNAPSHOT_COUNTS.pack(len(players), len(self.game_map.cells), len(enemies), len(timers),
+                                 len(self.replay.actions)),
+        ]
+        for player in players:
+            parts.append(SNAPSHOT_PLAYER.pack(player.grid_x, player.grid_y, player.next_move_tick,
+                                              player.move_delay, player.bomb_range, player.max_bombs,
+                                              player.speed_level, player.alive, player.score,
+                                              len(player.bombs)))
+        parts.append(SNAPSHOT_RNG.pack(*self.ai_rng.getstate()[1]))
+        parts.append(self.game_map.cells)
+        for enemy in enemies:
+            dx, dy = enemy.direction
+            parts.append(SNAPSHOT_ENEMY.pack(enemy.grid_x, enemy.grid_y, enemy.enemy_type, dx, dy))
+        for bomb in bombs:
+            exploded_tick = bomb.exploded_tick if bomb.exploded else -1
+            parts.append(SNAPSHOT_BOMB.pack(bomb.x, bomb.y, bomb.explosion_range, bomb.detonate_tick,
+                                            exploded_tick, len(bomb.explosions)))
+            parts.extend(SNAPSHOT_CELL.pack(x, y) for x, y in bomb.explosions)
+        parts.extend(timers)
+        parts.append(self.replay.actions)
+        return b"".join(parts)
+
+    def restore(self, data):
+        # snapshot() の状態に戻す（マップは同じ Grid に書き戻すので描画側の参照はそのまま使える）
+        data = memoryview(data)
+        offset = 0
+        (self.stage, self.seed, self.tick, self.status,
+         self.map_version) = SNAPSHOT_HEADER.unpack_from(data, offset)
+        offset += SNAPSHOT_HEADER.size
+        num_players, map_size, num_enemies, num_timers, num_actions = SNAPSHOT_COUNTS.unpack_from(data, offset)
+        offset += SNAPSHOT_COUNTS.size
+        players = []
+        bomb_counts = []
+        for _ in range(num_players):
+            (x, y, next_move_tick, move_delay, bomb_range, max_bombs, speed_level, alive, score,
+             num_bombs) = SNAPSHOT_PLAYER.unpack_from(data, offset)
+            offset += SNAPSHOT_PLAYER.size
+            player = Player(x, y)
+            player.next_move_tick = next_move_tick
+            player.move_delay = move_delay
+            player.bomb_range = bomb_range
+            player.max_bombs = max_bombs
+            player.speed_level = speed_level
+            player.alive = bool(alive)
+            player.score = score
+            players.append(player)
+            bomb_counts.append(num_bombs)
+        self.players = players
+        self.player = players[0]
+        rng_state = SNAPSHOT_RNG.unpack_from(data, offset)
+        offset += SNAPSHOT_RNG.size
+
+        # マップ（変わったマスだけ再描画してもらう）
+        game_map = self.game_map
+        if map_size != len(game_map.cells):
+            raise ValueError("マップの大きさが違うスナップショットです")
+        cells = data[offset:offset + map_size]
+        offset += map_size
+        if game_map.cells != cells:
+            width = game_map.width
+            old = game_map.cells
+            self.dirty_cells.update((i % width, i // width) for i in range(map_size) if old[i] != cells[i])
+            game_map.cells[:] = cells
+
+        enemies = []
+        size = SNAPSHOT_ENEMY.size * num_enemies
+        for x, y, enemy_type, dx, dy in SNAPSHOT_ENEMY.iter_unpack(data[offset:offset + size]):
+            enemy = Enemy(x, y, enemy_type, self.ai_rng)
+            enemy.direction = (dx, dy)
+            enemies.append(enemy)
+        offset += size
+        self.enemies = enemies
+        self.occupancy = Occupancy(enemies)
+        # 敵を作るときに乱数を引くので、乱数列の状態は最後に戻す
+        self.ai_rng.setstate((3, rng_state, None))
+
+        bombs = []
+        for player, num_bombs in zip(players, bomb_counts):
+            for _ in range(num_bombs):
+                (x, y, explosion_range, detonate_tick, exploded_tick,
+                 num_cells) = SNAPSHOT_BOMB.unpack_from(data, offset)
+                offset += SNAPSHOT_BOMB.size
+                bomb = Bomb(x, y, explosion_range)
+                bomb.detonate_tick = detonate_tick
+                bomb.owner = player
+                if exploded_tick >= 0:
+                    bomb.exploded = True
+                    bomb.exploded_tick = exploded_tick
+                size = SNAPSHOT_CELL.size * num_cells
+                bomb.explosions = list(SNAPSHOT_CELL.iter_unpack(data[offset:offset + size]))
+                offset += size
+                player.bombs.append(bomb)
+                bombs.append(bomb)
+
+        timers = TimerWheel(len(self.timers.slots))
+        size = SNAPSHOT_TIMER.size * num_timers
+        for tick, kind, index in SNAPSHOT_TIMER.iter_unpack(data[offset:offset + size]):
+            kind = TIMER_KINDS[kind]
+            target = enemies[index] if kind == TIMER_ENEMY_MOVE else bombs[index]
+            timers.schedule(tick, kind, target)
+        offset += size
+        self.timers = timers
+
+        self.replay = Replay(self.stage, self.seed, data[offset:offset + num_actions], game_map.width,
+                             game_map.height, num_players)
+
+        # 爆弾と地形から作り直せるもの
+        self.danger.bombs = {bomb: bomb.detonate_tick for bomb in bombs if not bomb.exploded}
+        self.danger.rebuild()
+        self.field.source = None
+        self.field.dist = None
+
+    def map_changed(self, cells):
+        # マップを書き換えたマスを記録する
+        self.dirty_cells.update(cells)
+        self.map_version += 1
+
+    def target_player(self):
+        # 敵が追いかけるプレイヤー（生きている中で最初の人）
+        for player in self.players:
+            if player.alive:
+                return player
+        return self.player
+
+    def move_enemy(self, enemy, player=None):
+        # 敵の種類ごとの移動を1回行う
+        if player is None:
+            player = self.target_player()
+        game_map = self.game_map
+        if enemy.enemy_type == ENEMY_SLIME:  # スライム（ランダム移動）
+            enemy.move_slime(game_map)
+        elif enemy.enemy_type == ENEMY_CHASER:  # チェイサー（追跡）
+            enemy.move_chaser(game_map, player, self.field)
+        elif enemy.enemy_type == ENEMY_SMART:  # スマート（爆弾回避）
+            enemy.move_smart(game_map, player, self.danger if player.alive else None, self.field)
+
+    def step(self, actions=ACTION_NONE, *others):
+        # actions は1人目の ACTION_* のビットフラグ（2人目以降の分は others に続ける）
+        # 発生したイベントのリストを返す
+        events = []
+        if self.status != RUNNING:
+            return events
+        self.tick += 1
+        now = self.tick
+        players = self.players
+        if len(players) == 1:
+            inputs = (actions,)
+            self.replay.record(actions)
+        else:
+            # 足りない人の操作は何もしないものとして扱う
+            inputs = ((actions,) + others + (ACTION_NONE,) * len(players))[:len(players)]
+            self.replay.record(*inputs)
+        game_map = self.game_map
+        timers = self.timers
+        profiler = self.profiler
+
+        for index, player in enumerate(players):
+            actions = inputs[index]
+            # 爆弾の設置
+            if actions & ACTION_BOMB:
+                bomb = player.place_bomb(game_map, now)
+                if bomb:
+                    self.danger.add_bomb(bomb)
+                    timers.schedule(bomb.detonate_tick, TIMER_BOMB_FUSE, bomb)
+                    self.map_changed([(bomb.x, bomb.y)])
+                    events.append(EVENT_BOMB_PLACE)
+
+            # プレイヤーの移動
+            if player.can_move(now):
+                for flag, (dx, dy) in MOVE_ACTIONS:
+                    if actions & flag:
+                        target = game_map[player.grid_y + dy][player.grid_x + dx]
+                        if player.move(dx, dy, game_map, now) and target in ITEMS:
+                            self.map_changed([(player.grid_x, player.grid_y)])
+                            events.append(EVENT_ITEM_PICKUP)
+                        break
+        if profiler is not None:
+            profiler.mark("player")
+
+        # このティックに期限が来た予定だけを取り出す
+        moving = []
+        detonating = []
+        finished = []
+        for _, kind, target in timers.pop_due(now):
+            if kind == TIMER_ENEMY_MOVE:
+                moving.append(target)
+            elif kind == TIMER_BOMB_FUSE:
+                # 誘爆で先に爆発した爆弾の予定は捨てる
+                if not target.exploded:
+                    detonating.append(target)
+            elif kind == TIMER_EXPLOSION_END:
+                finished.append(target)
+
+        # 敵の移動（距離マップはプレイヤーのマスかマップが変わったときだけ計算し直す）
+        # （1人目が生きていれば探さずに済ませる）
+        target = players[0] if players[0].alive else self.target_player()
+        self.field.update(target.grid_x, target.grid_y, self.map_version)
+        if len(moving) > 1:
+            # 同じティックに動く敵は予定を入れた順ではなく enemies の並び順で動かす（乱数列を引く順番を変えない）
+            moving.sort(key=enemy_order)
+        for enemy in moving:
+            if enemy.occupancy is None:  # 倒された敵の予定は捨てる
+                continue
+            self.move_enemy(enemy, target)
+            # 移動後は move_delay ティック待ってから次に動く
+            timers.schedule(now + enemy.move_delay + 1, TIMER_ENEMY_MOVE, enemy)
+        if profiler is not None:
+            profiler.mark("enemy_ai")
+
+        # 爆発後のエフェクト表示期間が終了した爆弾を取り除く
+        if finished:
+            for player in players:
+                player.bombs = [bomb for bomb in player.bombs if bomb not in finished]
+
+        # 爆発の処理（誘爆も含めて1回でまとめて処理。ほかのプレイヤーの爆弾にも誘爆する）
+        if detonating:
+            live_bombs = [bomb for player in players for bomb in player.bombs]
+            exploded, explosions = resolve_explosions(detonating, live_bombs, game_map, players,
+                                                      self.enemies, self.occupancy, now)
+            for bomb in exploded:
+                timers.schedule(now + bomb.explosion_duration, TIMER_EXPLOSION_END, bomb)
+            self.danger.remove_bombs(exploded)
+            self.map_changed(explosions)
+            events.append(EVENT_EXPLOSION)
+
+        # 敵との衝突判定（全員がやられたらゲームオーバー）
+        alive = False
+        for player in players:
+            if player.alive:
+                if self.occupancy.at(player.grid_x, player.grid_y):
+                    player.alive = False
+                else:
+                    alive = True
+
+        if not alive:
+            self.status = DEAD
+            events.append(EVENT_GAME_OVER)
+        # すべての敵を倒したらステージクリア
+        elif not self.enemies:
+            self.status = CLEARED
+            events.append(EVENT_STAGE_CLEAR)
+        if profiler is not None:
+            profiler.mark("bombs")
+        return events
+
+class Replay:
+    # シードとティックごとの操作だけを記録したリプレイ
+    def __init__(self, stage=1, seed=0, actions=None, width=GRID_WIDTH, height=GRID_HEIGHT, num_players=1):
+        self.stage = stage
+        self.seed = seed
+        self.actions = bytearray(actions or b"")  # 1ティックに人数分のバイト
+        self.width = width
+        self.height = height
+        self.num_players = num_players
+
+    def record(self, actions, *others):
+        # 1ティック分の全員の操作
+        self.actions.append(actions)
+        if others:
+            self.actions.extend(others)
+
+    def to_bytes(self):
+        header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.stage, self.seed, self.width, self.height,
+                                    self.num_players)
+        return header + zlib.compress(bytes(self.actions))
+
+    @classmethod
+    def from_bytes(cls, data):
+        # 古い版はヘッダーの長さが違うので、マジックとバージョンを先に確かめる
+        if bytes(data[:len(REPLAY_MAGIC) + 1]) != REPLAY_MAGIC + bytes([REPLAY_VERSION]):
+            raise ValueError("リプレイファイルの形式が違います")
+        magic, version, stage, seed, width, height, num_players = REPLAY_HEADER.unpack_from(data)
+        return cls(stage, seed, zlib.decompress(data[REPLAY_HEADER.size:]), width, height, num_players)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def play(self):
+        # 描画なしで最後まで再シミュレーションし、最後の状態を返す
+        state = GameState(self.stage, self.seed, None, self.width, self.height, self.num_players)
+        if self.num_players == 1:
+            for actions in self.actions:
+                state.step(actions)
+        else:
+            actions = self.actions
+            for i in range(0, len(actions), self.num_players):
+                state.step(*actions[i:i + self.num_players])
+        return state
+
+# リプレイを描画なしで再生する（例: python engine.py last_replay.bmr）
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        replay = Replay.load(path)
+        start = time.perf_counter()
+        state = replay.play()
+        elapsed = time.perf_counter() - start
+        result = {RUNNING: "途中", DEAD: "ゲームオーバー", CLEARED: "クリア"}[state.status]
+        print(f"{path}: ステージ {state.stage} シード {state.seed} {state.tick}ティック "
+              f"{result} スコア {state.player.score} ({state.tick / max(elapsed, 1e-9):.0f} ティック/秒)")
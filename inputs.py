@@ -0,0 +1,137 @@
+import json
+from collections import deque
+
+from engine import ACTION_NONE, ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT, ACTION_BOMB
+
+# キー入力を時刻つきで受け取り、次に使う方向と爆弾を小さなリングに溜めておく入力バッファ（pygameに依存しない）
+# 移動の待ち時間中に押して離した短い入力も捨てずに、動けるようになった最初のティックで使う
+# 押してから実際にティックで使われるまでの時間を度数分布に記録し、移動の待ち時間の調整に使う
+
+DIRECTION_ACTIONS = (ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT)
+
+INPUT_BUFFER_SIZE = 4  # 溜めておく押下の数（古いものからあふれる）
+INPUT_BUFFER_TIME = 0.25  # これより前に押したものは使わずに捨てる（秒）
+
+LATENCY_BUCKET = 0.001  # 度数分布の1区間（秒）
+LATENCY_BUCKETS = 250  # 区間の数（最後の区間はそれより長いものをすべて数える）
+
+class LatencyHistogram:
+    def __init__(self, bucket=LATENCY_BUCKET, buckets=LATENCY_BUCKETS):
+        self.bucket = bucket
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        index = min(int(latency / self.bucket), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, p):
+        # p の割合が収まる区間の上端（ミリ秒）
+        target = p * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return (index + 1) * self.bucket * 1000
+        return self.max * 1000
+
+    def stats(self):
+        # ミリ秒の統計。記録がなければ None
+        if not self.count:
+            return None
+        return {
+            "count": self.count,
+            "mean": self.total / self.count * 1000,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max * 1000,
+        }
+
+class InputBuffer:
+    def __init__(self, size=INPUT_BUFFER_SIZE, expire=INPUT_BUFFER_TIME):
+        self.expire = expire
+        self.held = []  # 押し続けている方向（最後に押したものが末尾）
+        self.moves = deque(maxlen=size)  # まだ使っていない方向の押下 [方向, 押した時刻, 待たされたか]
+        self.bombs = deque(maxlen=size)  # まだ使っていない爆弾の押下
+        self.histograms = {"move": LatencyHistogram(), "bomb": LatencyHistogram()}
+        self.dropped = 0  # 使われずに古くなった押下の数
+
+    def clear(self):
+        # ステージの開始などで溜まった押下を捨てる（押し続けているキーはそのまま）
+        self.moves.clear()
+        self.bombs.clear()
+
+    def release_all(self):
+        # ウィンドウが隠れたときなど、離したイベントが来ないかもしれないとき
+        self.held = []
+        self.clear()
+
+    def press(self, action, now):
+        # now: イベントを受け取った時刻（time.perf_counter()）
+        if action == ACTION_BOMB:
+            self.bombs.append([action, now, False])
+        elif action in DIRECTION_ACTIONS:
+            if action in self.held:
+                self.held.remove(action)
+            self.held.append(action)
+            self.moves.append([action, now, False])
+
+    def release(self, action):
+        if action in self.held:
+            self.held.remove(action)
+
+    def take(self, now, player=None, tick=0, game_map=None):
+        # 次のティックに渡す行動フラグ（player を渡すと、そのティックで動けるか・爆弾を置けるかで溜めた押下を使うか決める）
+        # player を渡さないときは毎回使う（サーバーに送るだけのクライアントなど）
+        self.expire_old(now)
+        can_move = player is None or player.can_move(tick)
+        can_bomb = player is None or player.can_place_bomb(game_map)
+        actions = ACTION_NONE
+        if not self.moves:
+            if self.held:
+                actions |= self.held[-1]
+        elif can_move:
+            action, pressed, waited = self.moves.popleft()
+            actions |= action
+            self.record("move", now - pressed)
+            if waited:
+                # 移動の待ち時間のせいで遅れた押下は速さのレベルごとにも分けて数える
+                self.record(f"cooldown_speed{player.speed_level}", now - pressed)
+        else:
+            for entry in self.moves:
+                entry[2] = True
+        if self.bombs and can_bomb:
+            action, pressed, _ = self.bombs.popleft()
+            actions |= action
+            self.record("bomb", now - pressed)
+        return actions
+
+    def expire_old(self, now):
+        for pending in (self.moves, self.bombs):
+            while pending and now - pending[0][1] > self.expire:
+                pending.popleft()
+                self.dropped += 1
+
+    def record(self, name, latency):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.add(latency)
+
+    def stats(self):
+        return {name: histogram.stats() for name, histogram in self.histograms.items() if histogram.count}
+
+    def dump(self, path):
+        # 度数分布を JSON で書き出す（区間の幅はミリ秒）
+        data = {"bucket_ms": LATENCY_BUCKET * 1000, "dropped": self.dropped, "histograms": {}}
+        for name, histogram in self.histograms.items():
+            data["histograms"][name] = {"stats": histogram.stats(), "counts": histogram.counts}
+        with open(path, "w") as f:
+            json.dump(data, f)
+        return self.histograms["move"].count + self.histograms["bomb"].count
@@ -1,47 +1,35 @@
 import pygame
 import sys
+import argparse
 import random
 import math
+import itertools
+import threading
+import time
+from collections import OrderedDict
 
-# 初期化
-pygame.init()
-pygame.mixer.init()  # 音声機能の初期化
+from engine import (
+    GRID_WIDTH, GRID_HEIGHT,
+    WALL, BLOCK, POWER_UP, SPEED_UP, BOMB_UP, ITEMS,
+    ENEMY_SLIME, ENEMY_CHASER, ENEMY_SMART,
+    ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT, ACTION_BOMB,
+    EXPLOSION_DURATION, TICK_RATE, RUNNING, DEAD, CLEARED,
+    EVENT_BOMB_PLACE, EVENT_EXPLOSION, EVENT_ITEM_PICKUP, EVENT_GAME_OVER, EVENT_STAGE_CLEAR,
+    SEED_LIMIT, GameState,
+)
+from profiler import FrameProfiler
+from inputs import InputBuffer
+from audio import AudioManager
+from net import NetClient, split_address
+from rollback import RollbackSession, UdpTransport
 
 # 画面設定
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 TILE_SIZE = 40
-GRID_WIDTH = SCREEN_WIDTH // TILE_SIZE
-GRID_HEIGHT = SCREEN_HEIGHT // TILE_SIZE
-
-# 音声ファイルの読み込み
-try:
-    # 効果音
-    bomb_place_sound = pygame.mixer.Sound("sounds/bomb_place.mp3")
-    bomb_explosion_sound = pygame.mixer.Sound("sounds/explosion.mp3")
-    item_pickup_sound = pygame.mixer.Sound("sounds/item_pickup.mp3")  # アイテム取得音を追加
-    game_over_sound = pygame.mixer.Sound("sounds/game_over.mp3")  # ゲームオーバー音を追加
-    stage_clear_sound = pygame.mixer.Sound("sounds/stage_clear.mp3")  # ステージクリア音を追加
-    
-    # BGM
-    menu_bgm = pygame.mixer.Sound("sounds/menu_bgm.mp3")  # メニュー画面のBGM
-    game_bgm = pygame.mixer.Sound("sounds/game_bgm.mp3")  # ゲームプレイ中のBGM
-    
-    # 音量調整
-    bomb_place_sound.set_volume(0.5)
-    bomb_explosion_sound.set_volume(0.5)
-    item_pickup_sound.set_volume(0.5)  # アイテム取得音の音量設定
-    game_over_sound.set_volume(0.5)  # ゲームオーバー音の音量設定
-    stage_clear_sound.set_volume(0.5)  # ステージクリア音の音量設定
-    
-    # BGMの音量は小さめに設定
-    menu_bgm.set_volume(0.5)
-    game_bgm.set_volume(0.2)
-    
-    sound_enabled = True
-except:
-    print("音声ファイルの読み込みに失敗しました。ゲームは音なしで続行します。")
-    sound_enabled = False
+# 画面に映るマス数（これより広いマップはプレイヤーを追ってスクロールする）
+VIEW_WIDTH = SCREEN_WIDTH // TILE_SIZE
+VIEW_HEIGHT = SCREEN_HEIGHT // TILE_SIZE
 
 # 色の定義
 BLACK = (0, 0, 0)
@@ -67,6 +55,9 @@ BOMB_COLOR = (30, 30, 30)
 BOMB_HIGHLIGHT = (60, 60, 60)
 EXPLOSION_COLORS = [(255, 200, 0), (255, 150, 0), (255, 100, 0)]
 EXPLOSION_RED = (255, 0, 0)  # 爆発範囲の赤色
+EXPLOSION_ALPHA = 180  # 爆発の透明度（最大値）
+EXPLOSION_FLASH_FRAMES = 15  # 爆発直後の閃光を表示するフレーム数
+EXPLOSION_FLASH_VARIANTS = 8  # 閃光のずれ方のバリエーション数
 # アイテムの色を追加
 POWER_UP_COLOR = (255, 50, 50)
 POWER_UP_GLOW = (255, 100, 100)
@@ -74,27 +65,53 @@ SPEED_UP_COLOR = (255, 215, 0)
 SPEED_UP_GLOW = (255, 235, 100)
 BOMB_UP_COLOR = (148, 0, 211)
 BOMB_UP_GLOW = (186, 85, 211)
+# 敵の色
+ENEMY_COLORS = {
+    ENEMY_SLIME: (0, 100, 255),  # 青色のスライム
+    ENEMY_CHASER: (220, 50, 50),  # 赤色の追跡者
+    ENEMY_SMART: (50, 180, 50),  # 緑色の賢い敵
+}
+ENEMY_EYE_SIZE = TILE_SIZE // 6
+SLIME_BOUNCE_SPEED = 0.01
+# ロボットのライトの色（通常は緑）
+ROBOT_LIGHT_COLORS = [RED, GREEN, YELLOW, BLUE]
+ROBOT_LIGHT_GREEN = 1
+
+# スプライトの設定
+SPRITE_PAD = 8  # マスからはみ出す部分（スライムの跳ねなど）のための余白
+SLIME_FRAMES = 16  # スライムの跳ねるアニメーションのコマ数
+
+# ゲームループの設定
+TICK_TIME = 1 / TICK_RATE  # シミュレーション1ティックの時間（秒）
+RENDER_FPS = 60  # 描画の上限フレームレート（0で上限なし）
+MAX_FRAME_SKIP = 5  # 描画1回あたりに進める最大ティック数
+MAX_FRAME_TIME = 0.25  # 1フレームで扱う経過時間の上限（秒）
+
+# 変化した部分だけを画面に送る（False にすると毎フレーム画面全体を flip する）
+USE_DIRTY_RECTS = True
 
-# ゲーム画面の作成
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("ボンバーマン")
+# フォントサイズ
+FONT_SMALL = 36
+FONT_LARGE = 72
+TEXT_CACHE_SIZE = 64  # 描画済み文字列を保持する最大数
 
-# フォントの初期化
-font = pygame.font.Font(None, 36)
+# フレームプロファイラー（F3で表示の切り替え、F4でトレースを書き出す）
+FONT_PROFILE = 24
+PROFILE_REFRESH = 30  # 表示する数字を更新するフレーム間隔
+TRACE_FILE = "frame_trace.json"  # chrome://tracing や Perfetto で開ける
+INPUT_LATENCY_FILE = "input_latency.json"  # F5で書き出す、押してから反映されるまでの時間の度数分布
 
-# ゲームオブジェクトの種類
-EMPTY = 0
-WALL = 1
-BLOCK = 2
-BOMB = 3
-POWER_UP = 4
-SPEED_UP = 5
-BOMB_UP = 6
+# 操作キー -> エンジンの行動フラグ
+KEY_ACTIONS = {
+    pygame.K_UP: ACTION_UP,
+    pygame.K_DOWN: ACTION_DOWN,
+    pygame.K_LEFT: ACTION_LEFT,
+    pygame.K_RIGHT: ACTION_RIGHT,
+    pygame.K_SPACE: ACTION_BOMB,
+}
 
-# 敵の種類を定義
-ENEMY_SLIME = 0
-ENEMY_CHASER = 1
-ENEMY_SMART = 2
+# 最後に遊んだステージのリプレイ（python engine.py last_replay.bmr で描画なしに再生できる）
+REPLAY_FILE = "last_replay.bmr"
 
 # ゲームの状態
 MENU = 0
@@ -102,723 +119,763 @@ GAME = 1
 GAME_OVER = 2
 STAGE_CLEAR = 3  # ステージクリア状態を追加
 
-class Bomb:
-    def __init__(self, x, y, explosion_range=2):
-        self.x = x
-        self.y = y
-        self.timer = 180  # 3秒 (60FPS × 3)
-        self.explosion_range = explosion_range
-        self.exploded = False
-        self.explosions = []
-        self.explosion_frames = 0  # 爆発アニメーション用
-        self.explosion_duration = 60  # 爆発エフェクトの持続時間（フレーム数）
-        self.explosion_alpha = 180  # 爆発の透明度（最大値）
+# 画面・フォント・音声は init() で初期化する（import しただけでは何も開かない）
+screen = None
+sprites = None
+renderer = None
+# 読み込み済みフォントと描画済み文字列のキャッシュ
+fonts = {}
+text_cache = OrderedDict()
+# 見た目だけに使う乱数（ゲームの進行に使う乱数列とは分けて、リプレイの再現性を崩さない）
+visual_random = random.Random()
+# フレームのフェーズごとの処理時間
+profiler = FrameProfiler()
+profile_lines = []  # 表示中のプロファイル結果の文字列
+# 押したキーを溜めておき、動けるようになった最初のティックで使う
+inputs = InputBuffer()
+# 効果音とBGM
+audio = AudioManager()
 
-    def update(self):
-        if not self.exploded:
-            self.timer -= 1
-            if self.timer <= 0:
-                self.exploded = True
-                return True
-        else:
-            # 爆発後のアニメーション更新
-            self.explosion_frames += 1
-        return False
-
-    def draw(self):
-        if not self.exploded:
-            # 爆弾の本体
-            center_x = self.x * TILE_SIZE + TILE_SIZE // 2
-            center_y = self.y * TILE_SIZE + TILE_SIZE // 2
-            radius = TILE_SIZE // 3
-            
-            # 爆弾の本体（黒い円）
-            pygame.draw.circle(screen, BOMB_COLOR, (center_x, center_y), radius)
-            
-            # 導火線
-            fuse_start = (center_x, center_y - radius)
-            fuse_end = (center_x + radius//2, center_y - radius * 1.5)
-            pygame.draw.line(screen, BOMB_COLOR, fuse_start, fuse_end, 3)
-            
-            # ハイライト（光の反射）
-            highlight_pos = (center_x - radius//3, center_y - radius//3)
-            pygame.draw.circle(screen, BOMB_HIGHLIGHT, highlight_pos, radius//4)
-            
-            # タイマーに応じて点滅効果
-            if self.timer < 60 and self.timer % 10 < 5:  # 最後の1秒で点滅
-                pygame.draw.circle(screen, RED, (center_x, center_y), radius, 2)
-        
-        # 爆発の描画（爆発後かつエフェクト表示期間内の場合のみ）
-        elif self.exploded and self.explosion_frames < self.explosion_duration:
-            # 爆発範囲の半透明エフェクト用のサーフェス
-            # 透明度を計算（徐々にフェードアウト）
-            current_alpha = int(self.explosion_alpha * (1 - self.explosion_frames / self.explosion_duration))
-            explosion_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            
-            # 爆発範囲の各マスを描画
-            for ex, ey in self.explosions:
-                # 爆発範囲を赤色の半透明で表示
-                rect = pygame.Rect(ex * TILE_SIZE, ey * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                explosion_color = (EXPLOSION_RED[0], EXPLOSION_RED[1], EXPLOSION_RED[2], current_alpha)
-                pygame.draw.rect(explosion_surface, explosion_color, rect)
-                
-                # 爆発範囲の境界線
-                border_color = (EXPLOSION_RED[0], EXPLOSION_RED[1], EXPLOSION_RED[2], min(255, current_alpha + 50))
-                pygame.draw.rect(explosion_surface, border_color, rect, 2)
-                
-                # 爆発エフェクトは爆発開始直後のみ表示（最初の15フレーム）
-                if self.explosion_frames < 15:
-                    # 爆発の中心
-                    center_x = ex * TILE_SIZE + TILE_SIZE // 2
-                    center_y = ey * TILE_SIZE + TILE_SIZE // 2
-                    
-                    # 複数の円を重ねて爆発エフェクトを作成
-                    for i, color in enumerate(EXPLOSION_COLORS):
-                        size = TILE_SIZE - (i * 8)
-                        offset = random.randint(-2, 2)  # ランダムなずれを加える
-                        pos = (center_x + offset, center_y + offset)
-                        pygame.draw.circle(screen, color, pos, size // 2)
-                    
-                    # 十字の光線エフェクト
-                    for color in EXPLOSION_COLORS:
-                        for angle in [0, 90, 180, 270]:
-                            start_pos = (center_x, center_y)
-                            end_x = center_x + math.cos(math.radians(angle)) * TILE_SIZE//2
-                            end_y = center_y + math.sin(math.radians(angle)) * TILE_SIZE//2
-                            pygame.draw.line(screen, color, start_pos, (end_x, end_y), 2)
-            
-            # 半透明の爆発範囲を画面に描画
-            screen.blit(explosion_surface, (0, 0))
-
-class Enemy:
-    def __init__(self, x, y, enemy_type=ENEMY_SLIME):
-        self.grid_x = x
-        self.grid_y = y
-        self.x = x * TILE_SIZE
-        self.y = y * TILE_SIZE
-        self.size = TILE_SIZE
-        self.move_cooldown = 0
-        self.enemy_type = enemy_type
-        
-        # 敵の種類に応じたパラメータ設定
-        if enemy_type == ENEMY_SLIME:
-            self.color = (0, 100, 255)  # 青色のスライム
-            self.move_delay = 60  # ゆっくり移動（40から60に変更）
-        elif enemy_type == ENEMY_CHASER:
-            self.color = (220, 50, 50)  # 赤色の追跡者
-            self.move_delay = 45  # 中程度の速さ（25から45に変更）
-        elif enemy_type == ENEMY_SMART:
-            self.color = (50, 180, 50)  # 緑色の賢い敵
-            self.move_delay = 35  # やや速い（20から35に変更）
-        
-        self.direction = random.choice([(0, 1), (0, -1), (1, 0), (-1, 0)])
-        self.bounce_offset = 0
-        self.bounce_speed = 0.01
-        self.eye_size = TILE_SIZE // 6
-
-    def draw(self):
-        if self.enemy_type == ENEMY_SLIME:
-            self.draw_slime()
-        elif self.enemy_type == ENEMY_CHASER:
-            self.draw_chaser()
-        elif self.enemy_type == ENEMY_SMART:
-            self.draw_smart()
-
-    def draw_slime(self):
-        # 跳ねるアニメーション
-        self.bounce_offset = math.sin(pygame.time.get_ticks() * self.bounce_speed) * 5
-        
-        # スライムの体（円）
-        center_x = self.x + TILE_SIZE // 2
-        center_y = self.y + TILE_SIZE // 2 + self.bounce_offset
-        radius = TILE_SIZE // 2 - 2
-        
-        # スライムの体を描画
-        pygame.draw.circle(screen, self.color, (center_x, center_y), radius)
-        
-        # スライムの目（白い部分）
-        eye_offset_x = 3
-        eye_offset_y = -2 + self.bounce_offset // 2
-        pygame.draw.circle(screen, WHITE, 
-                         (center_x - eye_offset_x, center_y + eye_offset_y), 
-                         self.eye_size)
-        pygame.draw.circle(screen, WHITE, 
-                         (center_x + eye_offset_x, center_y + eye_offset_y), 
-                         self.eye_size)
-        
-        # 瞳（黒い部分）
-        pupil_size = self.eye_size // 2
-        pygame.draw.circle(screen, BLACK, 
-                         (center_x - eye_offset_x, center_y + eye_offset_y), 
-                         pupil_size)
-        pygame.draw.circle(screen, BLACK, 
-                         (center_x + eye_offset_x, center_y + eye_offset_y), 
-                         pupil_size)
-        
-        # スライムの口
-        mouth_y = center_y + self.eye_size + 2
-        pygame.draw.arc(screen, (0, 50, 200), 
-                      [center_x - self.eye_size, mouth_y, 
-                       self.eye_size * 2, self.eye_size], 
-                      0, math.pi, 2)
-
-    def draw_chaser(self):
-        # 追跡者の体（四角形）
-        rect = pygame.Rect(self.x, self.y, TILE_SIZE, TILE_SIZE)
-        pygame.draw.rect(screen, self.color, rect)
-        
-        # 目（怒った表情）
-        eye_size = self.eye_size
-        eye_y = self.y + TILE_SIZE // 3
-        left_eye_x = self.x + TILE_SIZE // 3 - 2
-        right_eye_x = self.x + 2 * TILE_SIZE // 3 + 2
-        
-        # 白目
-        pygame.draw.circle(screen, WHITE, (left_eye_x, eye_y), eye_size)
-        pygame.draw.circle(screen, WHITE, (right_eye_x, eye_y), eye_size)
-        
-        # 黒目（プレイヤーを見る方向に少しずらす）
-        pupil_offset = 2
-        pygame.draw.circle(screen, BLACK, (left_eye_x + pupil_offset, eye_y), eye_size // 2)
-        pygame.draw.circle(screen, BLACK, (right_eye_x + pupil_offset, eye_y), eye_size // 2)
-        
-        # 口（怒った表情）
-        mouth_y = self.y + 2 * TILE_SIZE // 3
-        pygame.draw.line(screen, BLACK, 
-                       (self.x + TILE_SIZE // 3, mouth_y), 
-                       (self.x + 2 * TILE_SIZE // 3, mouth_y), 
-                       2)
-
-    def draw_smart(self):
-        # 賢い敵の体（三角形）
-        center_x = self.x + TILE_SIZE // 2
-        center_y = self.y + TILE_SIZE // 2
-        
-        # 三角形の頂点
-        triangle_points = [
-            (center_x, self.y + 5),  # 上
-            (self.x + 5, self.y + TILE_SIZE - 5),  # 左下
-            (self.x + TILE_SIZE - 5, self.y + TILE_SIZE - 5)  # 右下
-        ]
-        
-        # 三角形の体を描画
-        pygame.draw.polygon(screen, self.color, triangle_points)
-        
-        # 目（賢そうな表情）
-        eye_y = self.y + TILE_SIZE // 3
-        left_eye_x = self.x + TILE_SIZE // 3
-        right_eye_x = self.x + 2 * TILE_SIZE // 3
-        
-        # 白目
-        pygame.draw.circle(screen, WHITE, (left_eye_x, eye_y), self.eye_size)
-        pygame.draw.circle(screen, WHITE, (right_eye_x, eye_y), self.eye_size)
-        
-        # 黒目（細い目）
-        pygame.draw.ellipse(screen, BLACK, 
-                          [left_eye_x - self.eye_size//2, eye_y - self.eye_size//4, 
-                           self.eye_size, self.eye_size//2])
-        pygame.draw.ellipse(screen, BLACK, 
-                          [right_eye_x - self.eye_size//2, eye_y - self.eye_size//4, 
-                           self.eye_size, self.eye_size//2])
-        
-        # 口（微笑み）
-        mouth_y = self.y + 2 * TILE_SIZE // 3
-        pygame.draw.arc(screen, BLACK, 
-                      [center_x - self.eye_size * 1.5, mouth_y - self.eye_size, 
-                       self.eye_size * 3, self.eye_size * 2], 
-                      0, math.pi, 2)
-
-    def move_slime(self, game_map):
-        # ランダムに方向を変更する可能性
-        if random.random() < 0.2:  # 20%の確率で方向転換
-            self.direction = random.choice([(0, 1), (0, -1), (1, 0), (-1, 0)])
-
-        dx, dy = self.direction
-        new_grid_x = self.grid_x + dx
-        new_grid_y = self.grid_y + dy
-
-        if (0 <= new_grid_x < GRID_WIDTH and 
-            0 <= new_grid_y < GRID_HEIGHT and
-            game_map[new_grid_y][new_grid_x] == EMPTY):
-            
-            self.grid_x = new_grid_x
-            self.grid_y = new_grid_y
-            self.x = self.grid_x * TILE_SIZE
-            self.y = self.grid_y * TILE_SIZE
-        else:
-            # 壁にぶつかったら方向転換
-            self.direction = random.choice([(0, 1), (0, -1), (1, 0), (-1, 0)])
+# エンジンのイベント -> 効果音の名前
+EVENT_SOUNDS = {
+    EVENT_BOMB_PLACE: "bomb_place",
+    EVENT_EXPLOSION: "explosion",
+    EVENT_ITEM_PICKUP: "item_pickup",
+}
 
-    def move_chaser(self, game_map, player):
-        if player is None:
-            self.move_slime(game_map)
-            return
-            
-        # プレイヤーの方向を計算
-        dx = 1 if player.grid_x > self.grid_x else -1 if player.grid_x < self.grid_x else 0
-        dy = 1 if player.grid_y > self.grid_y else -1 if player.grid_y < self.grid_y else 0
-        
-        # 70%の確率でプレイヤーの方向に移動
-        if random.random() < 0.7:
-            # 水平か垂直のどちらかをランダムに選択
-            if random.choice([True, False]) and dx != 0:
-                self.try_move(dx, 0, game_map)
-            elif dy != 0:
-                self.try_move(0, dy, game_map)
-        else:
-            # ランダムな方向に移動
-            direction = random.choice([(0, 1), (0, -1), (1, 0), (-1, 0)])
-            self.try_move(direction[0], direction[1], game_map)
-
-    def move_smart(self, game_map, player, bombs):
-        # プレイヤーがいない場合や爆弾がない場合は通常の追跡
-        if player is None or bombs is None or len(bombs) == 0:
-            self.move_chaser(game_map, player)
-            return
-        
-        # 爆弾の爆発範囲内にいるかチェック
-        in_danger = False
-        bomb = bombs[0]  # 最初の爆弾を参照
-        
-        # 爆弾と同じ行にいる場合
-        if self.grid_y == bomb.y and abs(self.grid_x - bomb.x) <= bomb.explosion_range:
-            in_danger = True
-        # 爆弾と同じ列にいる場合
-        elif self.grid_x == bomb.x and abs(self.grid_y - bomb.y) <= bomb.explosion_range:
-            in_danger = True
-        
-        if in_danger:
-            # 安全な方向に逃げる
-            safe_directions = []
-            for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                new_x = self.grid_x + dx
-                new_y = self.grid_y + dy
-                
-                # 新しい位置が有効かチェック
-                if (0 <= new_x < len(game_map[0]) and 
-                    0 <= new_y < len(game_map) and 
-                    game_map[new_y][new_x] == EMPTY):
-                    
-                    # 新しい位置が爆発範囲内かチェック
-                    new_in_danger = False
-                    if new_y == bomb.y and abs(new_x - bomb.x) <= bomb.explosion_range:
-                        new_in_danger = True
-                    elif new_x == bomb.x and abs(new_y - bomb.y) <= bomb.explosion_range:
-                        new_in_danger = True
-                    
-                    if not new_in_danger:
-                        safe_directions.append((dx, dy))
-            
-            # 安全な方向があれば、ランダムに選択して移動
-            if safe_directions:
-                dx, dy = random.choice(safe_directions)
-                self.grid_x += dx
-                self.grid_y += dy
-                self.x = self.grid_x * TILE_SIZE
-                self.y = self.grid_y * TILE_SIZE
-                return
-        
-        # 危険がなければプレイヤーを追跡
-        self.move_chaser(game_map, player)
+def init():
+    global screen, sprites, renderer
 
-    def try_move(self, dx, dy, game_map):
-        new_grid_x = self.grid_x + dx
-        new_grid_y = self.grid_y + dy
+    # 初期化
+    pygame.init()
 
-        if (0 <= new_grid_x < GRID_WIDTH and 
-            0 <= new_grid_y < GRID_HEIGHT and
-            game_map[new_grid_y][new_grid_x] == EMPTY):
-            
-            self.grid_x = new_grid_x
-            self.grid_y = new_grid_y
-            self.x = self.grid_x * TILE_SIZE
-            self.y = self.grid_y * TILE_SIZE
-            return True
-        return False
-
-class Player:
-    def __init__(self, x, y):
-        self.grid_x = x // TILE_SIZE
-        self.grid_y = y // TILE_SIZE
-        self.x = self.grid_x * TILE_SIZE
-        self.y = self.grid_y * TILE_SIZE
-        self.size = TILE_SIZE
-        self.bombs = []
-        self.moving = False
-        self.move_cooldown = 0
-        self.move_delay = 10
-        self.bomb_range = 2
-        self.max_bombs = 1
-        self.speed_level = 1
-        self.alive = True
-        self.score = 0
-        # キャラクタータイプは常にロボット
-        self.character_type = 2
-
-    def draw(self):
-        if self.alive:
-            self.draw_robot()
+    # ゲーム画面の作成
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("ボンバーマン")
+
+    # スプライトの事前描画（画面作成後でないと convert できない）
+    sprites = SpriteAtlas()
+    renderer = DirtyRenderer()
+
+    # 音声機能の初期化（効果音はバックグラウンドで読み込む）
+    audio.start()
+
+def draw_bomb(bomb, now, camera):
+    if not bomb.exploded:
+        # 爆弾の本体（最後の1秒は点滅）
+        if camera.visible(bomb.x, bomb.y):
+            timer = bomb.time_left(now)
+            blink = timer < 60 and timer % 10 < 5
+            blit_sprite(sprites.bombs[blink], *camera.to_screen(bomb.x, bomb.y))
+        return
+
+    # 爆発の描画（爆発後かつエフェクト表示期間内の場合のみ）
+    frame = bomb.explosion_frame(now)
+    if frame < bomb.explosion_duration:
+        # 画面に映っている爆風のマスだけを描く
+        cells = [camera.to_screen(ex, ey) for ex, ey in bomb.explosions if camera.visible(ex, ey)]
+        # 爆発エフェクトは爆発開始直後のみ表示（最初の15フレーム）
+        if frame < EXPLOSION_FLASH_FRAMES:
+            for x, y in cells:
+                blit_sprite(visual_random.choice(sprites.explosion_flashes), x, y)
+
+        # 爆発範囲を赤色の半透明で表示（フェードアウト済みのタイルを転送するだけ）
+        tile = sprites.explosion_tiles[frame]
+        renderer.blits([(tile, pos) for pos in cells])
+
+def draw_explosion_flash(surface, x, y, offsets):
+    # 爆発の中心
+    center_x = x + TILE_SIZE // 2
+    center_y = y + TILE_SIZE // 2
+
+    # 複数の円を重ねて爆発エフェクトを作成
+    for i, color in enumerate(EXPLOSION_COLORS):
+        size = TILE_SIZE - (i * 8)
+        offset = offsets[i]  # ランダムなずれを加える
+        pos = (center_x + offset, center_y + offset)
+        pygame.draw.circle(surface, color, pos, size // 2)
+
+    # 十字の光線エフェクト
+    for color in EXPLOSION_COLORS:
+        for angle in [0, 90, 180, 270]:
+            start_pos = (center_x, center_y)
+            end_x = center_x + math.cos(math.radians(angle)) * TILE_SIZE//2
+            end_y = center_y + math.sin(math.radians(angle)) * TILE_SIZE//2
+            pygame.draw.line(surface, color, start_pos, (end_x, end_y), 2)
+
+def render_explosion_tile(frame):
+    # 爆発範囲の1マス分を、経過フレームに応じた透明度で描く
+    # 透明度を計算（徐々にフェードアウト）
+    current_alpha = int(EXPLOSION_ALPHA * (1 - frame / EXPLOSION_DURATION))
+    surface = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+    rect = surface.get_rect()
+    explosion_color = (EXPLOSION_RED[0], EXPLOSION_RED[1], EXPLOSION_RED[2], current_alpha)
+    pygame.draw.rect(surface, explosion_color, rect)
+
+    # 爆発範囲の境界線
+    border_color = (EXPLOSION_RED[0], EXPLOSION_RED[1], EXPLOSION_RED[2], min(255, current_alpha + 50))
+    pygame.draw.rect(surface, border_color, rect, 2)
+    return surface.convert_alpha()
+
+def draw_bomb_sprite(surface, x, y, blink):
+    # 爆弾の本体
+    center_x = x + TILE_SIZE // 2
+    center_y = y + TILE_SIZE // 2
+    radius = TILE_SIZE // 3
+
+    # 爆弾の本体（黒い円）
+    pygame.draw.circle(surface, BOMB_COLOR, (center_x, center_y), radius)
+
+    # 導火線
+    fuse_start = (center_x, center_y - radius)
+    fuse_end = (center_x + radius//2, center_y - radius * 1.5)
+    pygame.draw.line(surface, BOMB_COLOR, fuse_start, fuse_end, 3)
+
+    # ハイライト（光の反射）
+    highlight_pos = (center_x - radius//3, center_y - radius//3)
+    pygame.draw.circle(surface, BOMB_HIGHLIGHT, highlight_pos, radius//4)
+
+    # タイマーに応じて点滅効果
+    if blink:
+        pygame.draw.circle(surface, RED, (center_x, center_y), radius, 2)
+
+def blit_sprite(sprite, x, y):
+    # スプライトは周囲に余白があるので、その分ずらして転送
+    renderer.blit(sprite, (x - SPRITE_PAD, y - SPRITE_PAD))
+
+def slime_frame():
+    # 現在時刻からスライムの跳ねるアニメーションのコマ番号を求める
+    phase = pygame.time.get_ticks() * SLIME_BOUNCE_SPEED / (2 * math.pi)
+    return int(phase * SLIME_FRAMES) % SLIME_FRAMES
+
+def random_lights():
+    # ロボットのライトの色をランダムに選ぶ（ROBOT_LIGHT_COLORS のインデックス）
+    return tuple(visual_random.randrange(len(ROBOT_LIGHT_COLORS)) if visual_random.random() > 0.7 else ROBOT_LIGHT_GREEN
+                 for _ in range(3))
+
+def draw_enemy(enemy, camera):
+    frames = sprites.enemies[enemy.enemy_type]
+    frame = frames[slime_frame() % len(frames)]
+    blit_sprite(frame, *camera.to_screen(enemy.grid_x, enemy.grid_y))
+
+def draw_player(player, camera):
+    if player.alive:
+        blit_sprite(sprites.robots[random_lights()], *camera.to_screen(player.grid_x, player.grid_y))
+
+def draw_slime(surface, x, y, color, bounce_offset):
+    eye_size = ENEMY_EYE_SIZE
+
+    # スライムの体（円）
+    center_x = x + TILE_SIZE // 2
+    center_y = y + TILE_SIZE // 2 + bounce_offset
+    radius = TILE_SIZE // 2 - 2
+
+    # スライムの体を描画
+    pygame.draw.circle(surface, color, (center_x, center_y), radius)
+
+    # スライムの目（白い部分）
+    eye_offset_x = 3
+    eye_offset_y = -2 + bounce_offset // 2
+    pygame.draw.circle(surface, WHITE,
+                     (center_x - eye_offset_x, center_y + eye_offset_y),
+                     eye_size)
+    pygame.draw.circle(surface, WHITE,
+                     (center_x + eye_offset_x, center_y + eye_offset_y),
+                     eye_size)
+
+    # 瞳（黒い部分）
+    pupil_size = eye_size // 2
+    pygame.draw.circle(surface, BLACK,
+                     (center_x - eye_offset_x, center_y + eye_offset_y),
+                     pupil_size)
+    pygame.draw.circle(surface, BLACK,
+                     (center_x + eye_offset_x, center_y + eye_offset_y),
+                     pupil_size)
+
+    # スライムの口
+    mouth_y = center_y + eye_size + 2
+    pygame.draw.arc(surface, (0, 50, 200),
+                  [center_x - eye_size, mouth_y,
+                   eye_size * 2, eye_size],
+                  0, math.pi, 2)
+
+def draw_chaser(surface, x, y, color):
+    # 追跡者の体（四角形）
+    rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
+    pygame.draw.rect(surface, color, rect)
+
+    # 目（怒った表情）
+    eye_size = ENEMY_EYE_SIZE
+    eye_y = y + TILE_SIZE // 3
+    left_eye_x = x + TILE_SIZE // 3 - 2
+    right_eye_x = x + 2 * TILE_SIZE // 3 + 2
+
+    # 白目
+    pygame.draw.circle(surface, WHITE, (left_eye_x, eye_y), eye_size)
+    pygame.draw.circle(surface, WHITE, (right_eye_x, eye_y), eye_size)
+
+    # 黒目（プレイヤーを見る方向に少しずらす）
+    pupil_offset = 2
+    pygame.draw.circle(surface, BLACK, (left_eye_x + pupil_offset, eye_y), eye_size // 2)
+    pygame.draw.circle(surface, BLACK, (right_eye_x + pupil_offset, eye_y), eye_size // 2)
+
+    # 口（怒った表情）
+    mouth_y = y + 2 * TILE_SIZE // 3
+    pygame.draw.line(surface, BLACK,
+                   (x + TILE_SIZE // 3, mouth_y),
+                   (x + 2 * TILE_SIZE // 3, mouth_y),
+                   2)
+
+def draw_smart(surface, x, y, color):
+    eye_size = ENEMY_EYE_SIZE
+
+    # 賢い敵の体（三角形）
+    center_x = x + TILE_SIZE // 2
+    center_y = y + TILE_SIZE // 2
+
+    # 三角形の頂点
+    triangle_points = [
+        (center_x, y + 5),  # 上
+        (x + 5, y + TILE_SIZE - 5),  # 左下
+        (x + TILE_SIZE - 5, y + TILE_SIZE - 5)  # 右下
+    ]
+
+    # 三角形の体を描画
+    pygame.draw.polygon(surface, color, triangle_points)
+
+    # 目（賢そうな表情）
+    eye_y = y + TILE_SIZE // 3
+    left_eye_x = x + TILE_SIZE // 3
+    right_eye_x = x + 2 * TILE_SIZE // 3
+
+    # 白目
+    pygame.draw.circle(surface, WHITE, (left_eye_x, eye_y), eye_size)
+    pygame.draw.circle(surface, WHITE, (right_eye_x, eye_y), eye_size)
+
+    # 黒目（細い目）
+    pygame.draw.ellipse(surface, BLACK,
+                      [left_eye_x - eye_size//2, eye_y - eye_size//4,
+                       eye_size, eye_size//2])
+    pygame.draw.ellipse(surface, BLACK,
+                      [right_eye_x - eye_size//2, eye_y - eye_size//4,
+                       eye_size, eye_size//2])
+
+    # 口（微笑み）
+    mouth_y = y + 2 * TILE_SIZE // 3
+    pygame.draw.arc(surface, BLACK,
+                  [center_x - eye_size * 1.5, mouth_y - eye_size,
+                   eye_size * 3, eye_size * 2],
+                  0, math.pi, 2)
+
+def draw_robot(surface, x, y, lights):
+    size = TILE_SIZE
+
+    # 頭部（丸い形）
+    head_size = size // 3
+    head_x = x + size // 2
+    head_y = y + head_size
+    pygame.draw.circle(surface, DARK_GRAY, (head_x, head_y), head_size)
+
+    # 目（光るLED）
+    eye_size = 3
+    pygame.draw.circle(surface, BLUE, (head_x - 5, head_y - 2), eye_size)
+    pygame.draw.circle(surface, BLUE, (head_x + 5, head_y - 2), eye_size)
+
+    # アンテナ
+    antenna_top = (head_x, y + 2)
+    pygame.draw.line(surface, BLACK, (head_x, head_y - head_size), antenna_top, 2)
+    pygame.draw.circle(surface, RED, antenna_top, 3)
+
+    # 胴体（透明な背景に金属パーツ）
+    # 胸部プレート
+    chest_rect = pygame.Rect(x + 8, y + size // 2 - 5,
+                           size - 16, size // 4)
+    pygame.draw.rect(surface, GRAY, chest_rect)
+
+    # 腕（左右）
+    arm_width = 4
+    # 左腕
+    pygame.draw.line(surface, GRAY,
+                   (x + 8, y + size // 2),
+                   (x + 2, y + size // 2 + 10),
+                   arm_width)
+    # 右腕
+    pygame.draw.line(surface, GRAY,
+                   (x + size - 8, y + size // 2),
+                   (x + size - 2, y + size // 2 + 10),
+                   arm_width)
+
+    # 脚（左右）
+    leg_width = 5
+    # 左脚
+    pygame.draw.line(surface, GRAY,
+                   (x + size // 3, y + 3 * size // 4),
+                   (x + size // 4, y + size - 2),
+                   leg_width)
+    # 右脚
+    pygame.draw.line(surface, GRAY,
+                   (x + 2 * size // 3, y + 3 * size // 4),
+                   (x + 3 * size // 4, y + size - 2),
+                   leg_width)
+
+    # ボタンやライト
+    for i, light_color in enumerate(lights):
+        light_x = x + 12 + i * 8
+        light_y = y + size // 2 + 5
+        pygame.draw.circle(surface, light_color, (light_x, light_y), 2)
+
+def draw_power_up(surface, x, y):
+    # 火力アップアイテム（炎のデザイン）
+    center_x = x + TILE_SIZE // 2
+    center_y = y + TILE_SIZE // 2
     
-    def draw_robot(self):
-        # 基本的な体（メタリックな四角形）- 背景は透明
-        center_x = self.x + self.size // 2
-        center_y = self.y + self.size // 2
-        
-        # 頭部（丸い形）
-        head_size = self.size // 3
-        head_x = self.x + self.size // 2
-        head_y = self.y + head_size
-        pygame.draw.circle(screen, DARK_GRAY, (head_x, head_y), head_size)
-        
-        # 目（光るLED）
-        eye_size = 3
-        pygame.draw.circle(screen, BLUE, (head_x - 5, head_y - 2), eye_size)
-        pygame.draw.circle(screen, BLUE, (head_x + 5, head_y - 2), eye_size)
-        
-        # アンテナ
-        antenna_top = (head_x, self.y + 2)
-        pygame.draw.line(screen, BLACK, (head_x, head_y - head_size), antenna_top, 2)
-        pygame.draw.circle(screen, RED, antenna_top, 3)
-        
-        # 胴体（透明な背景に金属パーツ）
-        # 胸部プレート
-        chest_rect = pygame.Rect(self.x + 8, self.y + self.size // 2 - 5, 
-                               self.size - 16, self.size // 4)
-        pygame.draw.rect(screen, GRAY, chest_rect)
-        
-        # 腕（左右）
-        arm_width = 4
-        # 左腕
-        pygame.draw.line(screen, GRAY, 
-                       (self.x + 8, self.y + self.size // 2), 
-                       (self.x + 2, self.y + self.size // 2 + 10), 
-                       arm_width)
-        # 右腕
-        pygame.draw.line(screen, GRAY, 
-                       (self.x + self.size - 8, self.y + self.size // 2), 
-                       (self.x + self.size - 2, self.y + self.size // 2 + 10), 
-                       arm_width)
+    # 炎の形を描く
+    flame_points = [
+        (center_x, center_y - TILE_SIZE//3),  # 上部
+        (center_x + TILE_SIZE//4, center_y),  # 右
+        (center_x, center_y + TILE_SIZE//4),  # 下
+        (center_x - TILE_SIZE//4, center_y),  # 左
+    ]
+    pygame.draw.polygon(surface, POWER_UP_COLOR, flame_points)
+    # 内側の炎
+    small_flame_points = [
+        (center_x, center_y - TILE_SIZE//4),
+        (center_x + TILE_SIZE//6, center_y),
+        (center_x, center_y + TILE_SIZE//6),
+        (center_x - TILE_SIZE//6, center_y),
+    ]
+    pygame.draw.polygon(surface, POWER_UP_GLOW, small_flame_points)
+
+def draw_speed_up(surface, x, y):
+    # スピードアップアイテム（稲妻デザイン）
+    center_x = x + TILE_SIZE // 2
+    center_y = y + TILE_SIZE // 2
+    
+    # 稲妻の描画
+    lightning_points = [
+        (center_x - TILE_SIZE//3, center_y - TILE_SIZE//3),  # 開始点
+        (center_x, center_y - TILE_SIZE//6),                  # 第1折れ点
+        (center_x - TILE_SIZE//6, center_y + TILE_SIZE//6),  # 第2折れ点
+        (center_x + TILE_SIZE//3, center_y + TILE_SIZE//3)   # 終点
+    ]
+    # 稲妻の外側（輝き）
+    pygame.draw.lines(surface, SPEED_UP_GLOW, False, lightning_points, 5)
+    # 稲妻の内側（本体）
+    pygame.draw.lines(surface, SPEED_UP_COLOR, False, lightning_points, 2)
+
+def draw_bomb_up(surface, x, y):
+    # ボム増加アイテム（ボムのような見た目）
+    center_x = x + TILE_SIZE // 2
+    center_y = y + TILE_SIZE // 2
+    # 外側の光る円
+    pygame.draw.circle(surface, BOMB_UP_GLOW, (center_x, center_y), TILE_SIZE//2 - 4)
+    # ボムの形
+    pygame.draw.circle(surface, BOMB_UP_COLOR, (center_x, center_y), TILE_SIZE//3)
+    # 導火線
+    pygame.draw.line(surface, BOMB_UP_COLOR,
+                   (center_x, center_y - TILE_SIZE//3),
+                   (center_x + TILE_SIZE//4, center_y - TILE_SIZE//2), 2)
+
+def render_sprite(draw_func, *args):
+    # 余白付きの透明サーフェスに1マス分の絵を描く
+    surface = pygame.Surface((TILE_SIZE + SPRITE_PAD * 2, TILE_SIZE + SPRITE_PAD * 2), pygame.SRCALPHA)
+    draw_func(surface, SPRITE_PAD, SPRITE_PAD, *args)
+    return surface.convert_alpha()
+
+class SpriteAtlas:
+    # 敵・プレイヤー・爆弾・アイテムを起動時に一度だけ描画しておくキャッシュ
+    # 毎フレームの描画はここから1回blitするだけになる
+    def __init__(self):
+        # スライムは跳ねるアニメーションのコマを用意
+        slime_frames = []
+        for i in range(SLIME_FRAMES):
+            bounce_offset = math.sin(2 * math.pi * i / SLIME_FRAMES) * 5
+            slime_frames.append(render_sprite(draw_slime, ENEMY_COLORS[ENEMY_SLIME], bounce_offset))
+        self.enemies = {
+            ENEMY_SLIME: slime_frames,
+            ENEMY_CHASER: [render_sprite(draw_chaser, ENEMY_COLORS[ENEMY_CHASER])],
+            ENEMY_SMART: [render_sprite(draw_smart, ENEMY_COLORS[ENEMY_SMART])],
+        }
+
+        # ロボットはライトの色の組み合わせごとに用意
+        self.robots = {}
+        for lights in itertools.product(range(len(ROBOT_LIGHT_COLORS)), repeat=3):
+            colors = [ROBOT_LIGHT_COLORS[i] for i in lights]
+            self.robots[lights] = render_sprite(draw_robot, colors)
+
+        # 爆弾は通常時と点滅時
+        self.bombs = {
+            False: render_sprite(draw_bomb_sprite, False),
+            True: render_sprite(draw_bomb_sprite, True),
+        }
+
+        self.items = {
+            POWER_UP: render_sprite(draw_power_up),
+            SPEED_UP: render_sprite(draw_speed_up),
+            BOMB_UP: render_sprite(draw_bomb_up),
+        }
+
+        # 爆発範囲のタイルは経過フレームごとの透明度で用意
+        self.explosion_tiles = [render_explosion_tile(frame) for frame in range(EXPLOSION_DURATION)]
+        # 爆発直後の閃光は、ずれ方の違うものをいくつか用意してランダムに使う
+        self.explosion_flashes = []
+        for _ in range(EXPLOSION_FLASH_VARIANTS):
+            offsets = [visual_random.randint(-2, 2) for _ in EXPLOSION_COLORS]
+            self.explosion_flashes.append(render_sprite(draw_explosion_flash, offsets))
+
+def draw_map(game_map, surface=None, camera=None):
+    # マップを描画（通常は MapLayer の事前描画に使う）
+    # camera を渡すと画面に映る範囲だけを、画面の左上を原点にして描く
+    if surface is None:
+        surface = screen
+    if camera is None:
+        camera = Camera(game_map.width, game_map.height, game_map.width, game_map.height)
+    for y in range(camera.y, camera.y + camera.height):
+        row = game_map[y]
+        for x in range(camera.x, camera.x + camera.width):
+            draw_tile(surface, x - camera.x, y - camera.y, row[x])
+
+def draw_tile(surface, x, y, tile):
+    rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+    if tile == WALL:
+        # 壊れないブロック（石ブロック風）
+        pygame.draw.rect(surface, STONE_COLOR, rect)
+        # 石のテクスチャを表現する線
+        pygame.draw.line(surface, DARK_GRAY, 
+                       (x * TILE_SIZE, y * TILE_SIZE), 
+                       (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE), 2)
+        pygame.draw.line(surface, DARK_GRAY, 
+                       (x * TILE_SIZE, y * TILE_SIZE), 
+                       (x * TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 2)
+        # 影の効果を追加
+        pygame.draw.line(surface, DARK_GRAY, 
+                       (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE), 
+                       (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 1)
+        pygame.draw.line(surface, DARK_GRAY, 
+                       (x * TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 
+                       (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 1)
         
-        # 脚（左右）
-        leg_width = 5
-        # 左脚
-        pygame.draw.line(screen, GRAY, 
-                       (self.x + self.size // 3, self.y + 3 * self.size // 4), 
-                       (self.x + self.size // 4, self.y + self.size - 2), 
-                       leg_width)
-        # 右脚
-        pygame.draw.line(screen, GRAY, 
-                       (self.x + 2 * self.size // 3, self.y + 3 * self.size // 4), 
-                       (self.x + 3 * self.size // 4, self.y + self.size - 2), 
-                       leg_width)
+    elif tile == BLOCK:
+        # 壊れるブロック（レンガ風）
+        pygame.draw.rect(surface, BRICK_COLOR, rect)
+        # レンガのパターンを描画
+        pygame.draw.line(surface, BRICK_LINES,
+                       (x * TILE_SIZE, y * TILE_SIZE + TILE_SIZE//2),
+                       (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE + TILE_SIZE//2), 1)
+        pygame.draw.line(surface, BRICK_LINES,
+                       (x * TILE_SIZE + TILE_SIZE//2, y * TILE_SIZE),
+                       (x * TILE_SIZE + TILE_SIZE//2, y * TILE_SIZE + TILE_SIZE), 1)
+        # 影の効果を追加
+        pygame.draw.rect(surface, BRICK_LINES, 
+                       (x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE), 1)
         
-        # ボタンやライト
-        for i in range(3):
-            light_x = self.x + 12 + i * 8
-            light_y = self.y + self.size // 2 + 5
-            light_color = random.choice([RED, GREEN, YELLOW, BLUE]) if random.random() > 0.7 else GREEN
-            pygame.draw.circle(screen, light_color, (light_x, light_y), 2)
-
-    def move(self, dx, dy, game_map):
-        if not self.alive or self.move_cooldown > 0:
-            self.move_cooldown -= 1
+    elif tile in ITEMS:
+        # アイテムはスプライトから転送
+        surface.blit(sprites.items[tile], (x * TILE_SIZE - SPRITE_PAD, y * TILE_SIZE - SPRITE_PAD))
+
+class Camera:
+    # 画面に映すマップの範囲（マス単位）
+    # プレイヤーが中央に来るように追いかけ、マップの端では止まる
+    def __init__(self, map_width, map_height, width=VIEW_WIDTH, height=VIEW_HEIGHT):
+        self.map_width = map_width
+        self.map_height = map_height
+        self.width = min(width, map_width)
+        self.height = min(height, map_height)
+        self.x = 0
+        self.y = 0
+
+    def follow(self, x, y):
+        # (x, y) のマスが中央に来るように動かし、動いたマス数を返す
+        new_x = min(max(x - self.width // 2, 0), self.map_width - self.width)
+        new_y = min(max(y - self.height // 2, 0), self.map_height - self.height)
+        dx, dy = new_x - self.x, new_y - self.y
+        self.x, self.y = new_x, new_y
+        return dx, dy
+
+    def visible(self, x, y):
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+    def to_screen(self, x, y):
+        return (x - self.x) * TILE_SIZE, (y - self.y) * TILE_SIZE
+
+class MapLayer:
+    # 壁・ブロック・アイテムを事前描画した背景サーフェス（画面に映る範囲の分だけ）
+    # 毎フレームは1回blitするだけで、変化したマスだけを描き直す
+    # カメラが動いたときはサーフェスをずらし、新しく映ったマスだけを描く
+    def __init__(self, state):
+        self.state = state
+        game_map = state.game_map
+        self.camera = Camera(game_map.width, game_map.height)
+        self.camera.follow(state.player.grid_x, state.player.grid_y)
+        self.surface = pygame.Surface((self.camera.width * TILE_SIZE, self.camera.height * TILE_SIZE))
+        self.redraw()
+
+    def redraw(self):
+        self.surface.fill(BLACK)
+        draw_map(self.state.game_map, self.surface, self.camera)
+        self.state.dirty_cells.clear()
+
+    def draw_cell(self, x, y):
+        # マップの (x, y) のマスを描き直し、描き直した矩形を返す
+        game_map = self.state.game_map
+        camera = self.camera
+        rect = pygame.Rect(*camera.to_screen(x, y), TILE_SIZE, TILE_SIZE)
+        self.surface.fill(BLACK, rect)
+        draw_tile(self.surface, x - camera.x, y - camera.y, game_map[y][x])
+        # 壁の影線は右・下の隣マスにはみ出しているので、左・上の壁を描き直す（画面外の壁も影だけは映る）
+        for nx, ny in ((x - 1, y), (x, y - 1)):
+            if game_map.in_bounds(nx, ny) and game_map[ny][nx] == WALL:
+                draw_tile(self.surface, nx - camera.x, ny - camera.y, WALL)
+        return rect
+
+    def scroll(self, dx, dy):
+        # カメラが (dx, dy) マス動いた分だけ背景をずらし、端に新しく映ったマスを描く
+        camera = self.camera
+        if abs(dx) >= camera.width or abs(dy) >= camera.height:
+            self.redraw()
             return
+        self.surface.scroll(-dx * TILE_SIZE, -dy * TILE_SIZE)
+        columns = range(camera.width - dx, camera.width) if dx > 0 else range(-dx)
+        rows = range(camera.height - dy, camera.height) if dy > 0 else range(-dy)
+        for vy in range(camera.height):
+            for vx in (range(camera.width) if vy in rows else columns):
+                self.draw_cell(camera.x + vx, camera.y + vy)
 
-        new_grid_x = self.grid_x + dx
-        new_grid_y = self.grid_y + dy
+    def update(self):
+        # エンジンが書き換えたマスのうち画面に映るものだけを描き直し、描き直した矩形を返す
+        # 画面外のマスはカメラが動いて映ったときに描かれる
+        camera = self.camera
+        rects = [self.draw_cell(x, y) for x, y in self.state.dirty_cells if camera.visible(x, y)]
+        self.state.dirty_cells.clear()
+        return rects
 
-        if (0 <= new_grid_x < GRID_WIDTH and 
-            0 <= new_grid_y < GRID_HEIGHT and
-            game_map[new_grid_y][new_grid_x] != WALL and
-            game_map[new_grid_y][new_grid_x] != BLOCK and
-            game_map[new_grid_y][new_grid_x] != BOMB):  # 爆弾もすり抜けられないように追加
-            
-            self.grid_x = new_grid_x
-            self.grid_y = new_grid_y
-            self.x = self.grid_x * TILE_SIZE
-            self.y = self.grid_y * TILE_SIZE
-            
-            # アイテム取得
-            if game_map[new_grid_y][new_grid_x] in [POWER_UP, SPEED_UP, BOMB_UP]:
-                self.collect_item(game_map[new_grid_y][new_grid_x])
-                game_map[new_grid_y][new_grid_x] = EMPTY
-
-            self.move_cooldown = max(5, self.move_delay - (self.speed_level - 1) * 2)
-
-    def place_bomb(self, game_map):
-        if not self.alive:
-            return None
-        if len(self.bombs) < self.max_bombs and game_map[self.grid_y][self.grid_x] != BOMB:
-            bomb = Bomb(self.grid_x, self.grid_y, self.bomb_range)
-            self.bombs.append(bomb)
-            game_map[self.grid_y][self.grid_x] = BOMB
-            if sound_enabled:
-                bomb_place_sound.play()
-            return bomb
-        return None
-
-    def collect_item(self, item_type):
-        if item_type == POWER_UP:
-            self.bomb_range += 1
-            self.score += 100
-        elif item_type == SPEED_UP:
-            self.speed_level += 1
-            self.score += 100
-        elif item_type == BOMB_UP:
-            self.max_bombs += 1
-            self.score += 100
-        
-        # アイテム取得時に音を再生
-        if sound_enabled:
-            item_pickup_sound.play()
+class DirtyRenderer:
+    # 前フレームから変化した矩形だけを display.update で画面に送る
+    # 毎フレーム、前回描いた部分を背景で塗り直してから全スプライトを描き直し、
+    # (サーフェス, 位置) が前フレームと違うものだけを更新対象にする
+    def __init__(self):
+        self.items = []  # 今フレームで描いた (サーフェス, 矩形)
+        self.prev_items = []  # 前フレームで描いた (サーフェス, 矩形)
+        self.extra_rects = []  # 背景が変わった矩形
+        self.full_redraw = True
 
-def create_map(stage_num=1):
-    game_map = [[EMPTY for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-    
-    # 外壁の配置
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            if x == 0 or x == GRID_WIDTH-1 or y == 0 or y == GRID_HEIGHT-1:
-                game_map[y][x] = WALL
-
-    # ステージに応じてブロックの配置密度を変更
-    block_density = 0.2 + (stage_num * 0.1)  # ステージが上がるごとにブロックが増える
-    
-    # ブロックをランダムに配置
-    for y in range(2, GRID_HEIGHT-2):
-        for x in range(2, GRID_WIDTH-2):
-            if random.random() < block_density:
-                game_map[y][x] = BLOCK
-
-    # プレイヤーの初期位置を確保
-    game_map[1][1] = EMPTY
-    game_map[1][2] = EMPTY
-    game_map[2][1] = EMPTY
-
-    # アイテムをランダムに配置
-    items = 0
-    max_items = 3 + stage_num  # ステージごとにアイテム数が増える
-    while items < max_items:
-        x = random.randint(1, GRID_WIDTH-2)
-        y = random.randint(1, GRID_HEIGHT-2)
-        if game_map[y][x] == BLOCK:
-            item_type = random.choice([POWER_UP, SPEED_UP, BOMB_UP])
-            game_map[y][x] = item_type
-            items += 1
-    
-    return game_map
-
-def draw_map(game_map):
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-            if game_map[y][x] == WALL:
-                # 壊れないブロック（石ブロック風）
-                pygame.draw.rect(screen, STONE_COLOR, rect)
-                # 石のテクスチャを表現する線
-                pygame.draw.line(screen, DARK_GRAY, 
-                               (x * TILE_SIZE, y * TILE_SIZE), 
-                               (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE), 2)
-                pygame.draw.line(screen, DARK_GRAY, 
-                               (x * TILE_SIZE, y * TILE_SIZE), 
-                               (x * TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 2)
-                # 影の効果を追加
-                pygame.draw.line(screen, DARK_GRAY, 
-                               (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE), 
-                               (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 1)
-                pygame.draw.line(screen, DARK_GRAY, 
-                               (x * TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 
-                               (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE + TILE_SIZE), 1)
-                
-            elif game_map[y][x] == BLOCK:
-                # 壊れるブロック（レンガ風）
-                pygame.draw.rect(screen, BRICK_COLOR, rect)
-                # レンガのパターンを描画
-                pygame.draw.line(screen, BRICK_LINES,
-                               (x * TILE_SIZE, y * TILE_SIZE + TILE_SIZE//2),
-                               (x * TILE_SIZE + TILE_SIZE, y * TILE_SIZE + TILE_SIZE//2), 1)
-                pygame.draw.line(screen, BRICK_LINES,
-                               (x * TILE_SIZE + TILE_SIZE//2, y * TILE_SIZE),
-                               (x * TILE_SIZE + TILE_SIZE//2, y * TILE_SIZE + TILE_SIZE), 1)
-                # 影の効果を追加
-                pygame.draw.rect(screen, BRICK_LINES, 
-                               (x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE), 1)
-                
-            elif game_map[y][x] == POWER_UP:
-                # 火力アップアイテム（炎のデザイン）
-                center_x = x * TILE_SIZE + TILE_SIZE // 2
-                center_y = y * TILE_SIZE + TILE_SIZE // 2
-                
-                # 炎の形を描く
-                flame_points = [
-                    (center_x, center_y - TILE_SIZE//3),  # 上部
-                    (center_x + TILE_SIZE//4, center_y),  # 右
-                    (center_x, center_y + TILE_SIZE//4),  # 下
-                    (center_x - TILE_SIZE//4, center_y),  # 左
-                ]
-                pygame.draw.polygon(screen, POWER_UP_COLOR, flame_points)
-                # 内側の炎
-                small_flame_points = [
-                    (center_x, center_y - TILE_SIZE//4),
-                    (center_x + TILE_SIZE//6, center_y),
-                    (center_x, center_y + TILE_SIZE//6),
-                    (center_x - TILE_SIZE//6, center_y),
-                ]
-                pygame.draw.polygon(screen, POWER_UP_GLOW, small_flame_points)
-                
-            elif game_map[y][x] == SPEED_UP:
-                # スピードアップアイテム（稲妻デザイン）
-                center_x = x * TILE_SIZE + TILE_SIZE // 2
-                center_y = y * TILE_SIZE + TILE_SIZE // 2
-                
-                # 稲妻の描画
-                lightning_points = [
-                    (center_x - TILE_SIZE//3, center_y - TILE_SIZE//3),  # 開始点
-                    (center_x, center_y - TILE_SIZE//6),                  # 第1折れ点
-                    (center_x - TILE_SIZE//6, center_y + TILE_SIZE//6),  # 第2折れ点
-                    (center_x + TILE_SIZE//3, center_y + TILE_SIZE//3)   # 終点
-                ]
-                # 稲妻の外側（輝き）
-                pygame.draw.lines(screen, SPEED_UP_GLOW, False, lightning_points, 5)
-                # 稲妻の内側（本体）
-                pygame.draw.lines(screen, SPEED_UP_COLOR, False, lightning_points, 2)
-                
-            elif game_map[y][x] == BOMB_UP:
-                # ボム増加アイテム（ボムのような見た目）
-                center_x = x * TILE_SIZE + TILE_SIZE // 2
-                center_y = y * TILE_SIZE + TILE_SIZE // 2
-                # 外側の光る円
-                pygame.draw.circle(screen, BOMB_UP_GLOW, (center_x, center_y), TILE_SIZE//2 - 4)
-                # ボムの形
-                pygame.draw.circle(screen, BOMB_UP_COLOR, (center_x, center_y), TILE_SIZE//3)
-                # 導火線
-                pygame.draw.line(screen, BOMB_UP_COLOR,
-                               (center_x, center_y - TILE_SIZE//3),
-                               (center_x + TILE_SIZE//4, center_y - TILE_SIZE//2), 2)
-
-def check_explosion(bomb, game_map, player, enemies):
-    directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-    explosions = [(bomb.x, bomb.y)]
-    
-    # プレイヤーの死亡判定
-    if player.alive and (player.grid_x, player.grid_y) == (bomb.x, bomb.y):
-        player.alive = False
-
-    for dx, dy in directions:
-        for r in range(1, bomb.explosion_range + 1):
-            x = bomb.x + (dx * r)
-            y = bomb.y + (dy * r)
-            
-            if (0 <= x < GRID_WIDTH and 0 <= y < GRID_HEIGHT):
-                if game_map[y][x] == WALL:
-                    break
-                if game_map[y][x] == BLOCK:
-                    game_map[y][x] = EMPTY
-                    player.score += 50
-                    explosions.append((x, y))  # 壊れるブロックも爆発範囲に含める
-                    break
+    def invalidate(self):
+        # 次のフレームは画面全体を描き直す
+        self.full_redraw = True
+        self.items = []
 
-                # プレイヤーの死亡判定
-                if player.alive and (player.grid_x, player.grid_y) == (x, y):
-                    player.alive = False
+    def blit(self, surface, pos):
+        rect = screen.blit(surface, pos)
+        self.items.append((surface, rect))
+        return rect
 
-                # 敵の死亡判定
-                for enemy in enemies[:]:
-                    if (enemy.grid_x, enemy.grid_y) == (x, y):
-                        enemies.remove(enemy)
-                        player.score += 200
+    def blits(self, sequence):
+        rects = screen.blits(sequence)
+        self.items.extend((surface, rect) for (surface, _), rect in zip(sequence, rects))
+        return rects
 
-                explosions.append((x, y))
-            else:
-                break
-    
-    bomb.explosions = explosions
-    bomb.exploded = True
-    if sound_enabled:
-        bomb_explosion_sound.play()
-    return explosions
+    def restore(self, background, changed_rects=()):
+        # 前フレームで描いた部分と、背景が変わった部分を背景で塗り直す
+        # 背景が画面より小さい（狭いマップ）ときは、背景の外を黒で塗る
+        if self.full_redraw:
+            if background.get_size() != screen.get_size():
+                screen.fill(BLACK)
+            screen.blit(background, (0, 0))
+            return
+        bounds = background.get_rect()
+        for _, rect in self.prev_items:
+            self.restore_rect(background, bounds, rect)
+        for rect in changed_rects:
+            self.restore_rect(background, bounds, rect)
+        self.extra_rects.extend(changed_rects)
+
+    def restore_rect(self, background, bounds, rect):
+        if not bounds.contains(rect):
+            screen.fill(BLACK, rect)
+        screen.blit(background, rect, rect)
+
+    def present(self):
+        if self.full_redraw or not USE_DIRTY_RECTS:
+            pygame.display.flip()
+        else:
+            prev = {(id(surface), tuple(rect)) for surface, rect in self.prev_items}
+            current = {(id(surface), tuple(rect)) for surface, rect in self.items}
+            rects = [rect for surface, rect in self.items if (id(surface), tuple(rect)) not in prev]
+            rects += [rect for surface, rect in self.prev_items if (id(surface), tuple(rect)) not in current]
+            rects += self.extra_rects
+            if rects:
+                pygame.display.update(rects)
+        self.prev_items = self.items
+        self.items = []
+        self.extra_rects = []
+        self.full_redraw = False
+
+class StagePreloader:
+    # 次のステージの GameState（マップと敵の配置）をワーカースレッドで作っておく
+    def __init__(self, stage, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.stage = stage
+        self.width = width
+        self.height = height
+        self.state = None
+        self.thread = threading.Thread(target=self.build, daemon=True)
+        self.thread.start()
+
+    def build(self):
+        self.state = GameState(self.stage, None, None, self.width, self.height)
+
+    def take(self):
+        # 作り終わっていなければ待ってから返す
+        self.thread.join()
+        return self.state
+
+def get_font(size):
+    # フォントはサイズごとに一度だけ読み込む
+    font = fonts.get(size)
+    if font is None:
+        font = pygame.font.SysFont(None, size)
+        fonts[size] = font
+    return font
+
+def render_text(text, size=FONT_SMALL, color=WHITE):
+    # 描画済みの文字列を (文字列, サイズ, 色) で再利用する（古いものから捨てるLRU）
+    key = (text, size, color)
+    surface = text_cache.get(key)
+    if surface is not None:
+        text_cache.move_to_end(key)
+        return surface
+    surface = get_font(size).render(text, True, color)
+    text_cache[key] = surface
+    if len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)
+    return surface
+
+def blit_centered(surface, y):
+    # 画面の横中央に配置
+    renderer.blit(surface, (SCREEN_WIDTH // 2 - surface.get_width() // 2, y))
 
 def draw_game_info(player, stage):
-    # スコア表示
-    score_text = font.render(f"Score: {player.score}", True, WHITE)
-    screen.blit(score_text, (10, 10))
-    
-    # ステージ表示
-    stage_text = font.render(f"Stage: {stage}", True, WHITE)
-    screen.blit(stage_text, (SCREEN_WIDTH - 120, 10))
-    
-    # パワーアップ状態表示
-    power_text = font.render(f"Range: {player.bomb_range}", True, WHITE)
-    speed_text = font.render(f"Speed: {player.speed_level}", True, WHITE)
-    bombs_text = font.render(f"Bombs: {player.max_bombs}", True, WHITE)
-    
-    screen.blit(power_text, (10, SCREEN_HEIGHT - 90))
-    screen.blit(speed_text, (10, SCREEN_HEIGHT - 60))
-    screen.blit(bombs_text, (10, SCREEN_HEIGHT - 30))
+    # スコアとステージ情報の表示
+    renderer.blit(render_text(f"Score: {player.score}"), (10, 10))
+    renderer.blit(render_text(f"Stage: {stage}"), (SCREEN_WIDTH - 150, 10))
+
+    # プレイヤーのステータス表示
+    renderer.blit(render_text(f"Bombs: {player.max_bombs}"), (10, SCREEN_HEIGHT - 90))
+    renderer.blit(render_text(f"Range: {player.bomb_range}"), (10, SCREEN_HEIGHT - 60))
+    renderer.blit(render_text(f"Speed: {player.speed_level}"), (10, SCREEN_HEIGHT - 30))
 
 def game_over_screen():
-    text = font.render("GAME OVER - Press SPACE to restart", True, WHITE)
+    text = render_text("GAME OVER - Press SPACE to restart")
     text_rect = text.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2))
-    screen.blit(text, text_rect)
+    renderer.blit(text, text_rect)
 
 def stage_clear_screen(stage):
-    text = font.render(f"STAGE {stage} CLEAR! - Press SPACE to continue", True, WHITE)
+    text = render_text(f"STAGE {stage} CLEAR! - Press SPACE to continue")
     text_rect = text.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2))
-    screen.blit(text, text_rect)
+    renderer.blit(text, text_rect)
+
+def save_replay(state):
+    # 終わったステージの操作を保存する（保存できなくてもゲームは続ける）
+    try:
+        state.replay.save(REPLAY_FILE)
+    except OSError:
+        print("リプレイの保存に失敗しました。")
+
+def play_event_sounds(events):
+    # エンジンのイベントに対応する効果音を再生
+    for event in events:
+        name = EVENT_SOUNDS.get(event)
+        if name is not None:
+            audio.play(name)
+
+def handle_input_event(event):
+    # 操作キーの押下と離したことを時刻つきで入力バッファに渡す（キーボードの状態を後から読むと短い押下を取りこぼす）
+    if event.type == pygame.KEYDOWN:
+        action = KEY_ACTIONS.get(event.key)
+        if action is not None:
+            inputs.press(action, time.perf_counter())
+    elif event.type == pygame.KEYUP:
+        action = KEY_ACTIONS.get(event.key)
+        if action is not None:
+            inputs.release(action)
+    elif event.type == pygame.WINDOWFOCUSLOST:
+        inputs.release_all()
+
+def main(width=GRID_WIDTH, height=GRID_HEIGHT):
+    # width, height: マップの大きさ（マス数）。画面より広いとプレイヤーを追ってスクロールする
+    init()
 
-def main():
     # ゲームの状態
     game_state = MENU
     
     # ゲーム変数
     current_stage = 1
     max_cleared_stage = 0  # クリアした最大ステージ
-    score = 0
+    state = None
+    map_layer = None
+    drawn_state = None  # 最後に描画した画面
     
-    # BGM再生状態を管理する変数
-    current_bgm = None
+    # 固定ティックのための時計と、まだシミュレーションしていない経過時間
+    clock = pygame.time.Clock()
+    accumulator = 0.0
+    preloader = None  # ステージクリア画面の間に次のステージを作っておく
     
-    # BGMを再生する関数
-    def play_bgm(bgm):
-        nonlocal current_bgm
-        if sound_enabled:
-            # 現在再生中のBGMがあれば停止
-            if current_bgm is not None:
-                current_bgm.stop()
-            # 新しいBGMを再生（ループ設定）
-            bgm.play(-1)  # -1は無限ループを意味する
-            current_bgm = bgm
+    # ステージを開始する関数
+    def start_stage(stage):
+        nonlocal state, map_layer, accumulator, preloader
+        # 先に作っておいた同じステージがあればそれを使う
+        if preloader is not None and preloader.stage == stage:
+            state = preloader.take()
+        else:
+            state = GameState(stage, None, None, width, height)
+        preloader = None
+        state.profiler = profiler if profiler.enabled else None
+        map_layer = MapLayer(state)
+        accumulator = 0.0
+        # ゲーム中以外の画面ではキーを離したイベントを受け取っていないので、押し続けている方向も捨てる
+        inputs.release_all()
+        # ゲームプレイ中のBGMに切り替え
+        audio.play_bgm("game")
     
     # メニュー画面のBGMを再生
-    if sound_enabled:
-        play_bgm(menu_bgm)
+    audio.play_bgm("menu")
     
     # メインループ
     while True:
+        # 前フレームからの経過時間（描画が遅れても一度に進めすぎないよう上限を設ける）
+        frame_time = min(clock.tick(RENDER_FPS) / 1000, MAX_FRAME_TIME)
+        profiler.begin_frame()
+        key_pressed = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             
+            # ウィンドウが隠れていた場合などは全体を描き直す
+            if event.type == pygame.WINDOWEXPOSED:
+                renderer.invalidate()
+            
+            if event.type == pygame.KEYDOWN:
+                key_pressed = True
+                # プロファイラーの表示切り替えとトレースの書き出し
+                if event.key == pygame.K_F3:
+                    profiler.toggle()
+                    if state is not None:
+                        state.profiler = profiler if profiler.enabled else None
+                    renderer.invalidate()
+                elif event.key == pygame.K_F4 and profiler.enabled:
+                    frames = profiler.dump_trace(TRACE_FILE)
+                    print(f"直近の{frames}フレームを{TRACE_FILE}に書き出しました。")
+                elif event.key == pygame.K_F5:
+                    count = inputs.dump(INPUT_LATENCY_FILE)
+                    print(f"{count}回分の入力の遅れを{INPUT_LATENCY_FILE}に書き出しました。")
+            
             # メニュー画面の処理
             if game_state == MENU:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_RETURN:
                         # ゲーム開始
-                        game_map = create_map(current_stage)
-                        player = Player(TILE_SIZE, TILE_SIZE)
-                        enemies = []
-                        
-                        # ステージに応じた敵の生成
-                        num_enemies = current_stage + 2
-                        for _ in range(num_enemies):
-                            enemy_type = random.randint(0, min(2, (current_stage - 1)))
-                            spawn_enemy(enemies, game_map, player, enemy_type)
-                        
+                        start_stage(current_stage)
                         game_state = GAME
-                        # ゲームプレイ中のBGMに切り替え
-                        if sound_enabled:
-                            play_bgm(game_bgm)
                     # ステージ選択（クリア済みステージのみ）
                     elif event.key == pygame.K_RIGHT and current_stage < max_cleared_stage + 1:
                         current_stage += 1
@@ -827,38 +884,20 @@ def main():
             
             # ゲームプレイ中の処理
             elif game_state == GAME:
-                # 既存のゲームプレイ処理
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_SPACE:
-                        bomb = player.place_bomb(game_map)
-                        if bomb:
-                            game_map[bomb.y][bomb.x] = BOMB
+                handle_input_event(event)
             
             # ゲームオーバー画面の処理
             elif game_state == GAME_OVER:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_RETURN:
                         # 同じステージを再開
-                        game_map = create_map(current_stage)
-                        player = Player(TILE_SIZE, TILE_SIZE)
-                        enemies = []
-                        
-                        # ステージに応じた敵の生成
-                        num_enemies = current_stage + 2
-                        for _ in range(num_enemies):
-                            enemy_type = random.randint(0, min(2, (current_stage - 1)))
-                            spawn_enemy(enemies, game_map, player, enemy_type)
-                        
+                        start_stage(current_stage)
                         game_state = GAME
-                        # ゲームプレイ中のBGMに切り替え
-                        if sound_enabled:
-                            play_bgm(game_bgm)
                     elif event.key == pygame.K_ESCAPE:
                         # メニューに戻る
                         game_state = MENU
                         # メニュー画面のBGMに切り替え
-                        if sound_enabled:
-                            play_bgm(menu_bgm)
+                        audio.play_bgm("menu")
             
             # ステージクリア画面の処理
             elif game_state == STAGE_CLEAR:
@@ -868,240 +907,338 @@ def main():
                         current_stage += 1
                         max_cleared_stage = max(max_cleared_stage, current_stage - 1)
                         
-                        game_map = create_map(current_stage)
-                        player = Player(TILE_SIZE, TILE_SIZE)
-                        enemies = []
-                        
-                        # 新しいステージの敵を生成
-                        num_enemies = current_stage + 2
-                        for _ in range(num_enemies):
-                            enemy_type = random.randint(0, min(2, (current_stage - 1)))
-                            spawn_enemy(enemies, game_map, player, enemy_type)
-                        
+                        start_stage(current_stage)
                         game_state = GAME
-                        # ゲームプレイ中のBGMに切り替え
-                        if sound_enabled:
-                            play_bgm(game_bgm)
                     elif event.key == pygame.K_ESCAPE:
                         # メニューに戻る（クリアしたステージを記録）
                         max_cleared_stage = max(max_cleared_stage, current_stage)
                         game_state = MENU
                         # メニュー画面のBGMに切り替え
-                        if sound_enabled:
-                            play_bgm(menu_bgm)
+                        audio.play_bgm("menu")
         
-        # 画面クリア
-        screen.fill(BLACK)
+        # 画面が切り替わったら全体を描き直す
+        if game_state != drawn_state:
+            renderer.invalidate()
+            drawn_state = game_state
+        
+        # メニューなどの静止画面はキー入力があったときだけ描き直す
+        redraw = key_pressed or renderer.full_redraw
+        if game_state != GAME and redraw:
+            # 画面クリア
+            screen.fill(BLACK)
         
         # メニュー画面の描画
         if game_state == MENU:
-            draw_menu(current_stage, max_cleared_stage)
+            if redraw:
+                draw_menu(current_stage, max_cleared_stage)
+                renderer.present()
         
         # ゲームプレイ中の描画と更新
         elif game_state == GAME:
-            # プレイヤーの入力処理
-            keys = pygame.key.get_pressed()
-            if player.alive and player.move_cooldown <= 0:
-                if keys[pygame.K_UP]:
-                    player.move(0, -1, game_map)
-                elif keys[pygame.K_DOWN]:
-                    player.move(0, 1, game_map)
-                elif keys[pygame.K_LEFT]:
-                    player.move(-1, 0, game_map)
-                elif keys[pygame.K_RIGHT]:
-                    player.move(1, 0, game_map)
-            
-            # 敵の移動
-            for enemy in enemies:
-                if enemy.move_cooldown <= 0:
-                    if enemy.enemy_type == 0:  # スライム（ランダム移動）
-                        enemy.move_slime(game_map)
-                    elif enemy.enemy_type == 1:  # チェイサー（追跡）
-                        enemy.move_chaser(game_map, player)
-                    elif enemy.enemy_type == 2:  # スマート（爆弾回避）
-                        enemy.move_smart(game_map, player, player.bombs if player.alive else None)
-                    # 移動後にクールダウンをリセット
-                    enemy.move_cooldown = enemy.move_delay
-                else:
-                    enemy.move_cooldown -= 1
-            
-            # プレイヤーのクールダウン更新
-            if player.move_cooldown > 0:
-                player.move_cooldown -= 1
-            
-            # 爆弾の更新
-            for bomb in player.bombs[:]:
-                if not bomb.exploded:
-                    if bomb.update():
-                        # 爆発の処理
-                        explosions = check_explosion(bomb, game_map, player, enemies)
-                        game_map[bomb.y][bomb.x] = EMPTY
-                        # プレイヤーが死亡した場合はゲームオーバー状態に移行
-                        if not player.alive:
-                            game_state = GAME_OVER
-                            if sound_enabled:
-                                # BGMを一時停止してゲームオーバー音を再生
-                                if current_bgm is not None:
-                                    current_bgm.stop()
-                                game_over_sound.play()
-                else:
-                    # 爆発後の更新
-                    bomb.update()
-                    # 爆発後のエフェクト表示期間が終了したら削除
-                    if bomb.explosion_frames >= bomb.explosion_duration:
-                        player.bombs.remove(bomb)
-            
-            # 敵との衝突判定
-            if player.alive:
-                for enemy in enemies:
-                    if (player.grid_x == enemy.grid_x and 
-                        player.grid_y == enemy.grid_y):
-                        player.alive = False
-                        game_state = GAME_OVER
-                        if sound_enabled:
-                            # BGMを一時停止してゲームオーバー音を再生
-                            if current_bgm is not None:
-                                current_bgm.stop()
-                            game_over_sound.play()
-                        break  # 一度死亡判定が出たらループを抜ける
+            # 経過時間ぶんだけ固定ティックでゲームを進める
+            # 描画が追いつかないときは描画を飛ばして複数ティック進める
+            accumulator += frame_time
+            steps = 0
+            while accumulator >= TICK_TIME and state.status == RUNNING:
+                if steps >= MAX_FRAME_SKIP:
+                    # それでも追いつかない場合は遅れを捨てる
+                    accumulator = 0.0
+                    break
+                # 溜めておいた押下は、動ける・爆弾を置けるティックが来たときに使う
+                actions = inputs.take(time.perf_counter(), state.player, state.tick + 1, state.game_map)
+                profiler.mark("input")
+                events = state.step(actions)
+                play_event_sounds(events)
+                profiler.mark("sound")
+                accumulator -= TICK_TIME
+                steps += 1
             
-            # すべての敵を倒したらステージクリア
-            if not enemies and player.alive:
+            if state.status != RUNNING:
+                save_replay(state)
+            if state.status == DEAD:
+                # BGMを一時停止してゲームオーバー音を再生
+                game_state = GAME_OVER
+                audio.play_jingle("game_over")
+            elif state.status == CLEARED:
+                # BGMを一時停止してステージクリア音を再生
                 max_cleared_stage = max(max_cleared_stage, current_stage)
                 game_state = STAGE_CLEAR
-                if sound_enabled:
-                    # BGMを一時停止してステージクリア音を再生
-                    if current_bgm is not None:
-                        current_bgm.stop()
-                    stage_clear_sound.play()
-            
-            # マップの描画
-            draw_map(game_map)
+                audio.play_jingle("stage_clear")
+                preloader = StagePreloader(current_stage + 1, width, height)
             
-            # 爆弾の描画
-            for bomb in player.bombs:
-                bomb.draw()
-            
-            # 敵の描画
-            for enemy in enemies:
-                enemy.draw()
-            
-            # プレイヤーの描画
-            player.draw()
-            
-            # スコアとステージ情報の表示
-            font = pygame.font.SysFont(None, 36)
-            score_text = font.render(f"Score: {player.score}", True, WHITE)
-            stage_text = font.render(f"Stage: {current_stage}", True, WHITE)
-            screen.blit(score_text, (10, 10))
-            screen.blit(stage_text, (SCREEN_WIDTH - 150, 10))
-            
-            # プレイヤーのステータス表示
-            bomb_text = font.render(f"Bombs: {player.max_bombs}", True, WHITE)
-            range_text = font.render(f"Range: {player.bomb_range}", True, WHITE)
-            speed_text = font.render(f"Speed: {player.speed_level}", True, WHITE)
-            screen.blit(bomb_text, (10, SCREEN_HEIGHT - 90))
-            screen.blit(range_text, (10, SCREEN_HEIGHT - 60))
-            screen.blit(speed_text, (10, SCREEN_HEIGHT - 30))
+            draw_game(state, map_layer)
+            renderer.present()
+            profiler.mark("display")
         
         # ゲームオーバー画面の描画
         elif game_state == GAME_OVER:
-            draw_game_over(player.score)
+            if redraw:
+                draw_game_over(state.player.score)
+                renderer.present()
         
         # ステージクリア画面の描画
         elif game_state == STAGE_CLEAR:
-            draw_stage_clear(current_stage)
+            if redraw:
+                draw_stage_clear(current_stage)
+                renderer.present()
         
-        # 画面更新
-        pygame.display.flip()
-        pygame.time.Clock().tick(60)
+        profiler.end_frame()
+
+def run_client(address, match_id, stage=1, width=GRID_WIDTH, height=GRID_HEIGHT):
+    # サーバーにつなぎ、受け取った状態を描画するだけの薄いクライアント（シミュレーションはサーバーで行う）
+    # 試合に参加した順にプレイヤーの枠を操作し（カメラと情報表示はそのプレイヤーを追う）、枠が埋まっていれば観戦になる
+    init()
+    client = NetClient(*address)
+    client.join(match_id, stage, width, height)
+    state = None
+    map_layer = None
+    sent_actions = None
+    clock = pygame.time.Clock()
+    
+    while client.connected:
+        clock.tick(RENDER_FPS)
+        profiler.begin_frame()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                client.close()
+                pygame.quit()
+                sys.exit()
+            if event.type == pygame.WINDOWEXPOSED:
+                renderer.invalidate()
+            handle_input_event(event)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
+                renderer.invalidate()
+        
+        # 押している操作が変わったときだけ送る（どのティックで使われるかはサーバーが決めるので、溜めた押下はすぐ送る）
+        actions = inputs.take(time.perf_counter())
+        if actions != sent_actions:
+            client.send_input(actions)
+            sent_actions = actions
+        profiler.mark("input")
+        
+        # 受け取った差分を適用する（全体の状態が届いたときは新しい試合として描き直す）
+        received = client.poll(state)
+        if received is None:
+            continue
+        if received is not state:
+            state = received
+            map_layer = MapLayer(state)
+            renderer.invalidate()
+            audio.play_bgm("game")
+        play_event_sounds(state.events)
+        if EVENT_GAME_OVER in state.events:
+            audio.play_jingle("game_over")
+        elif EVENT_STAGE_CLEAR in state.events:
+            audio.play_jingle("stage_clear")
+        profiler.mark("sound")
+        
+        draw_game(state, map_layer)
+        if state.status == DEAD:
+            blit_centered(render_text("GAME OVER", FONT_LARGE, RED), SCREEN_HEIGHT // 3)
+        elif state.status == CLEARED:
+            blit_centered(render_text(f"STAGE {state.stage} CLEAR!", FONT_LARGE, YELLOW), SCREEN_HEIGHT // 3)
+        renderer.present()
+        profiler.mark("display")
+        profiler.end_frame()
+    
+    print("サーバーとの接続が切れました。")
+    pygame.quit()
+
+def run_peer(peer, player, port, seed=0, width=GRID_WIDTH, height=GRID_HEIGHT):
+    # 相手のピアと UDP でつないで2人で遊ぶ（サーバーなし、ロールバック方式で同期）
+    # 相手も同じシードとマップの大きさで起動する必要がある（player は 1 か 2 で、相手とは別の番号にする）
+    init()
+    index = player - 1
+    state = GameState(1, seed, None, width, height, 2)
+    transport = UdpTransport(port, peer)
+    session = RollbackSession(state, index, transport)
+    map_layer = MapLayer(state)
+    clock = pygame.time.Clock()
+    accumulator = 0.0
+    finished = False
+    audio.play_bgm("game")
+    
+    while True:
+        frame_time = min(clock.tick(RENDER_FPS) / 1000, MAX_FRAME_TIME)
+        profiler.begin_frame()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                transport.close()
+                pygame.quit()
+                sys.exit()
+            if event.type == pygame.WINDOWEXPOSED:
+                renderer.invalidate()
+            handle_input_event(event)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
+                renderer.invalidate()
+        
+        # 固定ティックで進める。相手の入力が遅れすぎているときは届くまで時間を止めてやり取りだけを続ける
+        accumulator += frame_time
+        steps = 0
+        while accumulator >= TICK_TIME:
+            if steps >= MAX_FRAME_SKIP:
+                accumulator = 0.0
+                break
+            if session.waiting():
+                accumulator = 0.0
+                break
+            # 自分の入力は入力の遅れの分だけ先のティックで使われるので、そのティックで動けるかで溜めた押下を使う
+            actions = inputs.take(time.perf_counter(), state.players[index],
+                                  state.tick + 1 + session.input_delay, state.game_map)
+            profiler.mark("input")
+            events = session.advance(actions)
+            play_event_sounds(events)
+            if EVENT_GAME_OVER in events:
+                audio.play_jingle("game_over")
+            elif EVENT_STAGE_CLEAR in events:
+                audio.play_jingle("stage_clear")
+            profiler.mark("sound")
+            accumulator -= TICK_TIME
+            steps += 1
+        if not steps:
+            # 進めなかったフレームも、届いた入力の反映と送り直しは行う
+            session.poll()
+        if session.finished() and not finished:
+            finished = True
+            save_replay(state)
+        
+        draw_game(state, map_layer, state.players[index])
+        if state.status == DEAD:
+            blit_centered(render_text("GAME OVER", FONT_LARGE, RED), SCREEN_HEIGHT // 3)
+        elif state.status == CLEARED:
+            blit_centered(render_text(f"STAGE {state.stage} CLEAR!", FONT_LARGE, YELLOW), SCREEN_HEIGHT // 3)
+        elif session.waiting():
+            blit_centered(render_text("Waiting for the other player..."), SCREEN_HEIGHT // 3)
+        renderer.present()
+        profiler.mark("display")
+        profiler.end_frame()
+
+def draw_game(state, map_layer, player=None):
+    # player: カメラと情報表示が追うプレイヤー（省略時は state.player。クライアントでは操作している枠のプレイヤー）
+    if player is None:
+        player = state.player
+    camera = map_layer.camera
+    
+    # カメラがプレイヤーを追って動いたら、背景をずらして画面全体を描き直す
+    dx, dy = camera.follow(player.grid_x, player.grid_y)
+    if dx or dy:
+        map_layer.scroll(dx, dy)
+        renderer.invalidate()
+    
+    # マップの描画（前フレームで描いた部分と書き換わったマスを事前描画した背景で塗り直す）
+    renderer.restore(map_layer.surface, map_layer.update())
+    profiler.mark("draw_map")
+    
+    # 爆弾の描画（画面外のものは描かない）
+    for other in state.players:
+        for bomb in other.bombs:
+            draw_bomb(bomb, state.tick, camera)
+    
+    # 敵の描画（画面に映る範囲にいる敵だけをマスの索引から引く）
+    for enemy in state.occupancy.in_rect(camera.x, camera.y, camera.width, camera.height):
+        draw_enemy(enemy, camera)
+    
+    # プレイヤーの描画
+    for other in state.players:
+        if camera.visible(other.grid_x, other.grid_y):
+            draw_player(other, camera)
+    profiler.mark("sprites")
+    
+    # スコアとステージ情報の表示
+    draw_game_info(player, state.stage)
+    profiler.mark("hud")
+    
+    if profiler.enabled:
+        draw_profiler_overlay()
+        profiler.mark("overlay")
+
+def draw_profiler_overlay():
+    # フレーム時間の統計とフェーズごとの内訳（読めるように一定フレームごとに更新する）
+    global profile_lines
+    if len(profiler.frames) < PROFILE_REFRESH or profiler.frame_count % PROFILE_REFRESH == 0:
+        stats = profiler.stats()
+        profile_lines = []
+        if stats:
+            profile_lines.append(f"frame {stats['mean']:.2f}ms  p50 {stats['p50']:.2f}  p95 {stats['p95']:.2f}  "
+                                 f"p99 {stats['p99']:.2f}  max {stats['max']:.2f}")
+            profile_lines.extend(f"{phase} {ms:.2f}ms" for phase, ms in stats["phases"].items())
+        # 押してからティックで使われるまでの時間
+        for name, latency in inputs.stats().items():
+            profile_lines.append(f"input {name} p50 {latency['p50']:.0f}ms  p95 {latency['p95']:.0f}  "
+                                 f"max {latency['max']:.0f}  ({latency['count']})")
+    y = 50
+    for line in profile_lines:
+        text = render_text(line, FONT_PROFILE, YELLOW)
+        renderer.blit(text, (SCREEN_WIDTH - text.get_width() - 10, y))
+        y += text.get_height()
 
 def draw_menu(current_stage, max_cleared_stage):
     # タイトル
-    font_large = pygame.font.SysFont(None, 72)
-    font_small = pygame.font.SysFont(None, 36)
-    
-    title = font_large.render("BOMBERMAN", True, WHITE)
-    instruction = font_small.render("Press ENTER to Start", True, WHITE)
+    blit_centered(render_text("BOMBERMAN", FONT_LARGE), SCREEN_HEIGHT // 3)
+    blit_centered(render_text("Press ENTER to Start"), SCREEN_HEIGHT // 2 + 50)
     
     # ロボットキャラクターの表示
-    robot_player = Player(SCREEN_WIDTH // 2 - TILE_SIZE // 2, SCREEN_HEIGHT // 2)
-    robot_player.draw()
-    
-    # テキスト表示
-    screen.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, SCREEN_HEIGHT // 3))
-    screen.blit(instruction, (SCREEN_WIDTH // 2 - instruction.get_width() // 2, SCREEN_HEIGHT // 2 + 50))
+    blit_sprite(sprites.robots[random_lights()],
+                (SCREEN_WIDTH // 2 - TILE_SIZE // 2) // TILE_SIZE * TILE_SIZE,
+                SCREEN_HEIGHT // 2 // TILE_SIZE * TILE_SIZE)
     
     # ロボットの説明
-    robot_desc = font_small.render("Place bombs with the Robot character!", True, BLUE)
-    screen.blit(robot_desc, (SCREEN_WIDTH // 2 - robot_desc.get_width() // 2, SCREEN_HEIGHT // 2 + 100))
+    blit_centered(render_text("Place bombs with the Robot character!", color=BLUE), SCREEN_HEIGHT // 2 + 100)
     
     # ステージ選択の表示
-    stage_select = font_small.render(f"Stage: {current_stage}", True, WHITE)
-    screen.blit(stage_select, (SCREEN_WIDTH // 2 - stage_select.get_width() // 2, SCREEN_HEIGHT // 2 + 150))
+    blit_centered(render_text(f"Stage: {current_stage}"), SCREEN_HEIGHT // 2 + 150)
     
     # ステージ選択の説明（クリア済みステージのみ選択可能）
     if max_cleared_stage > 0:
-        stage_help = font_small.render("Use LEFT/RIGHT arrows to select cleared stages", True, YELLOW)
-        screen.blit(stage_help, (SCREEN_WIDTH // 2 - stage_help.get_width() // 2, SCREEN_HEIGHT // 2 + 180))
+        blit_centered(render_text("Use LEFT/RIGHT arrows to select cleared stages", color=YELLOW),
+                      SCREEN_HEIGHT // 2 + 180)
 
 def draw_game_over(score):
     # ゲームオーバー表示
-    font_large = pygame.font.SysFont(None, 72)
-    font_small = pygame.font.SysFont(None, 36)
-    
-    game_over = font_large.render("GAME OVER", True, RED)
-    score_text = font_small.render(f"Score: {score}", True, WHITE)
-    instruction = font_small.render("Press ENTER to restart same stage", True, WHITE)
-    menu_instruction = font_small.render("Press ESC to return to menu", True, WHITE)
-    
-    screen.blit(game_over, (SCREEN_WIDTH // 2 - game_over.get_width() // 2, SCREEN_HEIGHT // 3))
-    screen.blit(score_text, (SCREEN_WIDTH // 2 - score_text.get_width() // 2, SCREEN_HEIGHT // 2))
-    screen.blit(instruction, (SCREEN_WIDTH // 2 - instruction.get_width() // 2, SCREEN_HEIGHT // 2 + 50))
-    screen.blit(menu_instruction, (SCREEN_WIDTH // 2 - menu_instruction.get_width() // 2, SCREEN_HEIGHT // 2 + 90))
+    blit_centered(render_text("GAME OVER", FONT_LARGE, RED), SCREEN_HEIGHT // 3)
+    blit_centered(render_text(f"Score: {score}"), SCREEN_HEIGHT // 2)
+    blit_centered(render_text("Press ENTER to restart same stage"), SCREEN_HEIGHT // 2 + 50)
+    blit_centered(render_text("Press ESC to return to menu"), SCREEN_HEIGHT // 2 + 90)
 
 def draw_stage_clear(stage):
     # ステージクリア表示
-    font_large = pygame.font.SysFont(None, 72)
-    font_small = pygame.font.SysFont(None, 36)
-    
-    clear_text = font_large.render(f"STAGE {stage} CLEAR!", True, YELLOW)
-    instruction = font_small.render("Press ENTER for next stage", True, WHITE)
-    menu_instruction = font_small.render("Press ESC to return to menu", True, WHITE)
-    
-    screen.blit(clear_text, (SCREEN_WIDTH // 2 - clear_text.get_width() // 2, SCREEN_HEIGHT // 3))
-    screen.blit(instruction, (SCREEN_WIDTH // 2 - instruction.get_width() // 2, SCREEN_HEIGHT // 2 + 50))
-    screen.blit(menu_instruction, (SCREEN_WIDTH // 2 - menu_instruction.get_width() // 2, SCREEN_HEIGHT // 2 + 90))
+    blit_centered(render_text(f"STAGE {stage} CLEAR!", FONT_LARGE, YELLOW), SCREEN_HEIGHT // 3)
+    blit_centered(render_text("Press ENTER for next stage"), SCREEN_HEIGHT // 2 + 50)
+    blit_centered(render_text("Press ESC to return to menu"), SCREEN_HEIGHT // 2 + 90)
 
-def spawn_enemy(enemies, game_map, player, enemy_type):
-    # プレイヤーから離れた位置に敵を配置
-    min_distance = 5  # プレイヤーからの最小距離
-    
-    for _ in range(20):  # 最大20回試行
-        x = random.randint(1, GRID_WIDTH-2)
-        y = random.randint(1, GRID_HEIGHT-2)
-        
-        # プレイヤーからの距離を計算
-        distance = abs(x - player.grid_x) + abs(y - player.grid_y)
-        
-        if distance >= min_distance and game_map[y][x] == EMPTY:
-            enemies.append(Enemy(x, y, enemy_type))
-            return True
-    
-    # 適切な位置が見つからなかった場合、ランダムな空きマスに配置
-    empty_cells = []
-    for y in range(1, GRID_HEIGHT-1):
-        for x in range(1, GRID_WIDTH-1):
-            if game_map[y][x] == EMPTY:
-                empty_cells.append((x, y))
-    
-    if empty_cells:
-        x, y = random.choice(empty_cells)
-        enemies.append(Enemy(x, y, enemy_type))
-        return True
-    
-    return False
+def parse_arena(text):
+    # "200x200" のような指定をマップの (幅, 高さ) にする
+    width, height = (int(value) for value in text.lower().split("x"))
+    if width < 5 or height < 5:
+        raise argparse.ArgumentTypeError("マップは 5x5 以上にしてください")
+    return width, height
+
+def parse_seed(text):
+    # リプレイとスナップショットに入る範囲のシードだけを受け付ける
+    seed = int(text)
+    if not 0 <= seed < SEED_LIMIT:
+        raise argparse.ArgumentTypeError("シードは0以上2の64乗未満にしてください")
+    return seed
 
 # メイン関数を呼び出す
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="ボンバーマン")
+    parser.add_argument("--arena", type=parse_arena, default=(GRID_WIDTH, GRID_HEIGHT),
+                        help="マップの大きさ（例: 200x200）。画面より広いとスクロールする")
+    parser.add_argument("--connect", type=split_address, metavar="HOST:PORT",
+                        help="server.py につないで遊ぶ（試合に参加した順に2人まで操作し、ほかは観戦）")
+    parser.add_argument("--match", type=int, default=1, help="参加する試合の番号")
+    parser.add_argument("--peer", type=split_address, metavar="HOST:PORT",
+                        help="相手のピアと UDP でつないで2人で遊ぶ（ロールバック方式。相手も同じ --seed と --arena で起動する）")
+    parser.add_argument("--player", type=int, choices=(1, 2), default=1, help="--peer で操作するプレイヤー")
+    parser.add_argument("--port", type=int, default=7660, help="--peer で待ち受ける UDP のポート")
+    parser.add_argument("--seed", type=parse_seed, default=0, help="--peer で遊ぶマップのシード")
+    args = parser.parse_args()
+    if args.connect:
+        run_client(args.connect, args.match, 1, *args.arena)
+    elif args.peer:
+        run_peer(args.peer, args.player, args.port, args.seed, *args.arena)
+    else:
+        main(*args.arena)
@@ -0,0 +1,326 @@
+import socket
+import struct
+import threading
+import zlib
+from collections import deque
+
+from engine import (
+    EVENT_BOMB_PLACE, EVENT_EXPLOSION, EVENT_ITEM_PICKUP, EVENT_GAME_OVER, EVENT_STAGE_CLEAR,
+    Grid, Player, Enemy, Bomb, Occupancy,
+)
+
+# ネットワーク対戦の通信形式（pygameに依存しない）
+# サーバーが GameState を進め、クライアントは受け取った状態を描画するだけ
+# プレイヤーは試合の人数分を送り、各クライアントには何人目を操作しているかを別に知らせる
+# 参加直後（と送信が詰まった後）だけ全体の状態を送り、それ以外は前回送った状態からの差分だけを送る
+
+DEFAULT_PORT = 7650
+
+# メッセージは「本体の長さ・種類」のヘッダーのあとに本体が続く
+MESSAGE_HEADER = struct.Struct("<IB")
+MSG_JOIN = 1  # クライアント -> サーバー: 試合に参加する
+MSG_INPUT = 2  # クライアント -> サーバー: 押している操作
+MSG_FULL = 3  # サーバー -> クライアント: 全体の状態
+MSG_DELTA = 4  # サーバー -> クライアント: 前回送った状態からの差分
+MSG_SLOT = 5  # サーバー -> クライアント: 操作するプレイヤーの番号（観戦なら SPECTATOR）
+
+SPECTATOR = 255
+
+# 1つのメッセージの上限（これより長いヘッダーが来たら壊れた接続として切る）
+MAX_MESSAGE_SIZE = 1 << 24
+
+NET_JOIN = struct.Struct("<IHHH")  # 試合の番号, ステージ, マップの幅, 高さ
+NET_INPUT = struct.Struct("<B")  # ACTION_* のビットフラグ
+NET_FULL = struct.Struct("<IHBHHIHHB")  # ティック, ステージ, 進行状態, マップの幅, 高さ, 圧縮したマップの長さ, 敵, 爆弾, プレイヤー
+NET_DELTA = struct.Struct("<IBBIHHHHH")  # ティック, 進行状態, イベント, 変わったマス, 動いた敵, 倒された敵, 置かれた爆弾, 爆発した爆弾, 消えた爆弾
+NET_PLAYER = struct.Struct("<HHBBBBI")  # 位置, 火力, 爆弾数, 速さ, 生存, スコア
+NET_CELL = struct.Struct("<IB")  # マスの番号, 中身
+NET_ENEMY = struct.Struct("<IHHB")  # 番号, 位置, 種類
+NET_ENEMY_MOVE = struct.Struct("<IHH")  # 番号, 位置
+NET_ID = struct.Struct("<I")  # 倒された敵・消えた爆弾の番号
+NET_BOMB = struct.Struct("<IHHBIB")  # 番号, 位置, 火力, 爆発するティック, 置いたプレイヤー
+NET_EXPLOSION = struct.Struct("<IIH")  # 番号, 爆発したティック, 爆風のマス数
+NET_POINT = struct.Struct("<HH")
+NET_SLOT = struct.Struct("<B")  # プレイヤーの番号
+
+# イベントはビットで送る（この並びの順に1, 2, 4, ...）
+NET_EVENTS = (EVENT_BOMB_PLACE, EVENT_EXPLOSION, EVENT_ITEM_PICKUP, EVENT_GAME_OVER, EVENT_STAGE_CLEAR)
+
+def pack_message(kind, body=b""):
+    return MESSAGE_HEADER.pack(len(body), kind) + body
+
+def pack_events(events):
+    mask = 0
+    for event in events:
+        mask |= 1 << NET_EVENTS.index(event)
+    return mask
+
+def unpack_events(mask):
+    return [event for i, event in enumerate(NET_EVENTS) if mask & (1 << i)]
+
+def pack_player(player):
+    return NET_PLAYER.pack(player.grid_x, player.grid_y, player.bomb_range, player.max_bombs,
+                           player.speed_level, player.alive, player.score)
+
+def pack_bomb(bomb_id, bomb, owner):
+    return NET_BOMB.pack(bomb_id, bomb.x, bomb.y, bomb.explosion_range, bomb.detonate_tick, owner)
+
+def pack_explosion(bomb_id, bomb):
+    parts = [NET_EXPLOSION.pack(bomb_id, bomb.exploded_tick, len(bomb.explosions))]
+    parts.extend(NET_POINT.pack(x, y) for x, y in bomb.explosions)
+    return b"".join(parts)
+
+class StateEncoder:
+    # サーバー側: 1つの試合の状態を全体または差分のメッセージにする
+    # 最後に送った敵の位置と爆弾の状態を覚えておき、変わったものだけを差分に入れる
+    # 敵と爆弾にはこの試合の中で通し番号を振る（オブジェクトをそのまま送れないため）
+    def __init__(self, state):
+        self.state = state
+        self.next_id = 0
+        self.sent_enemies = {enemy: [self.new_id(), enemy.grid_x, enemy.grid_y] for enemy in state.enemies}
+        self.sent_bombs = {}  # 爆弾 -> [番号, 置いたプレイヤーの番号, 爆発済みか]
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def full(self):
+        # 最後に送った差分の時点の全体の状態（受け取ったクライアントは次の差分から続けられる）
+        # マップは今の中身を送るが、まだ送っていない書き換えは次の差分で同じ値が届くだけなので問題ない
+        state = self.state
+        game_map = state.game_map
+        cells = zlib.compress(game_map.cells)
+        parts = [
+            NET_FULL.pack(state.tick, state.stage, state.status, game_map.width, game_map.height, len(cells),
+                          len(self.sent_enemies), len(self.sent_bombs), len(state.players)),
+        ]
+        parts.extend(pack_player(player) for player in state.players)
+        parts.append(cells)
+        for enemy, (enemy_id, x, y) in self.sent_enemies.items():
+            parts.append(NET_ENEMY.pack(enemy_id, x, y, enemy.enemy_type))
+        for bomb, (bomb_id, owner, exploded) in self.sent_bombs.items():
+            parts.append(pack_bomb(bomb_id, bomb, owner))
+        # 爆発済みの爆弾は、置かれた爆弾のあとに爆発の記録を続ける
+        exploded = [pack_explosion(bomb_id, bomb) for bomb, (bomb_id, owner, exploded) in self.sent_bombs.items()
+                    if exploded]
+        parts.append(NET_ID.pack(len(exploded)))
+        parts.extend(exploded)
+        return pack_message(MSG_FULL, b"".join(parts))
+
+    def delta(self, cells, events):
+        # 前回送った状態からの差分。cells は書き換わったマス、events はその間に起きたイベント
+        state = self.state
+        game_map = state.game_map
+        width = game_map.width
+        cell_parts = [NET_CELL.pack(y * width + x, game_map[y][x]) for x, y in cells]
+
+        # 敵: 動いたものと倒されたもの（敵は途中で増えないので、数が減ったときだけ探す）
+        moved = []
+        sent_enemies = self.sent_enemies
+        for enemy in state.enemies:
+            record = sent_enemies[enemy]
+            if record[1] != enemy.grid_x or record[2] != enemy.grid_y:
+                record[1] = enemy.grid_x
+                record[2] = enemy.grid_y
+                moved.append(NET_ENEMY_MOVE.pack(record[0], enemy.grid_x, enemy.grid_y))
+        removed = []
+        if len(sent_enemies) != len(state.enemies):
+            alive = set(state.enemies)
+            for enemy in [enemy for enemy in sent_enemies if enemy not in alive]:
+                removed.append(NET_ID.pack(sent_enemies.pop(enemy)[0]))
+
+        # 爆弾: 置かれたもの、爆発したもの、爆発のエフェクトが終わって消えたもの
+        added = []
+        exploded = []
+        sent_bombs = self.sent_bombs
+        count = 0
+        for owner, player in enumerate(state.players):
+            count += len(player.bombs)
+            for bomb in player.bombs:
+                record = sent_bombs.get(bomb)
+                if record is None:
+                    record = sent_bombs[bomb] = [self.new_id(), owner, False]
+                    added.append(pack_bomb(record[0], bomb, owner))
+                if bomb.exploded and not record[2]:
+                    record[2] = True
+                    exploded.append(pack_explosion(record[0], bomb))
+        expired = []
+        if len(sent_bombs) != count:
+            current = {bomb for player in state.players for bomb in player.bombs}
+            for bomb in [bomb for bomb in sent_bombs if bomb not in current]:
+                expired.append(NET_ID.pack(sent_bombs.pop(bomb)[0]))
+
+        header = NET_DELTA.pack(state.tick, state.status, pack_events(events), len(cell_parts), len(moved),
+                                len(removed), len(added), len(exploded), len(expired))
+        players = [pack_player(player) for player in state.players]
+        body = b"".join([header] + players + cell_parts + moved + removed + added + exploded + expired)
+        return pack_message(MSG_DELTA, body)
+
+class RemoteState:
+    # クライアント側: サーバーから受け取った状態の写し
+    # main.draw_game がそのまま描けるように GameState と同じ名前の属性を持つ（シミュレーションはしない）
+    # player は操作しているプレイヤー（観戦なら1人目）で、カメラと情報表示はこれを追う
+    def __init__(self, data, slot=0):
+        data = memoryview(data)
+        (self.tick, self.stage, self.status, width, height, map_size, num_enemies,
+         num_bombs, num_players) = NET_FULL.unpack_from(data)
+        self.players = [Player(0, 0) for _ in range(num_players)]
+        self.follow(slot)
+        offset = self.read_players(data, NET_FULL.size)
+        self.game_map = Grid(width, height, zlib.decompress(data[offset:offset + map_size]))
+        offset += map_size
+        self.dirty_cells = set()
+        self.events = []
+
+        self.enemies_by_id = {}
+        size = NET_ENEMY.size * num_enemies
+        for enemy_id, x, y, enemy_type in NET_ENEMY.iter_unpack(data[offset:offset + size]):
+            self.enemies_by_id[enemy_id] = Enemy(x, y, enemy_type)
+        offset += size
+        self.enemies = list(self.enemies_by_id.values())
+        self.occupancy = Occupancy(self.enemies)
+
+        self.bombs_by_id = {}
+        offset = self.read_bombs(data, offset, num_bombs)
+        (num_exploded,) = NET_ID.unpack_from(data, offset)
+        offset = self.read_explosions(data, offset + NET_ID.size, num_exploded)
+        self.sort_bombs()
+
+    def follow(self, slot):
+        # 操作するプレイヤーを切り替える（観戦や範囲外の番号なら1人目）
+        self.player = self.players[slot] if slot < len(self.players) else self.players[0]
+
+    def read_players(self, data, offset):
+        for player in self.players:
+            (player.grid_x, player.grid_y, player.bomb_range, player.max_bombs, player.speed_level, alive,
+             player.score) = NET_PLAYER.unpack_from(data, offset)
+            player.alive = bool(alive)
+            offset += NET_PLAYER.size
+        return offset
+
+    def read_bombs(self, data, offset, count):
+        size = NET_BOMB.size * count
+        for bomb_id, x, y, explosion_range, detonate_tick, owner in NET_BOMB.iter_unpack(data[offset:offset + size]):
+            bomb = Bomb(x, y, explosion_range)
+            bomb.detonate_tick = detonate_tick
+            bomb.owner = self.players[owner]
+            self.bombs_by_id[bomb_id] = bomb
+        return offset + size
+
+    def sort_bombs(self):
+        # 爆弾を置いたプレイヤーごとの一覧に分け直す
+        for player in self.players:
+            player.bombs = []
+        for bomb in self.bombs_by_id.values():
+            bomb.owner.bombs.append(bomb)
+
+    def read_explosions(self, data, offset, count):
+        for _ in range(count):
+            bomb_id, exploded_tick, num_cells = NET_EXPLOSION.unpack_from(data, offset)
+            offset += NET_EXPLOSION.size
+            size = NET_POINT.size * num_cells
+            bomb = self.bombs_by_id[bomb_id]
+            bomb.exploded = True
+            bomb.exploded_tick = exploded_tick
+            bomb.explosions = list(NET_POINT.iter_unpack(data[offset:offset + size]))
+            offset += size
+        return offset
+
+    def apply_delta(self, data):
+        # 差分を適用する。書き換わったマスは dirty_cells に入るので MapLayer がそこだけ描き直す
+        data = memoryview(data)
+        (self.tick, self.status, events, num_cells, num_moved, num_removed, num_added, num_exploded,
+         num_expired) = NET_DELTA.unpack_from(data)
+        offset = self.read_players(data, NET_DELTA.size)
+        self.events = unpack_events(events)
+
+        game_map = self.game_map
+        width = game_map.width
+        size = NET_CELL.size * num_cells
+        for index, tile in NET_CELL.iter_unpack(data[offset:offset + size]):
+            game_map.cells[index] = tile
+            self.dirty_cells.add((index % width, index // width))
+        offset += size
+
+        size = NET_ENEMY_MOVE.size * num_moved
+        for enemy_id, x, y in NET_ENEMY_MOVE.iter_unpack(data[offset:offset + size]):
+            self.enemies_by_id[enemy_id].set_position(x, y)
+        offset += size
+        size = NET_ID.size * num_removed
+        if num_removed:
+            for (enemy_id,) in NET_ID.iter_unpack(data[offset:offset + size]):
+                self.occupancy.remove(self.enemies_by_id.pop(enemy_id))
+            self.enemies = list(self.enemies_by_id.values())
+        offset += size
+
+        offset = self.read_bombs(data, offset, num_added)
+        offset = self.read_explosions(data, offset, num_exploded)
+        size = NET_ID.size * num_expired
+        for (bomb_id,) in NET_ID.iter_unpack(data[offset:offset + size]):
+            del self.bombs_by_id[bomb_id]
+        if num_added or num_expired:
+            self.sort_bombs()
+
+class NetClient:
+    # 描画ループを止めないように、受信はスレッドで行ってメッセージを溜めておく
+    def __init__(self, host, port=DEFAULT_PORT):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.messages = deque()  # (種類, 本体)
+        self.slot = SPECTATOR  # 操作するプレイヤーの番号
+        self.connected = True
+        self.thread = threading.Thread(target=self.receive_loop, daemon=True)
+        self.thread.start()
+
+    def receive_exactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("サーバーとの接続が切れました")
+            data += chunk
+        return data
+
+    def receive_loop(self):
+        try:
+            while True:
+                size, kind = MESSAGE_HEADER.unpack(self.receive_exactly(MESSAGE_HEADER.size))
+                self.messages.append((kind, self.receive_exactly(size)))
+        except OSError:
+            self.connected = False
+
+    def join(self, match_id, stage, width, height):
+        self.sock.sendall(pack_message(MSG_JOIN, NET_JOIN.pack(match_id, stage, width, height)))
+
+    def send_input(self, actions):
+        try:
+            self.sock.sendall(pack_message(MSG_INPUT, NET_INPUT.pack(actions)))
+        except OSError:
+            self.connected = False
+
+    def poll(self, state):
+        # 溜まったメッセージを state に適用し、新しい状態を返す
+        # 全体の状態を受け取ったときは新しい RemoteState を作る（まだ何も受け取っていなければ None のまま）
+        events = []
+        while self.messages:
+            kind, body = self.messages.popleft()
+            if kind == MSG_FULL:
+                state = RemoteState(body, self.slot)
+            elif kind == MSG_DELTA and state is not None:
+                state.apply_delta(body)
+                events.extend(state.events)
+            elif kind == MSG_SLOT:
+                (self.slot,) = NET_SLOT.unpack(body)
+                if state is not None:
+                    state.follow(self.slot)
+        if state is not None:
+            state.events = events
+        return state
+
+    def close(self):
+        self.sock.close()
+
+def split_address(text):
+    # "host:port" または "host" を (host, port) にする
+    host, _, port = text.partition(":")
+    return host or "localhost", int(port) if port else DEFAULT_PORT
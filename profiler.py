@@ -0,0 +1,91 @@
+import json
+import time
+from collections import deque
+
+# フレームの処理時間を区間（フェーズ）ごとに測るプロファイラー（pygameに依存しない）
+# 無効のときは mark() が属性を1つ見て返るだけなので、ほぼ負荷はない
+
+PROFILE_WINDOW = 240  # 統計に使う直近のフレーム数
+TRACE_FRAMES = 600  # トレースに残す直近のフレーム数
+
+class FrameProfiler:
+    def __init__(self, window=PROFILE_WINDOW, trace_frames=TRACE_FRAMES):
+        self.enabled = False
+        self.frames = deque(maxlen=window)  # (フレーム時間, {フェーズ: 時間})
+        self.trace = deque(maxlen=trace_frames)  # (フレーム開始, フレーム時間, [(フェーズ, 開始, 時間)])
+        self.frame_count = 0
+        self.frame_start = None  # 計測中のフレームの開始時刻（計測していなければ None）
+        self.last = None
+        self.spans = []
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.frames.clear()
+        self.trace.clear()
+        self.frame_start = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.frame_start = self.last = time.perf_counter()
+        self.spans = []
+
+    def mark(self, phase):
+        # 直前の mark（またはフレームの開始）からここまでを phase の時間として記録する
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        self.spans.append((phase, self.last, now - self.last))
+        self.last = now
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        self.mark("other")
+        total = self.last - self.frame_start
+        phases = {}
+        for phase, _, duration in self.spans:
+            phases[phase] = phases.get(phase, 0.0) + duration
+        self.frames.append((total, phases))
+        self.trace.append((self.frame_start, total, self.spans))
+        self.frame_count += 1
+        self.frame_start = None
+
+    def stats(self):
+        # 直近のフレームの統計（ミリ秒）。記録がなければ None
+        if not self.frames:
+            return None
+        times = sorted(total for total, _ in self.frames)
+        count = len(times)
+        phases = {}
+        for _, frame in self.frames:
+            for phase, duration in frame.items():
+                phases[phase] = phases.get(phase, 0.0) + duration
+
+        def percentile(p):
+            return times[min(count - 1, int(p * count))] * 1000
+
+        return {
+            "frames": count,
+            "mean": sum(times) / count * 1000,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": times[-1] * 1000,
+            # 1フレームあたりの平均（時間の長い順）
+            "phases": {phase: total / count * 1000
+                       for phase, total in sorted(phases.items(), key=lambda item: -item[1])},
+        }
+
+    def dump_trace(self, path):
+        # 直近のフレームを Chrome のトレース形式（chrome://tracing や Perfetto で開ける）で書き出す
+        events = []
+        for frame_start, total, spans in self.trace:
+            events.append({"name": "frame", "ph": "X", "ts": frame_start * 1e6, "dur": total * 1e6,
+                           "pid": 1, "tid": 1})
+            for phase, start, duration in spans:
+                events.append({"name": phase, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6,
+                               "pid": 1, "tid": 1})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(self.trace)
@@ -0,0 +1,317 @@
+import argparse
+import heapq
+import random
+import socket
+import struct
+import time
+import zlib
+
+from engine import RUNNING, ACTION_NONE, ACTION_BOMB, GameState
+from sim import bot_actions
+
+# 2人対戦のロールバック方式の同期（描画なし）
+# 相手の入力は届くまで「最後に届いた入力が続く」と予測して先に進め、遅れて届いた入力が予測と違ったら
+# そのティックの直前のスナップショットまで戻して、届いた入力で今のティックまで打ち直す
+# 例: python rollback.py --delay 6 --jitter 3 --loss 0.05   （遅延のある回線を模した2つのピアで1試合回して一致を確かめる）
+# 実際に遊ぶときは main.py --peer で UdpTransport を使う
+
+# 自分の入力を何ティック後に使うか（少し遅らせると相手に先に届き、巻き戻しが減る）
+INPUT_DELAY = 2
+
+# 何ティックまで巻き戻せるか（相手の入力がこれより遅れたら届くまで進めずに待つ）
+MAX_ROLLBACK = 8
+
+# 1つのパケットに入れる入力の上限（相手がまだ受け取っていない入力をまとめて送り直す）
+MAX_PACKET_INPUTS = 64
+
+# パケットの頭: 最初の入力のティック、受け取った相手の入力の最後のティック、入力の数（続けて入力を1ティック1バイト）
+INPUT_PACKET = struct.Struct("<IIB")
+
+# 受け取る UDP パケットの上限（入力のパケットはこれより十分小さい）
+MAX_DATAGRAM = 2048
+
+class SimulatedLink:
+    # 片方向の回線をティック単位で模したもの（遅延・揺らぎ・パケットの消失）
+    # 揺らぎがあると追い越しも起きるので、届く順番はばらばらになる
+    def __init__(self, delay=0, jitter=0, loss=0.0, rng=None):
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng or random.Random(0)
+        self.now = 0
+        self.queue = []  # (届くティック, 送った順番, データ)
+        self.count = 0
+        self.bytes_sent = 0
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        if self.rng.random() < self.loss:
+            return
+        arrival = self.now + self.delay + self.rng.randint(0, self.jitter)
+        self.count += 1
+        heapq.heappush(self.queue, (arrival, self.count, data))
+
+    def receive(self):
+        packets = []
+        while self.queue and self.queue[0][0] <= self.now:
+            packets.append(heapq.heappop(self.queue)[2])
+        return packets
+
+class LinkEnd:
+    # ピアから見た回線の片側（送る向きと受け取る向きの組）
+    def __init__(self, outgoing, incoming):
+        self.outgoing = outgoing
+        self.incoming = incoming
+
+    def send(self, data):
+        self.outgoing.send(data)
+
+    def receive(self):
+        return self.incoming.receive()
+
+class UdpTransport:
+    # UDP で相手のピアとやり取りする回線（ブロックしない。消えたパケットはセッションが次のパケットで送り直す）
+    # port で待ち受け、peer（(ホスト, ポート)）とだけやり取りする
+    def __init__(self, port, peer):
+        host, peer_port = peer
+        self.peer = (socket.gethostbyname(host), peer_port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("", port))
+        self.sock.setblocking(False)
+        self.bytes_sent = 0
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        try:
+            self.sock.sendto(data, self.peer)
+        except OSError:
+            # 送れなかったパケットは消えたものとして扱う
+            pass
+
+    def receive(self):
+        packets = []
+        while True:
+            try:
+                data, address = self.sock.recvfrom(MAX_DATAGRAM)
+            except BlockingIOError:
+                break
+            except ConnectionError:
+                # 相手がまだ待ち受けていないときに送ったパケットの拒否が、ここで返ってくることがある
+                continue
+            if address == self.peer:
+                packets.append(data)
+        return packets
+
+    def close(self):
+        self.sock.close()
+
+def link_pair(delay=0, jitter=0, loss=0.0, seed=0):
+    # 2つのピアをつなぐ回線（それぞれの向きは別の乱数列で揺らぐ）
+    forward = SimulatedLink(delay, jitter, loss, random.Random(seed * 2 + 1))
+    backward = SimulatedLink(delay, jitter, loss, random.Random(seed * 2 + 2))
+    return LinkEnd(forward, backward), LinkEnd(backward, forward)
+
+class RollbackSession:
+    # 1つのピアの同期。advance() を毎フレーム呼ぶと、自分の入力を送り、届いた相手の入力を反映して1ティック進める
+    # transport は send(bytes) と receive() -> [bytes] を持つもの（届かないことも順番が入れ替わることもあってよい）
+    def __init__(self, state, local_index, transport, input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK):
+        if len(state.players) != 2:
+            raise ValueError("ロールバックは2人で遊ぶ GameState だけで使えます")
+        self.state = state
+        self.local_index = local_index
+        self.transport = transport
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        start = state.tick
+        # 入力を遅らせる分の最初のティックは、どちらのピアも何もしない入力で確定させておく
+        self.local_inputs = {tick: ACTION_NONE for tick in range(start + 1, start + input_delay + 1)}
+        self.remote_inputs = dict(self.local_inputs)  # 届いた相手の入力
+        self.predicted = {}  # 予測で進めたティック -> 使った相手の入力
+        self.confirmed_tick = start + input_delay  # ここまでの相手の入力がすべて届いている
+        self.remote_ack = start + input_delay  # 相手がここまでの自分の入力を受け取っている
+        self.snapshots = {}  # ティック -> そのティックの終わりの状態（まだ確定していないところだけ持つ）
+        self.rollback_tick = None  # 予測が外れた最初のティック
+        self.frames = 0
+        self.stalls = 0
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.max_depth = 0
+
+    def inputs(self, tick):
+        # そのティックの2人分の入力（相手の分が届いていなければ予測する）
+        remote = self.remote_inputs.get(tick)
+        if remote is None:
+            # 最後に届いた入力が続くと予測する（爆弾は押した瞬間だけなので続けない）
+            remote = self.remote_inputs.get(self.confirmed_tick, ACTION_NONE) & ~ACTION_BOMB
+            self.predicted[tick] = remote
+        local = self.local_inputs[tick]
+        return (local, remote) if self.local_index == 0 else (remote, local)
+
+    def simulate(self):
+        # 1ティック進める（確定していないティックの前の状態は巻き戻せるよう残しておく）
+        state = self.state
+        tick = state.tick + 1
+        if tick > self.confirmed_tick:
+            self.snapshots[state.tick] = state.snapshot()
+        return state.step(*self.inputs(tick))
+
+    def receive(self):
+        for data in self.transport.receive():
+            if len(data) < INPUT_PACKET.size:
+                continue
+            first, ack, count = INPUT_PACKET.unpack_from(data)
+            self.remote_ack = max(self.remote_ack, ack)
+            for tick, actions in enumerate(data[INPUT_PACKET.size:INPUT_PACKET.size + count], first):
+                if tick <= self.confirmed_tick or tick in self.remote_inputs:
+                    continue
+                self.remote_inputs[tick] = actions
+                guess = self.predicted.pop(tick, None)
+                if guess is not None and guess != actions:
+                    if self.rollback_tick is None or tick < self.rollback_tick:
+                        self.rollback_tick = tick
+            # 途切れずに届いたところまでを確定にする
+            while self.confirmed_tick + 1 in self.remote_inputs:
+                self.confirmed_tick += 1
+
+    def rollback(self):
+        # 予測が外れたティックの直前に戻し、今のティックまで打ち直す（打ち直し中のイベントは捨てる）
+        tick = self.rollback_tick
+        self.rollback_tick = None
+        state = self.state
+        current = state.tick
+        state.restore(self.snapshots[tick - 1])
+        for stale in range(tick, current + 1):
+            self.predicted.pop(stale, None)
+        while state.tick < current and state.status == RUNNING:
+            self.simulate()
+        self.rollbacks += 1
+        self.resimulated += current - tick + 1
+        self.max_depth = max(self.max_depth, current - tick + 1)
+
+    def send(self):
+        # 相手がまだ受け取っていない自分の入力をまとめて送る（消えても次のパケットで届く）
+        first = self.remote_ack + 1
+        last = min(max(self.local_inputs, default=self.remote_ack), first + MAX_PACKET_INPUTS - 1)
+        actions = bytes(self.local_inputs[tick] for tick in range(first, last + 1))
+        self.transport.send(INPUT_PACKET.pack(first, self.confirmed_tick, len(actions)) + actions)
+
+    def trim(self):
+        # 確定して進め終わったティックより前のものは、戻ることも送り直すこともないので捨てる
+        confirmed = min(self.confirmed_tick, self.state.tick)
+        for tick in [tick for tick in self.snapshots if tick < confirmed]:
+            del self.snapshots[tick]
+        for tick in [tick for tick in self.predicted if tick <= confirmed]:
+            del self.predicted[tick]
+        oldest = min(confirmed, self.remote_ack)
+        for tick in [tick for tick in self.local_inputs if tick <= oldest]:
+            del self.local_inputs[tick]
+        for tick in [tick for tick in self.remote_inputs if tick < confirmed]:
+            del self.remote_inputs[tick]
+
+    def advance(self, actions=ACTION_NONE):
+        # 1フレーム分の処理。進めたティックのイベントを返す（相手を待って止まったときは None）
+        self.frames += 1
+        self.catch_up()
+        state = self.state
+        events = []
+        if state.status != RUNNING:
+            # 試合が終わっても、相手が確定できるよう入力のやり取りは続ける
+            pass
+        elif self.waiting():
+            # 相手の入力が遅れすぎているので、届くまで進めずに待つ
+            self.stalls += 1
+            events = None
+        else:
+            self.local_inputs[state.tick + 1 + self.input_delay] = actions
+            events = self.simulate()
+        self.flush()
+        return events
+
+    def waiting(self):
+        # 次のティックに進むと巻き戻せる範囲を超える（相手の入力が届くまで待つ）
+        return self.state.tick + 1 - self.confirmed_tick > self.max_rollback
+
+    def poll(self):
+        # 進めずに入力のやり取りだけを行う（止めたところまでを確定させたいとき）
+        self.catch_up()
+        self.flush()
+
+    def catch_up(self):
+        self.receive()
+        if self.rollback_tick is not None:
+            self.rollback()
+
+    def flush(self):
+        self.send()
+        self.trim()
+
+    def settled(self):
+        # 今のティックまでの相手の入力がすべて届き、これ以上巻き戻らない
+        return self.confirmed_tick >= self.state.tick
+
+    def finished(self):
+        # 試合が終わり、そこまでの入力がすべて確定した
+        return self.state.status != RUNNING and self.settled()
+
+    def checksum(self):
+        return zlib.crc32(self.state.snapshot())
+
+def run_match(stage=1, seed=0, delay=6, jitter=3, loss=0.05, input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK,
+              max_ticks=60 * 60 * 3):
+    # 同じシードの2つのピアを遅延のある回線でつなぎ、それぞれ自動操作で1試合回す
+    ends = link_pair(delay, jitter, loss, seed)
+    sessions = [RollbackSession(GameState(stage, seed, num_players=2), index, end, input_delay, max_rollback)
+                for index, end in enumerate(ends)]
+    rngs = [random.Random(seed * 2 + index) for index in range(2)]
+    times = []
+    # max_ticks まで進めたピアは相手の入力を待つだけにして、同じティックで止めてから比べる
+    while not all(session.settled() and (session.state.status != RUNNING or session.state.tick >= max_ticks)
+                  for session in sessions):
+        for session, rng in zip(sessions, rngs):
+            state = session.state
+            start = time.perf_counter()
+            if state.tick >= max_ticks:
+                session.poll()
+            else:
+                session.advance(bot_actions(state, rng, state.players[session.local_index]))
+            times.append(time.perf_counter() - start)
+        for end in ends:
+            end.outgoing.now += 1
+    return sessions, ends, times
+
+def main():
+    parser = argparse.ArgumentParser(description="ロールバック方式の同期を遅延のある回線で試す")
+    parser.add_argument("--stage", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--matches", type=int, default=1, help="シードを1つずつ変えて回す試合数")
+    parser.add_argument("--delay", type=int, default=6, help="片道の遅延（ティック）")
+    parser.add_argument("--jitter", type=int, default=3, help="遅延の揺らぎ（ティック）")
+    parser.add_argument("--loss", type=float, default=0.05, help="パケットが消える確率")
+    parser.add_argument("--input-delay", type=int, default=INPUT_DELAY)
+    parser.add_argument("--max-rollback", type=int, default=MAX_ROLLBACK)
+    args = parser.parse_args()
+
+    mismatches = 0
+    for seed in range(args.seed, args.seed + args.matches):
+        sessions, ends, times = run_match(args.stage, seed, args.delay, args.jitter, args.loss,
+                                          args.input_delay, args.max_rollback)
+        # 両方のピアの最後の状態と、確定した入力だけのリプレイを頭から再生した状態がすべて一致するか
+        replayed = sessions[0].state.replay.play()
+        checksums = [session.checksum() for session in sessions] + [zlib.crc32(replayed.snapshot())]
+        ok = len(set(checksums)) == 1
+        mismatches += not ok
+        times.sort()
+        state = sessions[0].state
+        print(f"シード {seed}: {'一致' if ok else '不一致'}  {state.tick}ティック  "
+              f"スコア {state.players[0].score}/{state.players[1].score}  "
+              f"1フレーム 平均 {sum(times) / len(times) * 1000:.3f}ms 最大 {times[-1] * 1000:.3f}ms  "
+              f"送信 {sum(end.outgoing.bytes_sent for end in ends) / len(sessions) / max(state.tick, 1):.1f}バイト/ティック")
+        for session in sessions:
+            print(f"  ピア{session.local_index + 1}: 巻き戻し {session.rollbacks}回 "
+                  f"(打ち直し {session.resimulated}ティック 最大 {session.max_depth}ティック)  "
+                  f"待ち {session.stalls}フレーム")
+    if mismatches:
+        raise SystemExit(f"{mismatches}試合で状態が一致しませんでした")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import random
+import struct
+import time
+
+from engine import RUNNING, CLEARED, TICK_RATE, ACTION_NONE, ACTION_BOMB, MOVE_ACTIONS, MAX_PLAYERS, GameState
+from net import (
+    DEFAULT_PORT, MESSAGE_HEADER, MAX_MESSAGE_SIZE, MSG_JOIN, MSG_INPUT, MSG_FULL, MSG_DELTA, MSG_SLOT, SPECTATOR,
+    NET_JOIN, NET_INPUT, NET_SLOT, StateEncoder, RemoteState, pack_message,
+)
+
+# 複数の試合をまとめて進める asyncio のサーバー（描画なし）
+# 1つの試合は MAX_PLAYERS 人の GameState で、参加した順に空いているプレイヤーの枠を操作し、枠がなければ観戦する
+# 誰も操作していない枠のプレイヤーは倒された扱いにしておき（操作している人が全員やられたらゲームオーバー）、
+# 試合の途中でも枠を取ったクライアントがいればその場から参加させる
+# マップと敵の配置を作るのは広いマップほど重いので、ティックを止めないようにワーカースレッドで作る
+# 例: python server.py --port 7650
+#     python main.py --connect localhost:7650 --match 1
+#     python server.py --loadtest 48 --seconds 10   （別プロセスのサーバーに頭のないクライアントをつなぐ）
+
+# 何ティックごとに差分を送るか（60ティック/秒なら20回/秒）
+NET_INTERVAL = 3
+
+# 1つのクライアントの送信待ちがこれを超えたら差分を送らずに待ち、空いたら全体の状態を送り直す
+MAX_PENDING_BYTES = 256 * 1024
+
+# 1つのサーバーで進める試合の上限と、1つの試合のマップの大きさの範囲（1ティックの処理量を抑える）
+MAX_MATCHES = 64
+MIN_ARENA = 5
+MAX_ARENA = 256
+# ステージの上限（ブロックはステージ8で埋まり、それより上は敵が増えるだけ）
+MAX_STAGE = 20
+
+# 試合が終わってから次の試合を始めるまでのティック数
+RESTART_TICKS = 3 * TICK_RATE
+
+# 統計を表示する間隔（秒）
+STATS_INTERVAL = 5.0
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.match = None
+        self.slot = SPECTATOR  # 操作しているプレイヤーの番号
+        self.needs_full = True  # 次の送信で全体の状態を送る
+
+    def pending(self):
+        return self.writer.transport.get_write_buffer_size()
+
+    def send(self, message):
+        self.writer.write(message)
+        return len(message)
+
+def build_state(stage, width, height):
+    # 試合の GameState を作る（ワーカースレッドで呼ぶ）
+    return GameState(min(stage, MAX_STAGE), None, None, width, height, MAX_PLAYERS)
+
+class Match:
+    def __init__(self, match_id, state):
+        self.match_id = match_id
+        self.width = state.game_map.width
+        self.height = state.game_map.height
+        self.clients = []
+        self.slots = [None] * MAX_PLAYERS  # プレイヤーの枠ごとの操作しているクライアント
+        self.actions = [ACTION_NONE] * MAX_PLAYERS  # 枠ごとの押し続けている移動
+        self.bomb_pressed = [False] * MAX_PLAYERS  # 枠ごとの次のティックで爆弾を置くか
+        self.next_state = None  # 作っている次の試合の GameState（Future）
+        self.start(state)
+
+    def start(self, state):
+        self.state = state
+        self.encoder = StateEncoder(self.state)
+        self.changed_cells = set()  # 前回送ってから書き換わったマス
+        self.events = []
+        self.finished_ticks = 0  # 試合が終わってからのティック数
+        self.absent = set()  # 誰も操作していないので外してあるプレイヤーの番号
+        for slot, client in enumerate(self.slots):
+            if client is None:
+                self.leave_slot(slot)
+        for client in self.clients:
+            client.needs_full = True
+
+    def leave_slot(self, slot):
+        # 操作する人のいなくなったプレイヤーを外す（すでにやられていればそのまま）
+        player = self.state.players[slot]
+        if player.alive:
+            player.alive = False
+            self.absent.add(slot)
+
+    def add(self, client):
+        # 空いている枠があれば操作させ、なければ観戦させる
+        self.clients.append(client)
+        if None in self.slots:
+            self.assign(client, self.slots.index(None))
+        else:
+            client.send(pack_message(MSG_SLOT, NET_SLOT.pack(SPECTATOR)))
+
+    def remove(self, client):
+        self.clients.remove(client)
+        slot = client.slot
+        if slot == SPECTATOR:
+            return
+        # 抜けた枠の入力を離し、観戦しているクライアントがいれば最初の人に引き継ぐ
+        self.slots[slot] = None
+        self.actions[slot] = ACTION_NONE
+        self.bomb_pressed[slot] = False
+        for other in self.clients:
+            if other.slot == SPECTATOR:
+                self.assign(other, slot)
+                break
+        else:
+            self.leave_slot(slot)
+
+    def assign(self, client, slot):
+        self.slots[slot] = client
+        client.slot = slot
+        if slot in self.absent and self.state.status == RUNNING:
+            # 外してあったプレイヤーは、その場から参加する
+            self.absent.discard(slot)
+            self.state.players[slot].alive = True
+        client.send(pack_message(MSG_SLOT, NET_SLOT.pack(slot)))
+
+    def set_input(self, client, actions):
+        # 枠を持っているクライアントの入力だけを使う（爆弾は押した回数だけ置けるよう次のティックまで覚えておく）
+        slot = client.slot
+        if slot == SPECTATOR:
+            return
+        self.actions[slot] = actions & ~ACTION_BOMB
+        if actions & ACTION_BOMB:
+            self.bomb_pressed[slot] = True
+
+    def step(self):
+        state = self.state
+        if state.status != RUNNING:
+            # 少し待ってから次の試合（クリアなら次のステージ）をワーカースレッドで作り、できたら始める
+            self.finished_ticks += 1
+            if self.finished_ticks == RESTART_TICKS:
+                stage = state.stage + 1 if state.status == CLEARED else state.stage
+                loop = asyncio.get_running_loop()
+                self.next_state = loop.run_in_executor(None, build_state, stage, self.width, self.height)
+            elif self.next_state is not None and self.next_state.done():
+                self.start(self.next_state.result())
+                self.next_state = None
+            return
+        actions = list(self.actions)
+        for slot, pressed in enumerate(self.bomb_pressed):
+            if pressed:
+                actions[slot] |= ACTION_BOMB
+                self.bomb_pressed[slot] = False
+        self.events.extend(state.step(*actions))
+        # サーバーは描画しないので、書き換わったマスはここで引き取る
+        self.changed_cells |= state.dirty_cells
+        state.dirty_cells.clear()
+
+    def broadcast(self):
+        # 差分は1回だけ作り、送信が詰まっていないクライアント全員に同じバイト列を送る
+        # 全体の状態も同じ差分の時点のものを送るので、受け取ったクライアントは次から差分で続けられる
+        sent = 0
+        full = None
+        delta = self.encoder.delta(self.changed_cells, self.events)
+        self.changed_cells.clear()
+        self.events = []
+        for client in self.clients:
+            if client.pending() > MAX_PENDING_BYTES:
+                # 差分を飛ばすと以降の差分が合わなくなるので、送信が空くまで待って全体を送り直す
+                client.needs_full = True
+            elif client.needs_full:
+                if full is None:
+                    full = self.encoder.full()
+                sent += client.send(full)
+                client.needs_full = False
+            else:
+                sent += client.send(delta)
+        return sent
+
+class Server:
+    def __init__(self):
+        self.matches = {}
+        self.building = {}  # 作っている試合の番号 -> GameState の Future
+        self.connections = set()
+        self.bytes_sent = 0
+        self.tick_time = 0.0
+        self.ticks = 0
+
+    async def handle_client(self, reader, writer):
+        connection = Connection(reader, writer)
+        self.connections.add(connection)
+        try:
+            while True:
+                size, kind = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+                if size > MAX_MESSAGE_SIZE:
+                    break
+                body = await reader.readexactly(size)
+                if kind == MSG_JOIN and connection.match is None:
+                    if not await self.join(connection, *NET_JOIN.unpack(body)):
+                        break
+                elif kind == MSG_INPUT and connection.match is not None:
+                    connection.match.set_input(connection, NET_INPUT.unpack(body)[0])
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error):
+            # 切れた接続と、長さの合わない壊れたメッセージ
+            pass
+        finally:
+            self.leave(connection)
+            writer.close()
+
+    async def join(self, connection, match_id, stage, width, height):
+        match = self.matches.get(match_id)
+        if match is None:
+            # 同じ試合に同時に参加したクライアントは、最初の1人が頼んだ GameState ができるのを一緒に待つ
+            building = self.building.get(match_id)
+            if building is None:
+                if len(self.matches) + len(self.building) >= MAX_MATCHES:
+                    return False
+                stage = min(max(stage, 1), MAX_STAGE)
+                width = min(max(width, MIN_ARENA), MAX_ARENA)
+                height = min(max(height, MIN_ARENA), MAX_ARENA)
+                loop = asyncio.get_running_loop()
+                building = self.building[match_id] = loop.run_in_executor(None, build_state, stage, width, height)
+            state = await building
+            self.building.pop(match_id, None)
+            match = self.matches.get(match_id)
+            if match is None:
+                match = self.matches[match_id] = Match(match_id, state)
+        connection.match = match
+        match.add(connection)
+        return True
+
+    def leave(self, connection):
+        self.connections.discard(connection)
+        match = connection.match
+        if match is None:
+            return
+        match.remove(connection)
+        if not match.clients:
+            del self.matches[match.match_id]
+
+    def close_match(self, match):
+        # 試合を捨てて参加しているクライアントを切る
+        del self.matches[match.match_id]
+        for client in match.clients:
+            client.match = None
+            client.writer.close()
+
+    async def run(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"{host}:{port} で待ち受けています")
+        async with server:
+            await self.tick_loop()
+
+    async def tick_loop(self):
+        # 固定ティックで全試合を進める（遅れたときは追いつこうとせずに時刻を合わせ直す）
+        loop = asyncio.get_running_loop()
+        tick_time = 1 / TICK_RATE
+        next_tick = loop.time()
+        next_stats = loop.time() + STATS_INTERVAL
+        tick = 0
+        while True:
+            start = time.perf_counter()
+            tick += 1
+            for match in list(self.matches.values()):
+                try:
+                    match.step()
+                except Exception as error:
+                    # 1つの試合の失敗（次の試合を作れなかったなど）でほかの試合を止めない
+                    print(f"試合 {match.match_id} でエラーが起きたので終了します: {error!r}")
+                    self.close_match(match)
+                    continue
+                if tick % NET_INTERVAL == 0:
+                    self.bytes_sent += match.broadcast()
+            self.tick_time += time.perf_counter() - start
+            self.ticks += 1
+
+            now = loop.time()
+            if now >= next_stats:
+                self.print_stats(now - next_stats + STATS_INTERVAL)
+                next_stats = now + STATS_INTERVAL
+            next_tick += tick_time
+            if next_tick < now:
+                next_tick = now
+            await asyncio.sleep(next_tick - now)
+
+    def print_stats(self, elapsed):
+        if self.ticks:
+            print(f"試合 {len(self.matches)}  接続 {len(self.connections)}  "
+                  f"1ティック平均 {self.tick_time / self.ticks * 1000:.2f}ms  "
+                  f"送信 {self.bytes_sent / elapsed / 1024:.1f}KB/秒")
+        self.bytes_sent = 0
+        self.tick_time = 0.0
+        self.ticks = 0
+
+async def bot_client(host, port, match_id, stage, seconds, totals):
+    # 負荷試験用のクライアント: 状態を受け取って写しに適用し、ときどきランダムに操作を送る
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(pack_message(MSG_JOIN, NET_JOIN.pack(match_id, stage, *totals["arena"])))
+    rng = random.Random(match_id)
+    state = None
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            header = await asyncio.wait_for(reader.readexactly(MESSAGE_HEADER.size), deadline - time.perf_counter())
+        except asyncio.TimeoutError:
+            break
+        size, kind = MESSAGE_HEADER.unpack(header)
+        body = await reader.readexactly(size)
+        totals["bytes"] += MESSAGE_HEADER.size + size
+        totals["messages"] += 1
+        if kind == MSG_FULL:
+            state = RemoteState(body)
+            totals["full"] += 1
+        elif kind == MSG_DELTA and state is not None:
+            state.apply_delta(body)
+        if rng.random() < 0.2:
+            actions = rng.choice(MOVE_ACTIONS)[0] | (ACTION_BOMB if rng.random() < 0.1 else 0)
+            writer.write(pack_message(MSG_INPUT, NET_INPUT.pack(actions)))
+    writer.close()
+
+async def load_test(host, port, clients, stage, seconds, arena):
+    # clients 個のクライアントをそれぞれ別の試合につなぎ、受け取った量を集計する
+    totals = {"bytes": 0, "messages": 0, "full": 0, "arena": arena}
+    await asyncio.gather(*(bot_client(host, port, i + 1, stage, seconds, totals) for i in range(clients)))
+    print(f"{clients}クライアント {seconds}秒: 受信 {totals['bytes'] / seconds / 1024:.1f}KB/秒 "
+          f"(1クライアントあたり {totals['bytes'] / seconds / clients / 1024:.2f}KB/秒)  "
+          f"メッセージ {totals['messages']}  全体の状態 {totals['full']}")
+
+def parse_arena(text):
+    width, height = (int(value) for value in text.lower().split("x"))
+    return width, height
+
+def main():
+    parser = argparse.ArgumentParser(description="ボンバーマンのサーバー")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--loadtest", type=int, metavar="N", help="サーバーを立てずに N 個のクライアントで負荷をかける")
+    parser.add_argument("--seconds", type=float, default=10.0, help="負荷試験の長さ（秒）")
+    parser.add_argument("--stage", type=int, default=1, help="負荷試験で作る試合のステージ")
+    parser.add_argument("--arena", type=parse_arena, default=(20, 15), help="負荷試験で作る試合のマップの大きさ")
+    args = parser.parse_args()
+    try:
+        if args.loadtest:
+            asyncio.run(load_test(args.host, args.port, args.loadtest, args.stage, args.seconds, args.arena))
+        else:
+            asyncio.run(Server().run(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
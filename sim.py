@@ -0,0 +1,175 @@
+import argparse
+import os
+import random
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import engine
+from engine import (
+    EMPTY, ITEMS, BLOCK, RUNNING, DEAD, CLEARED, ACTION_NONE, ACTION_BOMB, MOVE_ACTIONS,
+    ENEMY_SLIME, ENEMY_CHASER, ENEMY_SMART, GameState, blast_cells,
+)
+
+# 描画なしで大量のゲームを複数プロセスで回し、結果を集計するランナー
+# 例: python sim.py --stage 3 --games 2000 --enemies slime,slime,chaser --density 0.25
+
+# 1ゲームの上限ティック数（これを超えたら打ち切り）
+MAX_TICKS = 60 * 60 * 3
+
+# 1回のタスクで1つのプロセスに渡すゲーム数
+GAMES_PER_TASK = 50
+
+# 方向 -> 移動の行動フラグ
+MOVE_FLAGS = {direction: flag for flag, direction in MOVE_ACTIONS}
+
+ENEMY_NAMES = {"slime": ENEMY_SLIME, "chaser": ENEMY_CHASER, "smart": ENEMY_SMART}
+
+# 逃げ道を探す最大の歩数
+ESCAPE_DEPTH = 6
+
+def walkable(game_map, x, y):
+    tile = game_map.tile(x, y)
+    return tile == EMPTY or tile in ITEMS
+
+def escape_step(state, x, y, unsafe):
+    # (x, y) から unsafe に含まれず危険マップにもないマスへの最短経路の最初の1歩（なければ None）
+    game_map = state.game_map
+    danger = state.danger
+    occupancy = state.occupancy
+    queue = deque([(x, y, None, 0)])
+    seen = {(x, y)}
+    while queue:
+        cx, cy, first, depth = queue.popleft()
+        if first is not None and (cx, cy) not in unsafe and not danger.is_dangerous(cx, cy):
+            return first
+        if depth >= ESCAPE_DEPTH:
+            continue
+        for dx, dy in engine.DIRECTIONS:
+            nx, ny = cx + dx, cy + dy
+            if (nx, ny) in seen or not walkable(game_map, nx, ny) or occupancy.at(nx, ny):
+                continue
+            seen.add((nx, ny))
+            queue.append((nx, ny, first or (dx, dy), depth + 1))
+    return None
+
+def bot_actions(state, rng, player=None):
+    # 簡単な自動操作：危険なら逃げ、ブロックか敵を爆風に入れられて逃げ道があれば爆弾を置き、それ以外は歩き回る
+    # player を渡すとそのプレイヤーを操作する（省略時は1人目）
+    if player is None:
+        player = state.player
+    if not player.can_move(state.tick + 1):
+        return ACTION_NONE
+    x, y = player.grid_x, player.grid_y
+    game_map = state.game_map
+
+    if state.danger.is_dangerous(x, y):
+        step = escape_step(state, x, y, ())
+        return MOVE_FLAGS[step] if step else ACTION_NONE
+
+    if len(player.bombs) < player.max_bombs:
+        blast = blast_cells(game_map, x, y, player.bomb_range)
+        target = any(game_map[cy][cx] == BLOCK or state.occupancy.at(cx, cy) for cx, cy in blast)
+        if target:
+            step = escape_step(state, x, y, set(blast))
+            if step:
+                return ACTION_BOMB | MOVE_FLAGS[step]
+
+    moves = [(dx, dy) for dx, dy in engine.DIRECTIONS
+             if walkable(game_map, x + dx, y + dy) and not state.danger.is_dangerous(x + dx, y + dy)
+             and not state.occupancy.at(x + dx, y + dy)]
+    return MOVE_FLAGS[rng.choice(moves)] if moves else ACTION_NONE
+
+def apply_tuning(tuning):
+    # 調整したい値で engine のパラメータを上書きする（ワーカープロセスの中だけで効く）
+    if tuning.get("density") is not None:
+        engine.BLOCK_DENSITY_BASE = tuning["density"]
+        engine.BLOCK_DENSITY_STEP = 0.0
+    for enemy_type, delay in tuning.get("move_delays", {}).items():
+        engine.ENEMY_MOVE_DELAYS[enemy_type] = delay
+
+def run_games(task):
+    # ワーカーで実行する1タスク分（同じ設定で複数のシードを回す）
+    stage, seeds, enemy_types, tuning, max_ticks = task
+    apply_tuning(tuning)
+    results = []
+    for seed in seeds:
+        state = GameState(stage, seed, enemy_types)
+        rng = random.Random(seed)
+        while state.status == RUNNING and state.tick < max_ticks:
+            state.step(bot_actions(state, rng))
+        results.append((state.status, state.tick, state.player.score))
+    return results
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    def pick(p):
+        return values[min(len(values) - 1, int(p * len(values)))]
+    return {"min": values[0], "p10": pick(0.1), "p50": pick(0.5), "p90": pick(0.9), "max": values[-1],
+            "mean": statistics.fmean(values)}
+
+def summarize(results):
+    total = len(results)
+    cleared = [ticks for status, ticks, _ in results if status == CLEARED]
+    deaths = [ticks for status, ticks, _ in results if status == DEAD]
+    return {
+        "games": total,
+        "clear_rate": len(cleared) / total if total else 0.0,
+        "death_rate": len(deaths) / total if total else 0.0,
+        "timeout_rate": (total - len(cleared) - len(deaths)) / total if total else 0.0,
+        "time_to_clear": percentiles(cleared),
+        "time_to_death": percentiles(deaths),
+        "score": percentiles([score for _, _, score in results]),
+    }
+
+def run_simulation(stage=1, games=1000, seed=0, enemy_types=None, tuning=None, workers=None,
+                   max_ticks=MAX_TICKS):
+    # シード seed から games 個のゲームをプロセスに分けて回し、集計結果を返す
+    seeds = list(range(seed, seed + games))
+    tasks = [(stage, seeds[i:i + GAMES_PER_TASK], enemy_types, tuning or {}, max_ticks)
+             for i in range(0, games, GAMES_PER_TASK)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(run_games, tasks):
+            results.extend(chunk)
+    return summarize(results)
+
+def parse_enemies(text):
+    return [ENEMY_NAMES[name.strip()] for name in text.split(",") if name.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="ボンバーマンの一括シミュレーション")
+    parser.add_argument("--stage", type=int, default=1)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    parser.add_argument("--enemies", type=parse_enemies, default=None,
+                        help="敵の並び（例: slime,chaser,smart）")
+    parser.add_argument("--density", type=float, default=None, help="ブロックの配置密度（ステージによらず固定）")
+    for name in ENEMY_NAMES:
+        parser.add_argument(f"--{name}-delay", type=int, default=None, help=f"{name} の移動間隔（ティック）")
+    args = parser.parse_args()
+
+    move_delays = {enemy_type: getattr(args, f"{name}_delay") for name, enemy_type in ENEMY_NAMES.items()
+                   if getattr(args, f"{name}_delay") is not None}
+    tuning = {"density": args.density, "move_delays": move_delays}
+
+    start = time.perf_counter()
+    summary = run_simulation(args.stage, args.games, args.seed, args.enemies, tuning, args.workers,
+                             args.max_ticks)
+    elapsed = time.perf_counter() - start
+
+    print(f"ステージ {args.stage}: {summary['games']}ゲーム ({elapsed:.1f}秒, {args.workers}プロセス)")
+    print(f"  クリア率 {summary['clear_rate']:.1%}  死亡率 {summary['death_rate']:.1%}  "
+          f"打ち切り {summary['timeout_rate']:.1%}")
+    for key, label in (("time_to_clear", "クリアまで"), ("time_to_death", "死亡まで"), ("score", "スコア")):
+        dist = summary[key]
+        if dist:
+            print(f"  {label}: " + "  ".join(f"{name} {value:.0f}" for name, value in dist.items()))
+
+if __name__ == "__main__":
+    main()
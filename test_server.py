@@ -0,0 +1,66 @@
+from engine import RUNNING, DEAD, ACTION_NONE, MAX_PLAYERS, GameState
+from net import SPECTATOR
+from server import Match
+
+# server.Match の枠の割り当てとゲームオーバーの判定（ソケットなしで試す）
+
+class FakeClient:
+    def __init__(self):
+        self.slot = SPECTATOR
+        self.needs_full = True
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+        return len(message)
+
+def new_match(seed=0):
+    return Match(1, GameState(1, seed, None, 20, 15, MAX_PLAYERS))
+
+def test_solo_client_dying_ends_two_slot_match():
+    for seed in range(5):
+        match = new_match(seed)
+        match.add(FakeClient())
+        state = match.state
+        assert [player.alive for player in state.players] == [True, False]
+        for _ in range(180):
+            match.step()
+            if state.status != RUNNING:
+                break
+        state.players[0].alive = False
+        match.step()
+        assert state.status == DEAD
+
+def test_second_client_joins_in_place():
+    match = new_match()
+    match.add(FakeClient())
+    for _ in range(30):
+        match.set_input(match.slots[0], ACTION_NONE)
+        match.step()
+    second = FakeClient()
+    match.add(second)
+    assert second.slot == 1
+    assert match.state.players[1].alive
+
+def test_leaving_without_spectator_removes_player():
+    match = new_match()
+    first = FakeClient()
+    second = FakeClient()
+    match.add(first)
+    match.add(second)
+    match.remove(second)
+    assert not match.state.players[1].alive
+    # 残った1人がやられたらゲームオーバー
+    match.state.players[0].alive = False
+    match.step()
+    assert match.state.status == DEAD
+
+def test_spectator_takes_over_slot():
+    match = new_match()
+    clients = [FakeClient() for _ in range(3)]
+    for client in clients:
+        match.add(client)
+    assert [client.slot for client in clients] == [0, 1, SPECTATOR]
+    match.remove(clients[1])
+    assert clients[2].slot == 1
+    assert match.state.players[1].alive